@@ -0,0 +1,104 @@
+"""
+Benchmark of the task list serialization path.
+
+Compares the original GroupTaskCollection.get path (ORM objects, a hand
+built dict and .isoformat() per task, stdlib json) with the projection
+rows, row encoders and fast JSON backend in task_manager.serializers.
+
+Run from the project root:
+    python benchmarks/serialization_bench.py [number_of_tasks]
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from task_manager import create_app, db
+from task_manager.models import Group, Task
+from task_manager.serializers import dumps, encode_rows, orjson
+from task_manager.utils import fetch_rows
+
+ROUNDS = 20
+
+
+def populate(count):
+    "Create one group with the given number of tasks"
+    group = Group(name="Benchmark", unique_group="benchmark-group")
+    db.session.add(group)
+    db.session.flush()
+    now = datetime.now()
+    db.session.add_all(Task(
+        unique_task=f"benchmark-task-{i}",
+        title=f"Task {i}",
+        description="Lorem ipsum dolor sit amet " * 20,
+        status=i % 2,
+        deadline=now + timedelta(days=i % 30),
+        created_at=now,
+        updated_at=now,
+        group_id=group.id
+    ) for i in range(count))
+    db.session.commit()
+    return group.id
+
+
+# Columns of the legacy serialization, the projection reads the same ones
+LEGACY_COLUMNS = ("id", "unique_task", "title", "description", "status", "deadline",
+                  "created_at", "updated_at", "group_id")
+
+
+def legacy_path(group_id):
+    "The serialization path used before the serializers module"
+    db.session.expunge_all()
+    tasks = Task.query.filter_by(group_id=group_id).all()
+    return json.dumps([{
+        "id": task.id,
+        "unique_task": task.unique_task,
+        "title": task.title,
+        "description": task.description,
+        "status": task.status,
+        "deadline": task.deadline.isoformat(),
+        "created_at": task.created_at.isoformat(),
+        "updated_at": task.updated_at.isoformat(),
+        "group_id": task.group_id
+    } for task in tasks])
+
+
+def projection_path(group_id):
+    "Projection rows, row encoder and the fast JSON backend"
+    rows = fetch_rows(Task, LEGACY_COLUMNS, Task.group_id == group_id)
+    return dumps(encode_rows(rows, LEGACY_COLUMNS))
+
+
+def main():
+    "Run the benchmark and print the results"
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db_fd, db_fname = tempfile.mkstemp()
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname, "TESTING": True})
+    try:
+        with app.app_context():
+            db.create_all()
+            group_id = populate(count)
+            assert json.loads(legacy_path(group_id)) == json.loads(projection_path(group_id))
+
+            print(f"{count} tasks, best of {ROUNDS} rounds, JSON backend: "
+                  f"{'orjson' if orjson else 'json'}")
+            results = {}
+            for name, func in (("legacy", legacy_path), ("projection", projection_path)):
+                results[name] = min(timeit.repeat(lambda f=func: f(group_id),
+                                                  number=1, repeat=ROUNDS))
+                print(f"{name:>10}: {results[name] * 1000:8.2f} ms")
+            print(f"   speedup: {results['legacy'] / results['projection']:8.2f}x")
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_fname)
+
+
+if __name__ == "__main__":
+    main()
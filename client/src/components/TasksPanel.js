@@ -23,7 +23,10 @@ function TasksPanel({ groupId }) {
     const [isEditing, setIsEditing] = useState(false); // Track if the task is being edited
 
     useEffect(() => {
-        if (groupId) {
+        if (!groupId) {
+            return undefined;
+        }
+        const loadTasks = () => {
             API.get(`/groups/${groupId}/tasks/`)
                 .then((response) => {
                     const tasks = response.data || [];
@@ -37,7 +40,14 @@ function TasksPanel({ groupId }) {
                     setPendingCount(pending);
                 })
                 .catch((error) => console.error("Error fetching tasks:", error));
-        }
+        };
+        loadTasks();
+
+        // Reload when the server pushes a task change instead of polling
+        const events = new EventSource(`${API.defaults.baseURL}/groups/${groupId}/events`);
+        events.addEventListener("task", loadTasks);
+        events.addEventListener("resync", loadTasks);
+        return () => events.close();
     }, [groupId]);
 
     /**
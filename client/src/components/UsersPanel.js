@@ -10,6 +10,8 @@ import PropTypes from "prop-types"; // Import PropTypes
 import API from "../api";
 import "./UsersPanel.css"; // Add CSS for styling
 
+const USER_SEARCH_DELAY = 200; // Milliseconds to wait for typing to pause before searching
+
 /**
  * UsersPanel component for managing users in a group.
  */
@@ -21,6 +23,7 @@ function UsersPanel({ groupId }) {
     const [newUserEmail, setNewUserEmail] = useState("");
     const [newUserPassword, setNewUserPassword] = useState("");
     const [selectedUserId, setSelectedUserId] = useState("");
+    const [userQuery, setUserQuery] = useState(""); // Text typed to find a user to assign
     const [selectedRole, setSelectedRole] = useState("member"); // Default role is "member"
 
     useEffect(() => {
@@ -33,16 +36,37 @@ function UsersPanel({ groupId }) {
                 })
                 .catch((error) => console.error("Error fetching users in group:", error));
         }
-
-        // Fetch all users for the dropdown
-        API.get("/users/")
-            .then((response) => {
-                console.log("Fetched all users:", response.data); // Debug log
-                setAllUsers(response.data || []);
-            })
-            .catch((error) => console.error("Error fetching all users:", error));
     }, [groupId]);
 
+    useEffect(() => {
+        // Fetch only the users matching the typed prefix for the dropdown,
+        // once typing pauses. The request of an older query is aborted, so its
+        // response can never replace the results of the current one.
+        const prefix = userQuery.trim();
+        if (!prefix) {
+            setAllUsers([]);
+            return undefined;
+        }
+        const controller = new AbortController();
+        const timer = setTimeout(() => {
+            API.get("/users/", { params: { prefix }, signal: controller.signal })
+                .then((response) => {
+                    if (!controller.signal.aborted) {
+                        setAllUsers(response.data || []);
+                    }
+                })
+                .catch((error) => {
+                    if (!controller.signal.aborted) {
+                        console.error("Error searching users:", error);
+                    }
+                });
+        }, USER_SEARCH_DELAY);
+        return () => {
+            clearTimeout(timer);
+            controller.abort();
+        };
+    }, [userQuery]);
+
     /**
      * Handles the creation of a new user.
      * Validates the input fields and sends a POST request to create the user.
@@ -218,6 +242,12 @@ function UsersPanel({ groupId }) {
 
             <div className="assign-user">
                 <h3>Assign User to Group</h3>
+                <input
+                    type="text"
+                    placeholder="Search by name or email"
+                    value={userQuery}
+                    onChange={(e) => setUserQuery(e.target.value)}
+                />
                 <select
                     value={selectedUserId}
                     onChange={(e) => setSelectedUserId(e.target.value)}
@@ -225,7 +255,7 @@ function UsersPanel({ groupId }) {
                     <option value="">Select User</option>
                     {allUsers.map((user) => (
                         <option key={user.unique_user} value={user.unique_user}>
-                            {user.name}
+                            {user.name} ({user.email})
                         </option>
                     ))}
                 </select>
@@ -4,6 +4,7 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
 from flask_cors import CORS  # Import CORS
+from .compression import Compress
 
 # from Lovelace ->
 # https://lovelace.oulu.fi/ohjelmoitava-web/ohjelmoitava-web/flask-api-project-layout/
@@ -13,6 +14,7 @@ from flask_cors import CORS  # Import CORS
 
 db = SQLAlchemy()
 cache = Cache()
+compress = Compress()
 
 # Based on http://flask.pocoo.org/docs/1.0/tutorial/factory/#the-application-factory
 # Modified to use Flask SQLAlchemy
@@ -40,6 +42,7 @@ def create_app(test_config=None):
 
     db.init_app(app)
     cache.init_app(app)
+    compress.init_app(app)
 
     # Enable CORS for all routes
     CORS(app)
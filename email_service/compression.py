@@ -0,0 +1,82 @@
+"""Response compression for the email service.
+
+Responses above a size threshold are compressed with brotli (when the
+brotli package is installed and the client accepts it) or gzip. Bodies are
+compressed as they go out and nothing is written to the application cache,
+which stays free for the data the views cache themselves.
+"""
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    "application/json",
+    "text/html",
+    "text/plain",
+)
+
+
+class Compress:
+    """Flask extension compressing responses in an after_request hook
+
+    Settings (all optional):
+    COMPRESS_MIN_SIZE: smallest body in bytes that is compressed
+    COMPRESS_LEVEL: gzip compression level, 1-9
+    COMPRESS_BR_LEVEL: brotli quality, 0-11
+    COMPRESS_MIMETYPES: response mimetypes that are compressed
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        " Register the defaults and the after_request hook"
+        app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+        app.config.setdefault("COMPRESS_LEVEL", 6)
+        app.config.setdefault("COMPRESS_BR_LEVEL", 4)
+        app.config.setdefault("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES)
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def choose_encoding():
+        " Pick the best encoding the client accepts, or None"
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            return "br"
+        if accepted["gzip"]:
+            return "gzip"
+        return None
+
+    @staticmethod
+    def compress(data, encoding, config):
+        " Compress the data with the given encoding"
+        if encoding == "br":
+            return brotli.compress(data, quality=config["COMPRESS_BR_LEVEL"])
+        return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL"], mtime=0)
+
+    def after_request(self, response):
+        " Compress the response if it is large enough and the client accepts it"
+        config = current_app.config
+
+        if (response.direct_passthrough
+                or response.is_streamed
+                or not 200 <= response.status_code < 300
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in config["COMPRESS_MIMETYPES"]):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        response.set_data(self.compress(data, encoding, config))
+        response.headers["Content-Encoding"] = encoding
+        return response
@@ -4,6 +4,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
 from flask_cors import CORS  # Import CORS
+from .compression import Compress
+from .negative_cache import NegativeCache
 
 # from Lovelace ->
 # https://lovelace.oulu.fi/ohjelmoitava-web/ohjelmoitava-web/flask-api-project-layout/
@@ -13,6 +15,8 @@ from flask_cors import CORS  # Import CORS
 
 db = SQLAlchemy()
 cache = Cache()
+compress = Compress()
+negative_cache = NegativeCache()
 
 # Based on http://flask.pocoo.org/docs/1.0/tutorial/factory/#the-application-factory
 # Modified to use Flask SQLAlchemy
@@ -38,15 +42,30 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    from .serializers import ApiRequest
+    # Accept MessagePack and CBOR request bodies next to JSON
+    app.request_class = ApiRequest
+
     db.init_app(app)
     cache.init_app(app)
+    compress.init_app(app)
+    # Ids known to exist, so lookups of unknown ones skip the database
+    negative_cache.init_app(app)
 
     # Enable CORS for all routes and allow requests from http://localhost:3000
     CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
 
     from . import models
     from . import api
+    from . import changes
+    from . import ordering
+    from . import archive
     app.cli.add_command(models.init_db_command)
+    app.cli.add_command(models.rebuild_search_index_command)
+    app.cli.add_command(models.rebuild_group_stats_command)
+    app.cli.add_command(changes.compact_change_log_command)
+    app.cli.add_command(ordering.rebalance_task_positions_command)
+    app.cli.add_command(archive.archive_tasks_command)
     app.register_blueprint(api.api_bp)
 
     return app
@@ -2,20 +2,63 @@
 from flask import Blueprint
 from flask_restful import Api
 
-from task_manager.resources.task import GroupTaskCollection, GroupTaskItem
-from task_manager.resources.user import UserCollection, UserItem
-from task_manager.resources.group import GroupItem, GroupCollection, UserToGroup, GroupUsers
+from task_manager.resources.task import (GroupTaskCollection, GroupTaskItem, GroupTaskMove,
+                                         GroupTaskOccurrences, GroupTaskSearch,
+                                         GroupTaskTimeline, TaskSearch)
+from task_manager.resources.user import UserCollection, UserItem, UserTasks, UserWorkload
+from task_manager.resources.assignee import GroupTaskAssignee, GroupTaskAssignees
+from task_manager.resources.batch import Batch
+from task_manager.resources.change import ChangeFeed
+from task_manager.resources.event import GroupEvents
+from task_manager.resources.label import GroupLabelCollection
+from task_manager.resources.history import GroupTaskHistory, GroupTaskRevision
+from task_manager.resources.dependency import (GroupTaskBlocker, GroupTaskBlockers,
+                                               GroupTaskSubtasks)
+from task_manager.resources.group import (GroupItem, GroupCollection, GroupStatsItem,
+                                          UserToGroup, GroupUsers)
+from task_manager.serializers import (CBOR, MSGPACK, cbor2, msgpack,
+                                      output_cbor, output_json, output_msgpack)
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 api = Api(api_bp)
+api.representation("application/json")(output_json)
+# Binary formats for machine to machine clients, negotiated with the Accept header
+if msgpack is not None:
+    api.representation(MSGPACK)(output_msgpack)
+    api.representation("application/x-msgpack")(output_msgpack)
+if cbor2 is not None:
+    api.representation(CBOR)(output_cbor)
 
 
 # copilot helped a little to generate proper paths for the resources
 api.add_resource(UserCollection, "/users/")
 api.add_resource(UserItem, "/users/<string:unique_user>/")
+api.add_resource(UserTasks, "/users/<string:unique_user>/tasks/")
+api.add_resource(UserWorkload, "/users/<string:unique_user>/workload/")
 api.add_resource(GroupCollection, "/groups/")
 api.add_resource(GroupItem, "/groups/<int:group_id>/")
+api.add_resource(GroupStatsItem, "/groups/<int:group_id>/stats/")
+api.add_resource(GroupEvents, "/groups/<int:group_id>/events")
+api.add_resource(GroupLabelCollection, "/groups/<int:group_id>/labels/")
 api.add_resource(GroupTaskCollection, "/groups/<int:group_id>/tasks/")
 api.add_resource(GroupTaskItem, "/groups/<int:group_id>/tasks/<string:unique_task>/")
+api.add_resource(GroupTaskMove, "/groups/<int:group_id>/tasks/<string:unique_task>/move")
+api.add_resource(GroupTaskSubtasks, "/groups/<int:group_id>/tasks/<string:unique_task>/subtasks/")
+api.add_resource(GroupTaskBlockers, "/groups/<int:group_id>/tasks/<string:unique_task>/blockers/")
+api.add_resource(GroupTaskBlocker,
+                 "/groups/<int:group_id>/tasks/<string:unique_task>/blockers/<string:blocker>/")
+api.add_resource(GroupTaskHistory, "/groups/<int:group_id>/tasks/<string:unique_task>/history")
+api.add_resource(GroupTaskRevision,
+                 "/groups/<int:group_id>/tasks/<string:unique_task>/history/<int:revision>")
+api.add_resource(GroupTaskAssignees,
+                 "/groups/<int:group_id>/tasks/<string:unique_task>/assignees/")
+api.add_resource(GroupTaskAssignee,
+                 "/groups/<int:group_id>/tasks/<string:unique_task>/assignees/<string:unique_user>/")
+api.add_resource(GroupTaskSearch, "/groups/<int:group_id>/tasks/search")
+api.add_resource(GroupTaskTimeline, "/groups/<int:group_id>/tasks/timeline")
+api.add_resource(GroupTaskOccurrences, "/groups/<int:group_id>/tasks/occurrences")
+api.add_resource(TaskSearch, "/tasks/search")
 api.add_resource(GroupUsers, "/groups/<int:group_id>/users/")
 api.add_resource(UserToGroup, "/groups/<int:group_id>/users/<string:unique_user>/")
+api.add_resource(Batch, "/batch")
+api.add_resource(ChangeFeed, "/changes")
@@ -0,0 +1,155 @@
+"""Archive of completed tasks.
+
+flask archive-tasks moves the completed tasks that have not been updated
+for a while from the task table to task_archive, one transaction per chunk,
+so the task table and its indexes only hold the tasks people work with.
+Archived tasks keep their id; their labels, parent and series are copied by
+name. Everything else about them is removed like for a delete: label links,
+dependencies, assignments and revisions, their group and label counts and
+their search index entries. Stored occurrences of a series are added to the
+exdates of the series, so they do not come back as virtual ones.
+
+Archived tasks are read back with ?include_archived=1 on the task list and
+by their unique_task on the task item.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, exists, func, insert, literal, select
+from task_manager import db
+from task_manager.assignees import remove_assignees_of_tasks
+from task_manager.changes import record_change
+from task_manager.constants import TASK_STATUS_COMPLETED
+from task_manager.dependencies import remove_links_of_tasks
+from task_manager.history import remove_revisions_of_tasks
+from task_manager.labels import remove_labels_of_tasks
+from task_manager.models import Task, TaskArchive
+from task_manager.recurrence import skip_occurrences
+from task_manager.stats import adjust_task_count
+from task_manager.timeline import invalidate_timeline
+
+ARCHIVE_DEFAULT_DAYS = 90
+ARCHIVE_CHUNK_SIZE = 500
+
+# Columns copied from the task table, labels, parent_task and series are
+# read from the column properties of Task
+ARCHIVED_COLUMNS = ("id", "unique_task", "title", "description", "status", "deadline",
+                    "created_at", "updated_at", "position", "labels", "parent_task",
+                    "recurrence", "series", "group_id")
+
+
+def archive_chunk(before, limit=ARCHIVE_CHUNK_SIZE):
+    """Move at most limit completed tasks last updated before the given time
+    to the archive in the current transaction, returns the number of archived
+    tasks per group id
+
+    Series keep running, so tasks with a recurrence rule are never archived.
+    """
+    rows = db.session.execute(
+        select(Task.id, Task.unique_task, Task.group_id, Task.status,
+               Task.recurrence_id, Task.occurrence)
+        .where(Task.status == TASK_STATUS_COMPLETED, Task.updated_at < before,
+               Task.recurrence.is_(None))
+        .order_by(Task.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return Counter()
+    task_ids = [row.id for row in rows]
+    db.session.execute(
+        insert(TaskArchive).from_select(
+            ARCHIVED_COLUMNS + ("archived_at",),
+            select(*(getattr(Task, name) for name in ARCHIVED_COLUMNS),
+                   literal(datetime.now(), TaskArchive.archived_at.type))
+            .where(Task.id.in_(task_ids))
+        )
+    )
+
+    remove_labels_of_tasks(task_ids)
+    subtasks = remove_links_of_tasks(task_ids)
+    remove_assignees_of_tasks(task_ids)
+    remove_revisions_of_tasks(task_ids)
+    occurrences = {}
+    for row in rows:
+        if row.recurrence_id is not None and row.occurrence is not None:
+            occurrences.setdefault(row.recurrence_id, []).append(row.occurrence)
+    for series_id, whens in occurrences.items():
+        series = db.session.get(Task, series_id)
+        if series is not None and series.recurrence:
+            skip_occurrences(series, whens)
+
+    for (group_id, status), count in Counter((row.group_id, row.status) for row in rows).items():
+        adjust_task_count(group_id, status, -count)
+    for row in rows:
+        record_change("task", row.unique_task, "delete", {"archived": True}, row.group_id)
+    if subtasks:
+        for unique_task, group_id in db.session.execute(
+                select(Task.unique_task, Task.group_id).where(Task.unique_task.in_(subtasks))):
+            record_change("task", unique_task, "update", {"parent": None}, group_id)
+    db.session.execute(
+        delete(Task).where(Task.id.in_(task_ids)).execution_options(synchronize_session=False)
+    )
+    return Counter(row.group_id for row in rows)
+
+
+def archive_tasks(before, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Archive every completed task last updated before the given time, one
+    committed chunk at a time, returns the number of archived tasks"""
+    archived = 0
+    while True:
+        groups = archive_chunk(before, chunk_size)
+        if not groups:
+            return archived
+        db.session.commit()
+        for group_id in groups:
+            invalidate_timeline(group_id)
+        archived += sum(groups.values())
+
+
+def _with_labels(stmt, names, match):
+    " Keep the archived tasks with all (or any) of the label names"
+    if match == "any":
+        label = func.json_each(TaskArchive.labels).table_valued("value")
+        return stmt.where(exists(select(1).select_from(label).where(label.c.value.in_(names))))
+    for name in names:
+        label = func.json_each(TaskArchive.labels).table_valued("value")
+        stmt = stmt.where(exists(select(1).select_from(label).where(label.c.value == name)))
+    return stmt
+
+
+def fetch_archived_tasks(group_id, columns, names=None, match="all"):
+    """Fetch the archived tasks of a group, optionally only those with the labels"""
+    stmt = (
+        select(*(getattr(TaskArchive, name) for name in columns))
+        .where(TaskArchive.group_id == group_id)
+        .order_by(TaskArchive.id)
+    )
+    if names:
+        stmt = _with_labels(stmt, names, match)
+    return db.session.execute(stmt).all()
+
+
+def fetch_archived_task(group_id, unique_task, columns):
+    """Fetch an archived task of a group as a row of the columns, or None"""
+    return db.session.execute(
+        select(*(getattr(TaskArchive, name) for name in columns))
+        .where(TaskArchive.group_id == group_id, TaskArchive.unique_task == unique_task)
+    ).first()
+
+
+def remove_group_archive(group_id):
+    """Delete the archived tasks of a group that is about to be deleted"""
+    db.session.execute(delete(TaskArchive).where(TaskArchive.group_id == group_id))
+
+
+@click.command("archive-tasks")
+@click.option("--older-than", default=ARCHIVE_DEFAULT_DAYS, show_default=True,
+              help="Archive the completed tasks not updated for this many days.")
+@click.option("--chunk-size", default=ARCHIVE_CHUNK_SIZE, show_default=True,
+              help="Number of tasks moved per transaction.")
+@with_appcontext
+def archive_tasks_command(older_than, chunk_size):
+    " Move old completed tasks to the task archive."
+    archived = archive_tasks(datetime.now() - timedelta(days=older_than), chunk_size)
+    click.echo(f"Archived {archived} tasks")
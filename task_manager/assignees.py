@@ -0,0 +1,110 @@
+"""Task assignees and the workload of a user.
+
+Tasks are assigned to members of their group through the task_assignee
+table. Each assignment carries a copy of the status and deadline of its
+task, updated in the same transaction as the task, so the
+(user_id, status, deadline) index answers the workload of a user without
+reading the task table.
+"""
+from datetime import datetime
+from sqlalchemy import case, delete, func, select, update
+from task_manager import db
+from task_manager.constants import TASK_STATUS_COMPLETED
+from task_manager.models import Task, TaskAssignee, User
+
+# Columns of an assignee of a task, passwords are never included
+ASSIGNEE_COLUMNS = ("unique_user", "name", "email")
+
+
+def assign_task(task, user):
+    """Assign a flushed task to a user, the caller handles duplicates"""
+    db.session.add(TaskAssignee(task_id=task.id, user_id=user.id,
+                                status=task.status, deadline=task.deadline))
+
+
+def unassign_task(task_id, user_id):
+    """Delete an assignment, returns whether it existed"""
+    return db.session.execute(
+        delete(TaskAssignee).where(TaskAssignee.task_id == task_id,
+                                   TaskAssignee.user_id == user_id)
+    ).rowcount > 0
+
+
+def sync_assignments(task):
+    """Copy the status and deadline of a task to its assignments"""
+    db.session.execute(
+        update(TaskAssignee).where(TaskAssignee.task_id == task.id)
+        .values(status=task.status, deadline=task.deadline)
+    )
+
+
+def fetch_task_assignees(task_id):
+    """Fetch the users a task is assigned to, as rows of ASSIGNEE_COLUMNS"""
+    return db.session.execute(
+        select(*(getattr(User, name) for name in ASSIGNEE_COLUMNS))
+        .join(TaskAssignee, TaskAssignee.user_id == User.id)
+        .where(TaskAssignee.task_id == task_id)
+        .order_by(User.name, User.unique_user)
+    ).all()
+
+
+def task_assignee_ids(task_id):
+    """unique_user of the assignees of a task"""
+    return db.session.execute(
+        select(User.unique_user)
+        .join(TaskAssignee, TaskAssignee.user_id == User.id)
+        .where(TaskAssignee.task_id == task_id)
+        .order_by(User.unique_user)
+    ).scalars().all()
+
+
+def fetch_workload(user_id):
+    """Summarise the open tasks assigned to a user
+
+    One grouped scan of the user's range of the workload index gives the
+    open tasks per status, the overdue ones and the next upcoming deadline.
+    """
+    now = datetime.now()
+    rows = db.session.execute(
+        select(TaskAssignee.status,
+               func.count(),
+               func.sum(TaskAssignee.deadline < now),
+               func.min(case((TaskAssignee.deadline >= now, TaskAssignee.deadline))))
+        .where(TaskAssignee.user_id == user_id,
+               TaskAssignee.status != TASK_STATUS_COMPLETED)
+        .group_by(TaskAssignee.status)
+    ).all()
+    upcoming = [deadline for *_, deadline in rows if deadline is not None]
+    return {
+        "open": sum(count for _, count, _, _ in rows),
+        "by_status": {str(status): count for status, count, _, _ in rows},
+        "overdue": sum(overdue or 0 for _, _, overdue, _ in rows),
+        "next_deadline": min(upcoming) if upcoming else None
+    }
+
+
+def remove_task_assignees(task_id):
+    """Delete the assignments of a task that is about to be deleted"""
+    remove_assignees_of_tasks([task_id])
+
+
+def remove_assignees_of_tasks(task_ids):
+    """Delete the assignments of the tasks that are about to be deleted or archived"""
+    db.session.execute(delete(TaskAssignee).where(TaskAssignee.task_id.in_(task_ids)))
+
+
+def remove_user_assignments(user_id, group_id=None):
+    """Delete the assignments of a user, only in one group if group_id is given"""
+    stmt = delete(TaskAssignee).where(TaskAssignee.user_id == user_id)
+    if group_id is not None:
+        stmt = stmt.where(TaskAssignee.task_id.in_(
+            select(Task.id).where(Task.group_id == group_id)))
+    db.session.execute(stmt)
+
+
+def remove_group_assignees(group_id):
+    """Delete the assignments of the tasks of a group that is about to be deleted"""
+    db.session.execute(
+        delete(TaskAssignee).where(TaskAssignee.task_id.in_(
+            select(Task.id).where(Task.group_id == group_id)))
+    )
@@ -0,0 +1,108 @@
+"""Append-only change log for incremental client sync.
+
+Resources record every create, update and delete with record_change() in
+the same transaction as the change itself. Clients read the log from the
+id of the last entry they saw, so a sync costs O(changes) instead of
+re-reading whole collections. Old entries are compacted to one entry per
+entity, which keeps the id of the latest one so no cursor misses a change.
+"""
+from datetime import date, datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from task_manager import db
+from task_manager.models import ChangeLog
+
+CHANGE_COLUMNS = ("cursor", "entity", "id", "action", "group_id", "changes", "at")
+CHANGES_DEFAULT_LIMIT = 100
+CHANGES_MAX_LIMIT = 1000
+COMPACT_DEFAULT_DAYS = 30
+
+
+def _jsonable(changes):
+    " ISO format the datetimes of a change so it can be stored as JSON"
+    return {
+        name: value.isoformat() if isinstance(value, (datetime, date)) else value
+        for name, value in changes.items()
+    }
+
+
+def record_change(entity, key, action, changes=None, group_id=None):
+    """Add a change log entry to the current transaction
+
+    entity is one of user, group, task or membership, action one of create,
+    update or delete, and changes a dict of the new values of the fields.
+    """
+    db.session.add(ChangeLog(
+        entity=entity,
+        key=str(key),
+        action=action,
+        changes=_jsonable(changes) if changes else None,
+        group_id=group_id,
+        created_at=datetime.now()
+    ))
+
+
+def fetch_changes(since, group_id=None, limit=CHANGES_DEFAULT_LIMIT):
+    """Fetch at most limit change log rows after the cursor since, oldest first"""
+    stmt = (
+        select(ChangeLog.id, ChangeLog.entity, ChangeLog.key, ChangeLog.action,
+               ChangeLog.group_id, ChangeLog.changes, ChangeLog.created_at)
+        .where(ChangeLog.id > since)
+        .order_by(ChangeLog.id)
+        .limit(limit)
+    )
+    if group_id is not None:
+        stmt = stmt.where(ChangeLog.group_id == group_id)
+    return db.session.execute(stmt).all()
+
+
+def _merge(entries):
+    " Fold the entries of one entity into (action, changes)"
+    last_delete = max((index for index, entry in enumerate(entries)
+                       if entry.action == "delete"), default=None)
+    if last_delete == len(entries) - 1:
+        return "delete", None
+    if last_delete is not None:
+        entries = entries[last_delete + 1:]
+    action = "create" if last_delete is not None or entries[0].action == "create" else "update"
+    changes = {}
+    for entry in entries:
+        changes.update(entry.changes or {})
+    return action, changes or None
+
+
+def compact_changes(before):
+    """Merge the entries older than before into one entry per entity
+
+    The merged entry replaces the latest one of the entity, so a client
+    whose cursor is anywhere before it still receives the final state.
+    Returns the number of removed entries.
+    """
+    entries = {}
+    for entry in ChangeLog.query.filter(ChangeLog.created_at < before).order_by(ChangeLog.id):
+        entries.setdefault((entry.entity, entry.key, entry.group_id), []).append(entry)
+
+    removed = 0
+    for group in entries.values():
+        if len(group) < 2:
+            continue
+        action, changes = _merge(group)
+        latest = group[-1]
+        latest.action = action
+        latest.changes = changes
+        for entry in group[:-1]:
+            db.session.delete(entry)
+        removed += len(group) - 1
+    db.session.commit()
+    return removed
+
+
+@click.command("compact-change-log")
+@click.option("--older-than", default=COMPACT_DEFAULT_DAYS, show_default=True,
+              help="Compact the entries older than this many days.")
+@with_appcontext
+def compact_change_log_command(older_than):
+    " Merge old change log entries into one entry per entity."
+    removed = compact_changes(datetime.now() - timedelta(days=older_than))
+    click.echo(f"Removed {removed} change log entries")
@@ -1,47 +1,61 @@
 # ChatGPT helped to implement this script in order to automate the notification of task deadlines
-import os
-from datetime import datetime
+from datetime import datetime, time, timedelta
 import requests
-from task_manager.models import Task
+from sqlalchemy import select
+from task_manager import db
+from task_manager.constants import TASK_STATUS_COMPLETED
+from task_manager.models import Task, TaskAssignee, User
+
+# Reminders of tasks nobody is assigned to go here
+DEFAULT_RECIPIENT = "pvaarani21@student.oulu.fi"
+REMINDER_DAYS = 3
+
+def due_reminders(now):
+    """(recipient, title, deadline) of every open task due within REMINDER_DAYS,
+    once per assignee, or to DEFAULT_RECIPIENT if the task has no assignees"""
+    start = datetime.combine(now.date(), time.min)
+    end = start + timedelta(days=REMINDER_DAYS + 1)
+    rows = db.session.execute(
+        select(User.email, Task.title, Task.deadline)
+        .select_from(Task)
+        .outerjoin(TaskAssignee, TaskAssignee.task_id == Task.id)
+        .outerjoin(User, User.id == TaskAssignee.user_id)
+        .where(Task.status != TASK_STATUS_COMPLETED,
+               Task.deadline >= start, Task.deadline < end)
+        .order_by(Task.deadline, Task.id)
+    )
+    return [(email or DEFAULT_RECIPIENT, title, deadline) for email, title, deadline in rows]
 
 def check_deadlines_and_notify():
-    """Check for tasks with deadlines that are today and notify the user."""
-    tasks = Task.query.all()
+    """Check for tasks with deadlines in the next days and notify their assignees."""
+    now = datetime.now()
+    reminders = due_reminders(now)
 
-    if not tasks:
+    if not reminders:
         print("No tasks found.")
         return
-    
-    for task in tasks:
+
+    for recipient, title, deadline in reminders:
+        days_until_deadline = (deadline.date() - now.date()).days
+        email_data = {
+            "recipient": recipient,
+            "subject": f"Reminder: Deadline for '{title}' is due in {days_until_deadline} day(s)",
+            "body": (
+                f"Hello,\n\n"
+                f"This is a reminder that the task '{title}' has a deadline on "
+                f"{deadline.strftime('%Y-%m-%d at %H:%M')}.\n"
+                f"You have {days_until_deadline} day(s) left to complete it.\n\n"
+                f"Best regards,\n"
+                f"Task Manager App"
+            )
+        }
         try:
-            now = datetime.now()
-            deadline_date = task.deadline.date()
-            now_date = now.date()
-
-            days_until_deadline = (deadline_date - now_date).days
-
-            if 0 <= days_until_deadline <= 3:
-                email_data = {
-                    "recipient": "pvaarani21@student.oulu.fi",
-                    "subject": f"Reminder: Deadline for '{task.title}' is due in {days_until_deadline} day(s)",
-                    "body": (
-                        f"Hello,\n\n"
-                        f"This is a reminder that the task '{task.title}' has a deadline on "
-                        f"{task.deadline.strftime('%Y-%m-%d at %H:%M')}.\n"
-                        f"You have {days_until_deadline} day(s) left to complete it.\n\n"
-                        f"Best regards,\n"
-                        f"Task Manager App"
-                    )
-                }
-                try:
-                    response = requests.post("http://127.0.0.1:8000/api/emails/", json=email_data)
-                    if response.status_code != 200:
-                        print(f"Deadline reminder failed: {response.json()}")
-                except requests.exceptions.RequestException as e:
-                    print(f"Error contacting email service: {str(e)}")
-        except ValueError:
-            return {"error": "Invalid deadline format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
-        
+            response = requests.post("http://127.0.0.1:8000/api/emails/", json=email_data)
+            if response.status_code != 200:
+                print(f"Deadline reminder failed: {response.json()}")
+        except requests.exceptions.RequestException as e:
+            print(f"Error contacting email service: {str(e)}")
+
 if __name__ == "__main__":
     from task_manager import create_app
 
@@ -1,6 +1,10 @@
 API_NAME = "task_manager"
 MASON = "application/vnd.mason+json"
 
+# Task status values used by the client
+TASK_STATUS_PENDING = 0
+TASK_STATUS_COMPLETED = 1
+
 #Copilot suggested these constants when asked suitable options for our api
 # Paths for the API resources
 API_PATH = "/api/"
@@ -0,0 +1,126 @@
+"""Subtasks and blocking dependencies between tasks.
+
+A subtask points to its parent with parent_id, and the task_dependency
+table holds the tasks blocking a task. A whole subtree, or every task a
+task transitively waits for, is read with one recursive CTE query instead
+of one request per level. The same kind of query refuses parents and
+blockers that would close a cycle, so both graphs stay acyclic.
+"""
+from sqlalchemy import delete, literal, or_, select, update
+from task_manager import db
+from task_manager.history import record_revisions, task_states
+from task_manager.models import Task, TaskDependency
+
+
+def _reachable(start_id, target_id, source, target):
+    " Whether target_id is reached from start_id following the source -> target edges"
+    reached = select(literal(start_id).label("id")).cte("reached", recursive=True)
+    reached = reached.union(
+        select(target).where(source == reached.c.id, target.is_not(None))
+    )
+    return db.session.execute(
+        select(reached.c.id).where(reached.c.id == target_id).limit(1)
+    ).first() is not None
+
+
+def creates_parent_cycle(task_id, parent_id):
+    """Whether making parent_id the parent of task_id would put the task in its own subtree"""
+    return _reachable(parent_id, task_id, Task.id, Task.parent_id)
+
+
+def creates_dependency_cycle(task_id, blocker_id):
+    """Whether blocking task_id by blocker_id would make the task wait for itself"""
+    return _reachable(blocker_id, task_id, TaskDependency.task_id, TaskDependency.blocker_id)
+
+
+def fetch_subtasks(task_id, columns):
+    """Fetch the whole subtree below a task in one recursive query
+
+    Rows hold the columns and the depth, 1 for the direct subtasks, and come
+    level by level in position order.
+    """
+    tree = (
+        select(Task.id, literal(1).label("depth"))
+        .where(Task.parent_id == task_id)
+        .cte("subtree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(Task.id, tree.c.depth + 1).where(Task.parent_id == tree.c.id)
+    )
+    return db.session.execute(
+        select(*(getattr(Task, name) for name in columns), tree.c.depth)
+        .join(tree, Task.id == tree.c.id)
+        .order_by(tree.c.depth, Task.position.is_(None), Task.position, Task.id)
+    ).all()
+
+
+def fetch_blockers(task_id, columns):
+    """Fetch every task blocking a task, directly or through other blockers,
+    in one recursive query"""
+    chain = (
+        select(TaskDependency.blocker_id.label("id"))
+        .where(TaskDependency.task_id == task_id)
+        .cte("blockers", recursive=True)
+    )
+    chain = chain.union(
+        select(TaskDependency.blocker_id).where(TaskDependency.task_id == chain.c.id)
+    )
+    return db.session.execute(
+        select(*(getattr(Task, name) for name in columns))
+        .join(chain, Task.id == chain.c.id)
+        .order_by(Task.position.is_(None), Task.position, Task.id)
+    ).all()
+
+
+def direct_blockers(task_id):
+    """unique_task of the tasks blocking a task directly"""
+    return db.session.execute(
+        select(Task.unique_task)
+        .join(TaskDependency, TaskDependency.blocker_id == Task.id)
+        .where(TaskDependency.task_id == task_id)
+        .order_by(Task.unique_task)
+    ).scalars().all()
+
+
+def remove_blocker(task_id, blocker_id):
+    """Delete a dependency, returns whether it existed"""
+    return db.session.execute(
+        delete(TaskDependency).where(TaskDependency.task_id == task_id,
+                                     TaskDependency.blocker_id == blocker_id)
+    ).rowcount > 0
+
+
+def remove_task_links(task_id):
+    """Drop the dependencies of a task that is about to be deleted and make
+    its subtasks top level tasks, returns the unique_task of those"""
+    return remove_links_of_tasks([task_id])
+
+
+def remove_links_of_tasks(task_ids):
+    """Like remove_task_links for tasks that are about to be deleted or archived
+    together, subtasks among them are left alone"""
+    subtasks = db.session.execute(
+        select(Task.id, Task.unique_task)
+        .where(Task.parent_id.in_(task_ids), Task.id.not_in(task_ids))
+    ).all()
+    if subtasks:
+        befores = task_states([task_id for task_id, _ in subtasks])
+        db.session.execute(
+            update(Task).where(Task.parent_id.in_(task_ids), Task.id.not_in(task_ids))
+            .values(parent_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        record_revisions(befores, {"parent": None})
+    db.session.execute(
+        delete(TaskDependency).where(or_(TaskDependency.task_id.in_(task_ids),
+                                         TaskDependency.blocker_id.in_(task_ids)))
+    )
+    return [unique_task for _, unique_task in subtasks]
+
+
+def remove_group_links(group_id):
+    """Delete the dependencies of the tasks of a group that is about to be deleted"""
+    db.session.execute(
+        delete(TaskDependency).where(TaskDependency.task_id.in_(
+            select(Task.id).where(Task.group_id == group_id)))
+    )
@@ -0,0 +1,127 @@
+"""Live task and membership events for Server-Sent Events streams.
+
+Every committed change log entry of a task or membership is published to
+an in-process broker, which fans it out to the open streams of its group.
+Each stream has a bounded queue; a subscriber that does not keep up is
+dropped instead of holding back the others, and resumes from the change
+log with Last-Event-ID when it reconnects. The broker lives in the process,
+so only streams served by the process that committed a change see it.
+"""
+import queue
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from task_manager.models import ChangeLog
+
+# Change log entities that are pushed to the streams of their group
+EVENT_ENTITIES = ("task", "membership")
+EVENTS_DEFAULT_QUEUE_SIZE = 100
+
+
+class Subscriber:
+    """One open stream, holding the events not yet sent to it"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+
+    def get(self, timeout):
+        " Wait at most timeout seconds for the next event, None if there is none"
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Fan-out of events to the subscribers of each group"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, group_id, maxsize=EVENTS_DEFAULT_QUEUE_SIZE):
+        " Start receiving the events of a group"
+        subscriber = Subscriber(maxsize)
+        with self._lock:
+            self._subscribers.setdefault(group_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, group_id, subscriber):
+        " Stop receiving the events of a group"
+        with self._lock:
+            subscribers = self._subscribers.get(group_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[group_id]
+
+    def subscriber_count(self, group_id):
+        " Number of open streams of a group"
+        with self._lock:
+            return len(self._subscribers.get(group_id, ()))
+
+    def publish(self, group_id, item):
+        " Queue an event for every subscriber of the group, dropping the full ones"
+        with self._lock:
+            subscribers = list(self._subscribers.get(group_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(item)
+            except queue.Full:
+                subscriber.dropped = True
+                self.unsubscribe(group_id, subscriber)
+
+
+broker = Broker()
+
+
+def event_item(entry):
+    " The event sent for a change log entry or row"
+    return {
+        "cursor": entry.id,
+        "entity": entry.entity,
+        "id": entry.key,
+        "action": entry.action,
+        "changes": entry.changes,
+        "at": entry.created_at
+    }
+
+
+def publish_events(items):
+    " Publish (group_id, event) pairs to the broker"
+    for group_id, item in items:
+        broker.publish(group_id, item)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(session, _flush_context):
+    " Remember the flushed change log entries until the transaction ends"
+    items = [
+        (entry.group_id, event_item(entry)) for entry in session.new
+        if isinstance(entry, ChangeLog) and entry.entity in EVENT_ENTITIES
+        and entry.group_id is not None
+    ]
+    if items:
+        session.info.setdefault("events", []).extend(items)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(session):
+    " Publish the events once the transaction is committed"
+    items = session.info.pop("events", None)
+    if not items:
+        return
+    if isinstance(session.bind, Connection) and session.bind.in_transaction():
+        # The session only released a savepoint of an outer transaction, the
+        # owner of the connection publishes when that one is committed
+        session.bind.info.setdefault("events", []).extend(items)
+        return
+    publish_events(items)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_events(session, _previous_transaction):
+    " Forget the events of a rolled back transaction"
+    session.info.pop("events", None)
@@ -0,0 +1,167 @@
+"""Revision history of tasks.
+
+Every change of a task adds a task_revision row holding only the fields
+whose value changed, in the same transaction as the change: updates through
+the API, a parent cleared because it was deleted and occurrences skipped by
+a series. Changes are taken against the latest revision, so the history
+also catches up with a change made outside those paths. Revision 1
+holds the whole task, and every SNAPSHOT_INTERVAL revisions a full
+snapshot is stored next to the changes, so the task as of any revision is
+rebuilt from the nearest snapshot with at most SNAPSHOT_INTERVAL deltas.
+"""
+from datetime import date, datetime
+from sqlalchemy import delete, func, insert, or_, select
+from task_manager import db
+from task_manager.models import Task, TaskRevision
+
+# Fields of a task kept in the history
+REVISION_FIELDS = ("title", "description", "status", "deadline", "labels", "parent",
+                   "recurrence")
+REVISION_COLUMNS = ("revision", "changes", "at")
+SNAPSHOT_INTERVAL = 20
+REVISIONS_DEFAULT_LIMIT = 20
+REVISIONS_MAX_LIMIT = 100
+
+
+def _normalise(values):
+    " The history form of field values, ISO datetimes and sorted labels"
+    normalised = {}
+    for name, value in values.items():
+        if name not in REVISION_FIELDS:
+            continue
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif name == "labels":
+            value = sorted(value or ())
+        normalised[name] = value
+    return normalised
+
+
+def task_states(task_ids):
+    """The current values of the REVISION_FIELDS of tasks by task id, read in one query"""
+    rows = db.session.execute(
+        select(Task.id, Task.title, Task.description, Task.status, Task.deadline,
+               Task.labels, Task.parent_task, Task.recurrence)
+        .where(Task.id.in_(task_ids))
+    )
+    return {row[0]: _normalise(dict(zip(REVISION_FIELDS, row[1:]))) for row in rows}
+
+
+def task_state(task_id):
+    """The current values of the REVISION_FIELDS of a task, read in one query"""
+    return task_states([task_id])[task_id]
+
+
+def _last_revision(task_id):
+    " Number of the latest revision of a task, 0 if it has none"
+    return db.session.execute(
+        select(func.max(TaskRevision.revision)).where(TaskRevision.task_id == task_id)
+    ).scalar() or 0
+
+
+def _add_revision(task_id, changes, snapshot=None):
+    " Insert the next revision of a task, its number is taken in the same statement"
+    next_revision = (
+        select(func.coalesce(func.max(TaskRevision.revision), 0) + 1)
+        .where(TaskRevision.task_id == task_id)
+        .scalar_subquery()
+    )
+    return db.session.execute(
+        insert(TaskRevision)
+        .values(task_id=task_id, revision=next_revision, changes=changes, snapshot=snapshot,
+                created_at=datetime.now())
+        .returning(TaskRevision.revision)
+    ).scalar()
+
+
+def record_created(task_id, values):
+    """Add revision 1 holding the whole new task"""
+    _add_revision(task_id, _normalise(values))
+
+
+def record_revision(task_id, before, values):
+    """Add the next revision of a task with the fields that differ from its latest revision
+
+    before is the task_state() read before the change, tasks older than the
+    history get it as their first revision. Fields of before that differ
+    from the latest revision are recorded too. Call it once the task row is
+    written in the same transaction, the row lock then orders concurrent
+    revisions of the task. Returns the number of the new revision, None if
+    nothing changed.
+    """
+    revision = _last_revision(task_id)
+    if revision == 0:
+        revision, latest = _add_revision(task_id, before), before
+    else:
+        latest = task_at(task_id, revision)["task"]
+    changes = {name: value for name, value in dict(before, **_normalise(values)).items()
+               if latest.get(name) != value}
+    if not changes:
+        return None
+    snapshot = dict(latest, **changes) if revision % SNAPSHOT_INTERVAL == 0 else None
+    return _add_revision(task_id, changes, snapshot)
+
+
+def record_revisions(befores, values):
+    """Add a revision with the same values to each task of befores, the
+    task_states() read before the change"""
+    for task_id, before in befores.items():
+        record_revision(task_id, before, values)
+
+
+def fetch_revisions(task_id, before=None, limit=REVISIONS_DEFAULT_LIMIT):
+    """Fetch at most limit revisions of a task older than revision before, newest first"""
+    stmt = (
+        select(TaskRevision.revision, TaskRevision.changes, TaskRevision.created_at)
+        .where(TaskRevision.task_id == task_id)
+        .order_by(TaskRevision.revision.desc())
+        .limit(limit)
+    )
+    if before is not None:
+        stmt = stmt.where(TaskRevision.revision < before)
+    return db.session.execute(stmt).all()
+
+
+def task_at(task_id, revision):
+    """Rebuild the fields of a task as of a revision, None if there is no such revision
+
+    One query reads the nearest snapshot at or before the revision and the
+    deltas after it, which are replayed in order.
+    """
+    base = (
+        select(func.max(TaskRevision.revision))
+        .where(TaskRevision.task_id == task_id, TaskRevision.revision <= revision,
+               or_(TaskRevision.snapshot.is_not(None), TaskRevision.revision == 1))
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        select(TaskRevision.revision, TaskRevision.changes, TaskRevision.snapshot,
+               TaskRevision.created_at)
+        .where(TaskRevision.task_id == task_id,
+               TaskRevision.revision >= base, TaskRevision.revision <= revision)
+        .order_by(TaskRevision.revision)
+    ).all()
+    if not rows or rows[-1].revision != revision:
+        return None
+    state = dict(rows[0].snapshot or rows[0].changes)
+    for row in rows[1:]:
+        state.update(row.changes)
+    return {"revision": revision, "task": state, "at": rows[-1].created_at}
+
+
+def remove_task_revisions(task_id):
+    """Delete the history of a task that is about to be deleted"""
+    remove_revisions_of_tasks([task_id])
+
+
+def remove_revisions_of_tasks(task_ids):
+    """Delete the history of the tasks that are about to be deleted or archived"""
+    db.session.execute(delete(TaskRevision).where(TaskRevision.task_id.in_(task_ids)))
+
+
+def remove_group_revisions(group_id):
+    """Delete the history of the tasks of a group that is about to be deleted"""
+    db.session.execute(
+        delete(TaskRevision).where(TaskRevision.task_id.in_(
+            select(Task.id).where(Task.group_id == group_id)))
+    )
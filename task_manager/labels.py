@@ -0,0 +1,128 @@
+"""Task labels and label filters.
+
+Labels belong to a group and are attached to tasks through the task_label
+junction table, which is indexed both from the task and from the label.
+Every label keeps the number of its tasks in task_count, updated in the
+same transaction as the tasks, so label lists never count rows.
+"""
+from sqlalchemy import delete, func, intersect, select, update
+from task_manager import db
+from task_manager.models import Group, Label, Task, TaskLabel
+from task_manager.utils import fetch_group_rows
+
+LABEL_MATCHES = ("all", "any")
+LABEL_COLUMNS = ("name", "task_count")
+
+
+def parse_label_names(names):
+    """Validate a list of label names, returns them stripped and without duplicates
+
+    Raises ValueError if names is not a list of non-empty strings.
+    """
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise ValueError("Labels must be a list of strings")
+    names = list(dict.fromkeys(name.strip() for name in names))
+    if not all(0 < len(name) <= 64 for name in names):
+        raise ValueError("Label names must be 1-64 characters long")
+    return names
+
+
+def parse_label_query(value):
+    """The label names of a comma separated ?labels= value, stripped, without
+    duplicates and without empty names"""
+    return list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+
+
+def _adjust_counts(label_ids, delta):
+    " Add delta to the task count of the labels"
+    if label_ids:
+        db.session.execute(
+            update(Label).where(Label.id.in_(label_ids))
+            .values(task_count=Label.task_count + delta)
+        )
+
+
+def set_task_labels(task, names):
+    """Replace the labels of a flushed task, creating the labels that do not exist yet"""
+    labels = dict(db.session.execute(
+        select(Label.name, Label.id).where(Label.group_id == task.group_id,
+                                           Label.name.in_(names))
+    ).all())
+    for name in names:
+        if name not in labels:
+            label = Label(group_id=task.group_id, name=name, task_count=0)
+            db.session.add(label)
+            db.session.flush()
+            labels[name] = label.id
+
+    wanted = {labels[name] for name in names}
+    current = set(db.session.execute(
+        select(TaskLabel.label_id).where(TaskLabel.task_id == task.id)
+    ).scalars())
+    added = wanted - current
+    removed = current - wanted
+    if added:
+        db.session.execute(
+            TaskLabel.__table__.insert(),
+            [{"task_id": task.id, "label_id": label_id} for label_id in added]
+        )
+    if removed:
+        db.session.execute(
+            delete(TaskLabel).where(TaskLabel.task_id == task.id,
+                                    TaskLabel.label_id.in_(removed))
+        )
+    _adjust_counts(added, 1)
+    _adjust_counts(removed, -1)
+
+
+def remove_task_labels(task_id):
+    """Detach all labels of a task that is about to be deleted"""
+    remove_labels_of_tasks([task_id])
+
+
+def remove_labels_of_tasks(task_ids):
+    """Detach all labels of the tasks that are about to be deleted or archived"""
+    counts = db.session.execute(
+        select(TaskLabel.label_id, func.count()).where(TaskLabel.task_id.in_(task_ids))
+        .group_by(TaskLabel.label_id)
+    ).all()
+    db.session.execute(delete(TaskLabel).where(TaskLabel.task_id.in_(task_ids)))
+    for label_id, count in counts:
+        _adjust_counts([label_id], -count)
+
+
+def remove_group_labels(group_id):
+    """Delete the labels of a group that is about to be deleted"""
+    db.session.execute(
+        delete(TaskLabel).where(TaskLabel.task_id.in_(
+            select(Task.id).where(Task.group_id == group_id)))
+    )
+    db.session.execute(delete(Label).where(Label.group_id == group_id))
+
+
+def labeled_task_ids(group_id, names, match="all"):
+    """SELECT of the ids of the tasks with all (or any) of the labels, None if
+    no task can match
+
+    With match=all the junction rows of each label are intersected, starting
+    from the label with the fewest tasks.
+    """
+    labels = db.session.execute(
+        select(Label.id).where(Label.group_id == group_id, Label.name.in_(names))
+        .order_by(Label.task_count)
+    ).scalars().all()
+    if not labels or (match == "all" and len(labels) < len(names)):
+        return None
+    if match == "any":
+        return select(TaskLabel.task_id).where(TaskLabel.label_id.in_(labels))
+    selects = [select(TaskLabel.task_id).where(TaskLabel.label_id == label_id)
+               for label_id in labels]
+    return intersect(*selects) if len(selects) > 1 else selects[0]
+
+
+def fetch_group_labels(group_id):
+    """Fetch the labels of a group with their task counts, most used first,
+    in one query, None if there is no such group"""
+    return fetch_group_rows(group_id, Label, Label.group_id == Group.id,
+                            Label.name, Label.task_count,
+                            order_by=(Label.task_count.desc(), Label.name))
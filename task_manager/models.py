@@ -1,7 +1,9 @@
 """This module contains the models for the task manager application."""
 import hashlib
+from datetime import datetime
 import click
 from flask.cli import with_appcontext
+from sqlalchemy import DDL, event, func, select, text, type_coerce
 from task_manager import db
 
 
@@ -17,6 +19,16 @@ class ApiKey(db.Model):
         " Generate a hash for the key"
         return hashlib.sha256(key.encode()).digest()
 
+def _isoformat(value):
+    " ISO format a datetime column, keeping empty values as None"
+    return value.isoformat() if value else None
+
+def _parse_datetime(value):
+    " Parse an ISO formatted datetime, datetimes are passed through"
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
 # models from exercise 1
 class User(db.Model):
     " User database model, models from ex. 1"
@@ -28,6 +40,12 @@ class User(db.Model):
 
     user_groups = db.relationship("UserGroup", back_populates="user", cascade="all, delete-orphan")
 
+    # Expression indexes for case-insensitive prefix lookups (autocomplete)
+    __table_args__ = (
+        db.Index("ix_user_name_lower", db.func.lower(name)),
+        db.Index("ix_user_email_lower", db.func.lower(email)),
+    )
+
 # from Lovelace
     def serialize(self, short_form=False):
         " Serialize the user, from Lovelace"
@@ -79,6 +97,19 @@ class Task(db.Model):
     deadline = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, nullable=True)
     updated_at = db.Column(db.DateTime, nullable=False)
+    # Fractional index of the task in its group, see task_manager.ordering
+    position = db.Column(db.String(64), nullable=True)
+    # Parent task of a subtask, always in the same group
+    parent_id = db.Column(db.Integer,
+                          db.ForeignKey('task.id', ondelete='SET NULL'),
+                          nullable=True)
+    # Recurrence rule of a series, see task_manager.recurrence
+    recurrence = db.Column(db.JSON(none_as_null=True), nullable=True)
+    # Series and original date of an occurrence stored as a task of its own
+    recurrence_id = db.Column(db.Integer,
+                              db.ForeignKey('task.id', ondelete='SET NULL'),
+                              nullable=True)
+    occurrence = db.Column(db.DateTime, nullable=True)
     group_id = db.Column(db.Integer,
                          db.ForeignKey('group.id', ondelete='SET NULL'),
                          nullable=True)
@@ -87,19 +118,38 @@ class Task(db.Model):
    # user_group = db.relationship("UserGroup", back_populates="tasks")
     group = db.relationship("Group", back_populates="tasks")
 
+    # Covers the overdue / due soon counts of the group statistics
+    # and the deadline range scans of the timeline, and the task list in
+    # position order, and the subtasks of a task. Task titles are unique
+    # within a group, except for the occurrences of a series, which are
+    # unique per date instead
+    __table_args__ = (
+        db.Index("ix_task_group_status_deadline", "group_id", "status", "deadline"),
+        db.Index("ix_task_group_deadline", "group_id", "deadline"),
+        db.Index("ix_task_group_position", "group_id", "position"),
+        db.Index("ix_task_parent", "parent_id", "position"),
+        db.Index("uq_task_group_title", "group_id", "title", unique=True,
+                 sqlite_where=occurrence.is_(None)),
+        db.Index("uq_task_recurrence_occurrence", "recurrence_id", "occurrence", unique=True),
+        # Archived tasks keep their id, so SQLite must never hand it out again
+        {"sqlite_autoincrement": True},
+    )
+
 # from Lovelace
     def serialize(self, short_form=False):
         " Serialize the task, from Lovelace"
         doc = {
+            "unique_task" : self.unique_task,
             "title" : self.title,
-            "deadline" : self.deadline,
+            "deadline" : _isoformat(self.deadline),
             "status" : self.status
         }
         if not short_form:
+            doc["id"] = self.id
             doc["description"] = self.description
-            doc["created_at"] = self.created_at
-            doc["updated_at"] = self.updated_at
-            doc["usergroup_id"] = self.usergroup_id
+            doc["created_at"] = _isoformat(self.created_at)
+            doc["updated_at"] = _isoformat(self.updated_at)
+            doc["group_id"] = self.group_id
         return doc
 
     def deserialize(self, doc):
@@ -107,10 +157,10 @@ class Task(db.Model):
         self.title = doc["title"]
         self.description = doc["description"]
         self.status = doc["status"]
-        self.deadline = doc["deadline"]
-        self.created_at = doc["created_at"]
-        self.updated_at = doc["updated_at"]
-        self.usergroup_id = doc["usergroup_id"]
+        self.deadline = _parse_datetime(doc["deadline"])
+        self.created_at = _parse_datetime(doc["created_at"])
+        self.updated_at = _parse_datetime(doc["updated_at"])
+        self.group_id = doc.get("group_id")
 
     @staticmethod
     def json_schema():
@@ -122,8 +172,7 @@ class Task(db.Model):
                         "status",
                         "deadline",
                         "created_at",
-                        "updated_at",
-                        "usergroup_id"]
+                        "updated_at"]
         }
         props = schema["properties"] = {}
         props["title"] = {
@@ -153,12 +202,30 @@ class Task(db.Model):
             "type": "string",
             "format": "date-time"
             }
-        props["usergroup_id"] = {
-            "description": "User group ID",
-            "type": "integer"
-            }
         return schema
 
+# Full-text index over task titles and descriptions. task_fts is an FTS5
+# external content table reading from task, kept in sync by the triggers.
+TASK_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "title, description, content='task', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+)
+
+for statement in TASK_SEARCH_DDL:
+    event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
 class Group(db.Model):
     """ Group database model, models from ex. 1 """
     id = db.Column(db.Integer, primary_key=True)
@@ -194,6 +261,138 @@ class Group(db.Model):
             }
         return schema
 
+class GroupStats(db.Model):
+    """ Number of tasks per status in a group, kept up to date by the task resources """
+    __tablename__ = "group_stats"
+    group_id = db.Column(db.Integer,
+                         db.ForeignKey('group.id', ondelete='CASCADE'),
+                         primary_key=True)
+    status = db.Column(db.Integer, primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+
+class Label(db.Model):
+    """ Label of the tasks in a group, task_count is kept up to date by the
+    task resources """
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.Integer,
+                         db.ForeignKey('group.id', ondelete='CASCADE'),
+                         nullable=False)
+    name = db.Column(db.String(64), nullable=False)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("group_id", "name", name="uq_label_group_name"),
+    )
+
+class TaskLabel(db.Model):
+    """ Junction of tasks and labels, indexed both ways """
+    __tablename__ = "task_label"
+    task_id = db.Column(db.Integer,
+                        db.ForeignKey('task.id', ondelete='CASCADE'),
+                        primary_key=True)
+    label_id = db.Column(db.Integer,
+                         db.ForeignKey('label.id', ondelete='CASCADE'),
+                         primary_key=True)
+
+    # The primary key finds the labels of a task, this one the tasks of a label
+    __table_args__ = (
+        db.Index("ix_task_label_label", "label_id", "task_id"),
+    )
+
+# Label names of a task as a JSON array, only loaded when selected explicitly
+Task.labels = db.column_property(
+    select(type_coerce(func.json_group_array(Label.name), db.JSON))
+    .join(TaskLabel, TaskLabel.label_id == Label.id)
+    .where(TaskLabel.task_id == Task.id)
+    .scalar_subquery(),
+    deferred=True
+)
+
+class TaskDependency(db.Model):
+    """ Task blocked by another task of the same group """
+    __tablename__ = "task_dependency"
+    task_id = db.Column(db.Integer,
+                        db.ForeignKey('task.id', ondelete='CASCADE'),
+                        primary_key=True)
+    blocker_id = db.Column(db.Integer,
+                           db.ForeignKey('task.id', ondelete='CASCADE'),
+                           primary_key=True)
+
+    # The primary key finds the blockers of a task, this one the tasks it blocks
+    __table_args__ = (
+        db.Index("ix_task_dependency_blocker", "blocker_id", "task_id"),
+    )
+
+class TaskAssignee(db.Model):
+    """ User assigned to a task. status and deadline are copies of the task's,
+    kept in sync by the task resources, so the workload of a user is read
+    from the index alone """
+    __tablename__ = "task_assignee"
+    task_id = db.Column(db.Integer,
+                        db.ForeignKey('task.id', ondelete='CASCADE'),
+                        primary_key=True)
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('user.id', ondelete='CASCADE'),
+                        primary_key=True)
+    status = db.Column(db.Integer, nullable=False)
+    deadline = db.Column(db.DateTime, nullable=True)
+
+    # The primary key finds the assignees of a task, this one the workload of a user
+    __table_args__ = (
+        db.Index("ix_task_assignee_workload", "user_id", "status", "deadline"),
+    )
+
+class TaskRevision(db.Model):
+    """ Fields changed by one update of a task, the first revision holds the
+    whole task and every few revisions carry a full snapshot """
+    __tablename__ = "task_revision"
+    task_id = db.Column(db.Integer,
+                        db.ForeignKey('task.id', ondelete='CASCADE'),
+                        primary_key=True)
+    revision = db.Column(db.Integer, primary_key=True)
+    changes = db.Column(db.JSON, nullable=False)
+    snapshot = db.Column(db.JSON(none_as_null=True), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class TaskArchive(db.Model):
+    """ Completed task moved out of the task table by flask archive-tasks. It
+    keeps its id, labels, parent and series are stored by name """
+    __tablename__ = "task_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    unique_task = db.Column(db.String(64), nullable=False, unique=True)
+    title = db.Column(db.String(64), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    deadline = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    position = db.Column(db.String(64), nullable=True)
+    labels = db.Column(db.JSON, nullable=True)
+    parent_task = db.Column(db.String(64), nullable=True)
+    recurrence = db.Column(db.JSON(none_as_null=True), nullable=True)
+    series = db.Column(db.String(64), nullable=True)
+    # No foreign key like the change log, deleting a group removes its
+    # archived tasks explicitly
+    group_id = db.Column(db.Integer, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_task_archive_group", "group_id", "id"),
+    )
+
+# unique_task of the parent of a task, and of the series of an occurrence,
+# only loaded when selected explicitly
+_parent = Task.__table__.alias("parent")
+Task.parent_task = db.column_property(
+    select(_parent.c.unique_task).where(_parent.c.id == Task.parent_id).scalar_subquery(),
+    deferred=True
+)
+_series = Task.__table__.alias("series")
+Task.series = db.column_property(
+    select(_series.c.unique_task).where(_series.c.id == Task.recurrence_id).scalar_subquery(),
+    deferred=True
+)
+
 class UserGroup(db.Model):
     """ UserGroup database model, models from ex. 1 """
     id = db.Column(db.Integer, primary_key=True)
@@ -208,6 +407,12 @@ class UserGroup(db.Model):
     user = db.relationship("User", back_populates="user_groups")
     groups = db.relationship("Group", back_populates="user_groups")
 
+    # A user is in a group at most once, the constraint's index also
+    # finds the groups of a user without scanning all memberships
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "group_id", name="uq_user_group"),
+    )
+
 # from Lovelace
     def serialize(self):
         " Serialize the usergroup, from Lovelace"
@@ -232,9 +437,50 @@ class UserGroup(db.Model):
             }
         return schema
 
+class ChangeLog(db.Model):
+    """ Append-only log of created, updated and deleted users, groups, tasks
+    and memberships, the id is the cursor clients sync from """
+    __tablename__ = "change_log"
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)
+    # unique_user, group id or unique_task, and unique_user for memberships
+    key = db.Column(db.String(64), nullable=False)
+    action = db.Column(db.String(8), nullable=False)
+    changes = db.Column(db.JSON, nullable=True)
+    # No foreign key, the entries of a deleted group must stay readable
+    group_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    # Reads the changes of one group after a cursor
+    __table_args__ = (
+        db.Index("ix_change_log_group", "group_id", "id"),
+    )
+
 @click.command("init-db")
 @with_appcontext
 def init_db_command():
     " Create new tables."
     db.create_all()
 
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    " Create the task search index if needed and rebuild it from the task table."
+    for statement in TASK_SEARCH_DDL:
+        db.session.execute(text(statement))
+    db.session.execute(text("INSERT INTO task_fts(task_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    click.echo("Search index rebuilt")
+
+@click.command("rebuild-group-stats")
+@with_appcontext
+def rebuild_group_stats_command():
+    " Recount the task statistics of every group from the task table."
+    GroupStats.query.delete()
+    db.session.execute(text(
+        "INSERT INTO group_stats (group_id, status, task_count) "
+        "SELECT group_id, status, COUNT(*) FROM task "
+        "WHERE group_id IS NOT NULL GROUP BY group_id, status"
+    ))
+    db.session.commit()
+    click.echo("Group statistics rebuilt")
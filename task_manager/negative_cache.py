@@ -0,0 +1,221 @@
+"""Negative lookup cache for unknown users, groups and tasks.
+
+The ids that exist are kept in memory: group ids in a set, and unique_user
+and unique_task values in Bloom filters, which never report an existing id
+as missing. A request for an id that is not in them is answered with a 404
+without touching the database. The first lookup loads them from the
+database; when they are older than NEGATIVE_CACHE_TTL seconds (0 disables
+the cache) they are rebuilt in a background thread, one at a time, while
+requests keep using the old ones. New ids are added as they are created.
+Deleted ids stay in a Bloom filter until the next rebuild and are looked up
+in the database as usual.
+
+The cache lives in the process, so an id created by another worker process
+may be missing from it. A miss is therefore only trusted for ids older than
+the last rebuild: group ids up to the highest loaded one, and UUIDv7 ids
+created before the rebuild started. The creation time of ids of other
+shapes, like UUIDv4 ones and occurrence ids, is unknown, so misses for them
+are always looked up in the database.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+from flask import current_app
+from sqlalchemy import select
+
+NEGATIVE_CACHE_DEFAULT_TTL = 30
+# Ids created this long before a rebuild may still have been uncommitted
+# when it ran, misses for them are looked up in the database
+NEGATIVE_CACHE_MARGIN = 5
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+
+
+def _uuid7_time(value):
+    " Creation time of a UUIDv7 in seconds since the epoch, None for other values"
+    try:
+        parsed = uuid.UUID(value)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return (parsed.int >> 80) / 1000 if parsed.version == 7 else None
+
+
+class BloomFilter:
+    """Set membership with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, BLOOM_MIN_CAPACITY)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        " Bit positions of a key, double hashing on one blake2b digest"
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        " Add a key"
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & 1 << (position & 7)
+                   for position in self._positions(key))
+
+
+class KnownIds:
+    """The ids of one kind known to exist, rebuilt with load() after the TTL
+
+    Only one rebuild runs at a time. Exact sets hold integer ids.
+    """
+
+    def __init__(self, app, load, exact=False):
+        self.app = app
+        self.load = load
+        self.exact = exact
+        self._ids = None
+        self._built_at = None
+        self._started_at = None
+        self._newest = None
+        self._deleted = set()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+
+    def _rebuild(self):
+        " Load all ids, keeping the ids created while loading, the caller holds _rebuilding"
+        try:
+            started_at = time.time()
+            with self._lock:
+                self._pending = []
+            values = self.load()
+            if self.exact:
+                ids = set(values)
+            else:
+                ids = BloomFilter(len(values) * 2)
+                for value in values:
+                    ids.add(value)
+            with self._lock:
+                for value in self._pending:
+                    ids.add(value)
+                self._ids = ids
+                self._pending = None
+                self._started_at = started_at
+                self._newest = max(values, default=0) if self.exact else None
+                self._deleted = set()
+                self._built_at = time.monotonic()
+        finally:
+            self._rebuilding.release()
+
+    def _rebuild_in_background(self):
+        " Rebuild in a thread of its own with an app context of its own"
+        def run():
+            with self.app.app_context():
+                try:
+                    self._rebuild()
+                except Exception:  # pylint: disable=broad-except
+                    self.app.logger.exception("Rebuilding the negative cache failed")
+        threading.Thread(target=run, name="negative-cache-rebuild", daemon=True).start()
+
+    def _is_newer(self, value):
+        " Whether the id may have been created after the last rebuild started"
+        if self.exact:
+            return value > self._newest and value not in self._deleted
+        created = _uuid7_time(value)
+        return created is None or created >= self._started_at - NEGATIVE_CACHE_MARGIN
+
+    def _refresh(self, ttl):
+        " Load the ids or start a rebuild when due, False while the first load runs elsewhere"
+        if self._ids is None:
+            # The first lookup loads the ids, concurrent ones go to the database
+            if not self._rebuilding.acquire(blocking=False):
+                return False
+            self._rebuild()
+        elif time.monotonic() - self._built_at > ttl and self._rebuilding.acquire(blocking=False):
+            self._rebuild_in_background()
+        return True
+
+    def might_exist(self, value, ttl):
+        " False only if the id certainly does not exist"
+        if not self._refresh(ttl):
+            return True
+        with self._lock:
+            return value in self._ids or self._is_newer(value)
+
+    def known(self, value, ttl):
+        " Whether the id was loaded or created in this process"
+        if not self._refresh(ttl):
+            return False
+        with self._lock:
+            return value in self._ids
+
+    def add(self, value):
+        " Remember a created id"
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(value)
+            if self._ids is not None:
+                self._ids.add(value)
+
+    def discard(self, value):
+        " Forget a deleted id, only possible for exact sets"
+        with self._lock:
+            if self.exact and self._ids is not None:
+                self._ids.discard(value)
+                self._deleted.add(value)
+
+
+class NegativeCache:
+    """Flask extension keeping the known ids of users, groups and tasks per app"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        " Register the default TTL and the empty id sets"
+        from task_manager import db
+        from task_manager.models import Group, Task, TaskArchive, User
+
+        def loader(*columns):
+            return lambda: [value for column in columns
+                            for value in db.session.execute(select(column)).scalars()]
+
+        app.config.setdefault("NEGATIVE_CACHE_TTL", NEGATIVE_CACHE_DEFAULT_TTL)
+        app.extensions["negative_cache"] = {
+            "user": KnownIds(app, loader(User.unique_user)),
+            "group": KnownIds(app, loader(Group.id), exact=True),
+            # Archived tasks are still read by their unique_task
+            "task": KnownIds(app, loader(Task.unique_task, TaskArchive.unique_task)),
+        }
+
+    @staticmethod
+    def might_exist(kind, value):
+        " False only if the user, group or task certainly does not exist"
+        ttl = current_app.config["NEGATIVE_CACHE_TTL"]
+        if not ttl:
+            return True
+        return current_app.extensions["negative_cache"][kind].might_exist(value, ttl)
+
+    @staticmethod
+    def known(kind, value):
+        " Whether the user, group or task was loaded or created in this process"
+        ttl = current_app.config["NEGATIVE_CACHE_TTL"]
+        if not ttl:
+            return False
+        return current_app.extensions["negative_cache"][kind].known(value, ttl)
+
+    @staticmethod
+    def add(kind, value):
+        " Remember a created user, group or task"
+        current_app.extensions["negative_cache"][kind].add(value)
+
+    @staticmethod
+    def discard(kind, value):
+        " Forget a deleted group"
+        current_app.extensions["negative_cache"][kind].discard(value)
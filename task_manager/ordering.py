@@ -0,0 +1,123 @@
+"""Manual ordering of the tasks of a group with fractional indexing.
+
+Each task has a position key, a string of base 62 digits compared as text.
+A key between any two others always exists, so moving a task only writes
+the moved row. Keys never end with the smallest digit, which keeps room
+below every key. Repeated moves into the same gap make keys longer, and a
+group is rebalanced to short, evenly spaced keys once a key grows past
+POSITION_MAX_LENGTH characters, or with flask rebalance-task-positions.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, select, update
+from task_manager import db
+from task_manager.models import Task
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+POSITION_MAX_LENGTH = 12
+
+
+def _midpoint(low, high):
+    " A key between low and high (None for no upper bound), low may be empty"
+    if high is not None:
+        # Keep the common prefix, treating missing digits of low as zeros
+        common = 0
+        while common < len(high) and (low[common] if common < len(low) else DIGITS[0]) \
+                == high[common]:
+            common += 1
+        if common:
+            return high[:common] + _midpoint(low[common:], high[common:])
+    digit_low = DIGITS.index(low[0]) if low else 0
+    digit_high = DIGITS.index(high[0]) if high is not None else len(DIGITS)
+    if digit_high - digit_low > 1:
+        return DIGITS[(digit_low + digit_high) // 2]
+    # Consecutive digits
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[digit_low] + _midpoint(low[1:], None)
+
+
+def key_between(before, after):
+    """A position key sorting after before and before after, either may be None"""
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"{before!r} is not before {after!r}")
+    return _midpoint(before or "", after)
+
+
+def evenly_spaced_keys(count):
+    """count short keys in ascending order, spread over the key space"""
+    width = 1
+    while len(DIGITS) ** width <= count:
+        width += 1
+    step = len(DIGITS) ** width // (count + 1)
+    keys = []
+    for index in range(1, count + 1):
+        value = index * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, len(DIGITS))
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
+
+
+def last_position(group_id):
+    """The position after the last task of a group"""
+    last = db.session.execute(
+        select(func.max(Task.position)).where(Task.group_id == group_id)
+    ).scalar()
+    return key_between(last, None)
+
+
+def rebalance_group(group_id):
+    """Give the tasks of a group evenly spaced keys in their current order.
+    Tasks without a position keep their creation order after the others"""
+    ids = db.session.execute(
+        select(Task.id).where(Task.group_id == group_id)
+        .order_by(Task.position.is_(None), Task.position, Task.id)
+    ).scalars().all()
+    if ids:
+        db.session.execute(
+            update(Task),
+            [{"id": task_id, "position": key}
+             for task_id, key in zip(ids, evenly_spaced_keys(len(ids)))]
+        )
+
+
+def move_task(task, after):
+    """Place a task right after the task after, or first if after is None.
+    Only the moved task is written, unless the group needs rebalancing"""
+    group_id = task.group_id
+    if db.session.execute(
+            select(Task.id).where(Task.group_id == group_id, Task.position.is_(None)).limit(1)
+    ).first():
+        # Tasks created before positions existed get one first
+        rebalance_group(group_id)
+        db.session.refresh(task)
+        if after is not None:
+            db.session.refresh(after)
+
+    low = after.position if after is not None else None
+    following = select(func.min(Task.position)).where(Task.group_id == group_id,
+                                                       Task.id != task.id)
+    if low is not None:
+        following = following.where(Task.position > low)
+    task.position = key_between(low, db.session.execute(following).scalar())
+    return len(task.position) > POSITION_MAX_LENGTH
+
+
+@click.command("rebalance-task-positions")
+@click.option("--max-length", default=POSITION_MAX_LENGTH, show_default=True,
+              help="Rebalance the groups with a position key longer than this.")
+@with_appcontext
+def rebalance_task_positions_command(max_length):
+    " Give the tasks of the groups with long position keys evenly spaced keys."
+    group_ids = db.session.execute(
+        select(Task.group_id).where(Task.group_id.is_not(None))
+        .group_by(Task.group_id)
+        .having(func.max(func.coalesce(func.length(Task.position), max_length + 1)) > max_length)
+    ).scalars().all()
+    for group_id in group_ids:
+        rebalance_group(group_id)
+    db.session.commit()
+    click.echo(f"Rebalanced {len(group_ids)} groups")
@@ -0,0 +1,240 @@
+"""Recurring tasks.
+
+A series is a task with a recurrence rule, a subset of RFC 5545 RRULE:
+
+    {"freq": "daily" | "weekly" | "monthly", "interval": 1,
+     "until": "2025-12-31T23:59:59", "count": 10}
+
+The deadline of the series is its first occurrence. Occurrences are never
+stored up front: they are computed from the rule for the requested window
+and addressed as <unique_task>@<date>. An occurrence becomes a task of its
+own (with recurrence_id and occurrence set) only when it is edited, and
+deleting one adds its date to the exdates of the rule, so a long running
+series costs one row plus the occurrences somebody touched.
+"""
+import calendar
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import select, update
+from task_manager import db
+from task_manager.changes import record_change
+from task_manager.history import record_revision, task_state
+from task_manager.labels import set_task_labels
+from task_manager.models import Task
+from task_manager.ordering import last_position
+from task_manager.stats import adjust_task_count
+from task_manager.utils import lookup_task
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+OCCURRENCE_COLUMNS = ("unique_task", "title", "description", "status", "deadline",
+                      "group_id", "series", "virtual")
+OCCURRENCE_DEFAULT_DAYS = 30
+OCCURRENCE_MAX_DAYS = 366
+
+
+def _positive_int(value):
+    " Whether value is an integer of at least 1, booleans excluded"
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+
+def parse_rule(rule):
+    """Validate a recurrence rule, returns it normalised, None removes the rule
+
+    Raises ValueError if the rule is not valid.
+    """
+    if rule is None:
+        return None
+    if not isinstance(rule, dict):
+        raise ValueError("recurrence must be an object or null")
+    unknown = set(rule).difference(("freq", "interval", "until", "count"))
+    if unknown:
+        raise ValueError("Unknown recurrence field(s): " + ", ".join(sorted(unknown)))
+    if rule.get("freq") not in FREQUENCIES:
+        raise ValueError("recurrence freq must be daily, weekly or monthly")
+    parsed = {"freq": rule["freq"], "interval": rule.get("interval", 1)}
+    if not _positive_int(parsed["interval"]):
+        raise ValueError("recurrence interval must be a positive integer")
+    if rule.get("until") is not None:
+        if not isinstance(rule["until"], str):
+            raise ValueError("recurrence until must be an ISO date")
+        parsed["until"] = datetime.fromisoformat(rule["until"]).isoformat()
+    if rule.get("count") is not None:
+        if not _positive_int(rule["count"]):
+            raise ValueError("recurrence count must be a positive integer")
+        parsed["count"] = rule["count"]
+    return parsed
+
+
+def _add_months(value, months):
+    " Move a datetime by whole months, clamping the day to the end of the month"
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month,
+                         day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def _nth(start, rule, index):
+    " The occurrence number index of a series starting at start"
+    steps = rule["interval"] * index
+    if rule["freq"] == "monthly":
+        return _add_months(start, steps)
+    return start + timedelta(days=steps * (7 if rule["freq"] == "weekly" else 1))
+
+
+def _first_index(start, rule, since):
+    " Index of an occurrence at or just before since, so the window is reached at once"
+    if since <= start:
+        return 0
+    if rule["freq"] == "monthly":
+        months = (since.year - start.year) * 12 + since.month - start.month
+        return max(months // rule["interval"] - 1, 0)
+    days = 7 if rule["freq"] == "weekly" else 1
+    return (since - start).days // (rule["interval"] * days)
+
+
+def occurrences(start, rule, since, until):
+    """Yield the occurrences of a series starting at start in [since, until)
+
+    The first occurrence of the window is computed directly, so the cost
+    depends on the window and not on how long the series has been running.
+    Like in RRULE, count also counts the skipped exdates.
+    """
+    last = datetime.fromisoformat(rule["until"]) if "until" in rule else None
+    count = rule.get("count")
+    exdates = set(rule.get("exdates", ()))
+    index = _first_index(start, rule, since)
+    while count is None or index < count:
+        when = _nth(start, rule, index)
+        if when >= until or (last is not None and when > last):
+            return
+        if when >= since and when.date().isoformat() not in exdates:
+            yield when
+        index += 1
+
+
+def occurrence_id(unique_task, when):
+    """The id of an occurrence of a series"""
+    return f"{unique_task}@{when.date().isoformat()}"
+
+
+def split_occurrence_id(value):
+    """Split an occurrence id into (unique_task, date), None if it is not one"""
+    unique_task, separator, day = value.rpartition("@")
+    if not separator or not unique_task:
+        return None
+    try:
+        return unique_task, date.fromisoformat(day)
+    except ValueError:
+        return None
+
+
+def find_occurrence(group_id, value):
+    """Resolve an occurrence id of a series in the group to (series, datetime),
+    None if the series does not exist or has no occurrence on that date"""
+    parts = split_occurrence_id(value)
+    if parts is None:
+        return None
+    series, error = lookup_task(group_id, parts[0])
+    if error or not series.recurrence or series.deadline is None:
+        return None
+    day = datetime.combine(parts[1], time.min)
+    when = next(occurrences(series.deadline, series.recurrence, day,
+                            day + timedelta(days=1)), None)
+    if when is None:
+        return None
+    return series, when
+
+
+def materialise(series, when):
+    """Store an occurrence of a series as a task of its own, so it can be edited
+
+    Raises IntegrityError from the flush if another request stored it first.
+    """
+    now = datetime.now()
+    task = Task(
+        unique_task=occurrence_id(series.unique_task, when),
+        title=series.title,
+        description=series.description,
+        status=series.status,
+        deadline=when,
+        created_at=now,
+        updated_at=now,
+        position=last_position(series.group_id),
+        parent_id=series.parent_id,
+        recurrence_id=series.id,
+        occurrence=when,
+        group_id=series.group_id
+    )
+    db.session.add(task)
+    db.session.flush()
+    adjust_task_count(series.group_id, task.status, 1)
+    labels = series.labels
+    if labels:
+        set_task_labels(task, labels)
+    record_change("task", task.unique_task, "create",
+                  {"title": task.title, "description": task.description,
+                   "status": task.status, "deadline": when, "position": task.position,
+                   "labels": labels, "series": series.unique_task},
+                  series.group_id)
+    return task
+
+
+def skip_occurrence(series, when):
+    """Add the date of an occurrence to the exdates of its series"""
+    skip_occurrences(series, [when])
+
+
+def skip_occurrences(series, whens):
+    """Add the dates of occurrences to the exdates of their series"""
+    before = task_state(series.id)
+    rule = dict(series.recurrence)
+    rule["exdates"] = sorted(set(rule.get("exdates", ()))
+                             | {when.date().isoformat() for when in whens})
+    series.recurrence = rule
+    db.session.flush()
+    record_change("task", series.unique_task, "update", {"recurrence": rule}, series.group_id)
+    record_revision(series.id, before, {"recurrence": rule})
+
+
+def detach_occurrences(task_id):
+    """Keep the stored occurrences of a series that is about to be deleted as plain tasks"""
+    db.session.execute(
+        update(Task).where(Task.recurrence_id == task_id).values(recurrence_id=None)
+    )
+
+
+def fetch_occurrences(group_id, since, until):
+    """Rows of OCCURRENCE_COLUMNS for the tasks of a group due in [since, until)
+
+    Stored tasks come from the deadline index, series are expanded for the
+    window, skipping the occurrences already stored as tasks. Rows are
+    sorted by deadline.
+    """
+    rows = [
+        tuple(row) + (False,) for row in db.session.execute(
+            select(*(getattr(Task, name) for name in OCCURRENCE_COLUMNS[:-1]))
+            .where(Task.group_id == group_id, Task.recurrence.is_(None),
+                   Task.deadline >= since, Task.deadline < until)
+        )
+    ]
+    series_rows = db.session.execute(
+        select(Task.id, Task.unique_task, Task.title, Task.description, Task.status,
+               Task.deadline, Task.recurrence)
+        .where(Task.group_id == group_id, Task.recurrence.is_not(None), Task.deadline < until)
+    ).all()
+    if series_rows:
+        stored = {
+            (recurrence_id, when.date()) for recurrence_id, when in db.session.execute(
+                select(Task.recurrence_id, Task.occurrence)
+                .where(Task.recurrence_id.in_([row.id for row in series_rows]),
+                       Task.occurrence >= since, Task.occurrence < until)
+            )
+        }
+        for row in series_rows:
+            for when in occurrences(row.deadline, row.recurrence, since, until):
+                if (row.id, when.date()) not in stored:
+                    rows.append((occurrence_id(row.unique_task, when), row.title,
+                                 row.description, row.status, when, group_id,
+                                 row.unique_task, True))
+    rows.sort(key=lambda row: (row[4], row[0]))
+    return rows
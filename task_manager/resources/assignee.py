@@ -0,0 +1,65 @@
+"""This module contains the resources for the assignees of a task."""
+from flask import request
+from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
+from task_manager import db
+from task_manager.assignees import (ASSIGNEE_COLUMNS, assign_task, fetch_task_assignees,
+                                    task_assignee_ids, unassign_task)
+from task_manager.changes import record_change
+from task_manager.serializers import encode_rows
+from task_manager.utils import lookup_membership, lookup_task, lookup_task_row
+
+
+class GroupTaskAssignees(Resource):
+    "Resource class for the users a task is assigned to"
+
+    def get(self, group_id, unique_task):
+        """Get the users the task is assigned to"""
+        row, error = lookup_task_row(group_id, unique_task, ("id",))
+        if error:
+            return error
+        return encode_rows(fetch_task_assignees(row[0]), ASSIGNEE_COLUMNS), 200
+
+    def post(self, group_id, unique_task):
+        """Assign the task to the member {"user": unique_user} of the group"""
+        if not request.is_json:
+            return {"error": "Request content type must be JSON"}, 415
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get("user"), str):
+            return {"error": "user is required"}, 400
+        task, error = lookup_task(group_id, unique_task)
+        if error:
+            return error
+        user, membership, error = lookup_membership(group_id, data["user"])
+        if error or not membership:
+            return {"error": "user must be a member of the group"}, 400
+
+        assign_task(task, user)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "Task is already assigned to the user"}, 400
+        record_change("task", unique_task, "update",
+                      {"assignees": task_assignee_ids(task.id)}, group_id)
+        db.session.commit()
+        return {"message": "Task assigned successfully"}, 201
+
+
+class GroupTaskAssignee(Resource):
+    "Resource class for a single assignee of a task"
+
+    def delete(self, group_id, unique_task, unique_user):
+        """Unassign the task from the user"""
+        task, error = lookup_task(group_id, unique_task)
+        if error:
+            return error
+        user, _, error = lookup_membership(group_id, unique_user)
+        if error:
+            return error
+        if not unassign_task(task.id, user.id):
+            return {"error": "Task is not assigned to the user"}, 404
+        record_change("task", unique_task, "update",
+                      {"assignees": task_assignee_ids(task.id)}, group_id)
+        db.session.commit()
+        return {"message": "Task unassigned successfully"}, 204
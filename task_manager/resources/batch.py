@@ -0,0 +1,135 @@
+"""This module contains the resource for batch requests."""
+from contextlib import contextmanager
+from flask import current_app, request
+from flask_restful import Resource
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RoutingException
+from task_manager import db
+from task_manager.events import publish_events
+
+BATCH_METHODS = ("GET", "POST", "PUT", "DELETE")
+BATCH_DEFAULT_MAX_REQUESTS = 50
+
+
+@contextmanager
+def _atomic():
+    """Run the sub-requests in an app context whose session joins one outer transaction
+
+    Resources keep calling db.session.commit(), which then only releases a
+    savepoint. The outer transaction is committed when the block exits
+    normally and the caller has not rolled it back, and only then are the
+    live events of the sub-requests published.
+    """
+    with db.engine.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # pysqlite issues BEGIN on its own and loses savepoints, take over
+            driver = connection.connection.driver_connection
+            isolation_level = driver.isolation_level
+            driver.isolation_level = None
+        transaction = connection.begin()
+        if sqlite:
+            connection.exec_driver_sql("BEGIN")
+        try:
+            with current_app.app_context():
+                db.session.registry.set(
+                    Session(bind=connection, join_transaction_mode="create_savepoint"))
+                yield transaction
+            if transaction.is_active:
+                transaction.commit()
+                publish_events(connection.info.pop("events", []))
+        finally:
+            if transaction.is_active:
+                transaction.rollback()
+            connection.info.pop("events", None)
+            if sqlite:
+                driver.isolation_level = isolation_level
+
+
+def _dispatch(method, path, body):
+    " Run one sub-request through the URL map, returns (status, body)"
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+    with app.test_request_context(path, method=method, json=body,
+                                  headers={"Accept": "application/json"}):
+        try:
+            response = app.full_dispatch_request()
+        except Exception:  # pylint: disable=broad-except
+            app.logger.exception("Batch request %s %s failed", method, path)
+            return 500, {"error": "Internal server error"}
+    return response.status_code, response.get_json(silent=True)
+
+
+def _is_streaming(method, path):
+    " Whether a path is routed to a resource answering with a stream"
+    adapter = current_app.url_map.bind_to_environ(request.environ)
+    try:
+        endpoint, _ = adapter.match(path.split("?")[0], method=method)
+    except (HTTPException, RoutingException):
+        return False
+    view_class = getattr(current_app.view_functions[endpoint], "view_class", None)
+    return getattr(view_class, "streaming", False)
+
+
+def _validate(items):
+    " Check the batch items, returns an error message or None"
+    if not isinstance(items, list) or not items:
+        return "Request body must be a non-empty array of requests"
+    maximum = current_app.config.get("BATCH_MAX_REQUESTS", BATCH_DEFAULT_MAX_REQUESTS)
+    if len(items) > maximum:
+        return f"At most {maximum} requests can be batched"
+    for index, item in enumerate(items):
+        if (not isinstance(item, dict)
+                or item.get("method", "GET").upper() not in BATCH_METHODS
+                or not isinstance(item.get("path"), str)
+                or not item["path"].startswith("/")):
+            return f"Request {index} must have a method and a path starting with /"
+        if item["path"].split("?")[0].rstrip("/") == request.path.rstrip("/"):
+            return "Batch requests cannot be nested"
+        if _is_streaming(item.get("method", "GET").upper(), item["path"]):
+            return f"Request {index} is a stream, which cannot be batched"
+    return None
+
+
+class Batch(Resource):
+    "Resource class for running many API requests in one round trip"
+
+    def post(self):
+        """Run an array of {method, path, body} requests in order and return
+        their {status, body} responses. With ?atomic=1 all of them run in one
+        database transaction that is rolled back if any of them fails"""
+        if not request.is_json:
+            return {"error": "Request content type must be JSON"}, 415
+        items = request.get_json()
+        error = _validate(items)
+        if error:
+            return {"error": error}, 400
+
+        if request.args.get("atomic") not in ("1", "true"):
+            responses = []
+            for item in items:
+                # Each item gets its own session, which is rolled back when its
+                # app context ends, so a failed item cannot leave half applied
+                # changes for the next one to commit
+                with current_app.app_context():
+                    responses.append(self._run(item))
+            return responses, 200
+
+        responses = []
+        with _atomic() as transaction:
+            for index, item in enumerate(items):
+                responses.append(self._run(item))
+                if responses[-1]["status"] >= 400:
+                    transaction.rollback()
+                    return {
+                        "error": f"Request {index} failed, no changes were made",
+                        "responses": responses
+                    }, 400
+        return responses, 200
+
+    @staticmethod
+    def _run(item):
+        " Dispatch a single batch item"
+        status, body = _dispatch(item.get("method", "GET").upper(), item["path"],
+                                 item.get("body"))
+        return {"status": status, "body": body}
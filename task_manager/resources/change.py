@@ -0,0 +1,30 @@
+"""This module contains the resource for the change feed."""
+from flask_restful import Resource
+from task_manager.changes import (CHANGE_COLUMNS, CHANGES_DEFAULT_LIMIT, CHANGES_MAX_LIMIT,
+                                  fetch_changes)
+from task_manager.utils import int_arg
+from task_manager.serializers import encode_rows
+
+
+class ChangeFeed(Resource):
+    "Resource class for the changes since a cursor"
+
+    def get(self):
+        """Get the creates, updates and deletes after ?since=, oldest first.
+        ?group= narrows them to one group, the next cursor is returned with them"""
+        try:
+            since = int_arg("since", 0)
+            group_id = int_arg("group", None)
+            limit = int_arg("limit", CHANGES_DEFAULT_LIMIT, CHANGES_MAX_LIMIT)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+
+        # One extra row tells if there is more to read
+        rows = fetch_changes(since, group_id, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "changes": encode_rows(rows, CHANGE_COLUMNS),
+            "cursor": rows[-1][0] if rows else since,
+            "has_more": has_more
+        }, 200
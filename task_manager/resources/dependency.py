@@ -0,0 +1,93 @@
+"""This module contains the resources for subtasks and task dependencies."""
+from flask import request
+from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
+from task_manager import db
+from task_manager.changes import record_change
+from task_manager.dependencies import (creates_dependency_cycle, direct_blockers, fetch_blockers,
+                                       fetch_subtasks, remove_blocker)
+from task_manager.models import TaskDependency
+from task_manager.serializers import encode_rows
+from task_manager.utils import (TASK_COLUMNS, TASK_EXTRA_COLUMNS, TASK_NOT_FOUND, lookup_task,
+                                lookup_task_row, requested_columns)
+
+
+class GroupTaskSubtasks(Resource):
+    "Resource class for the subtree of a task"
+
+    def get(self, group_id, unique_task):
+        """Get every subtask below a task with its depth, level by level,
+        optionally only the ?fields= asked for"""
+        try:
+            columns = requested_columns(TASK_COLUMNS, key="unique_task",
+                                        extra=TASK_EXTRA_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        row, error = lookup_task_row(group_id, unique_task, ("id",))
+        if error:
+            return error
+        return encode_rows(fetch_subtasks(row[0], columns), columns + ("depth",)), 200
+
+
+class GroupTaskBlockers(Resource):
+    "Resource class for the tasks blocking a task"
+
+    def get(self, group_id, unique_task):
+        """Get every task blocking a task, directly or through other blockers,
+        optionally only the ?fields= asked for"""
+        try:
+            columns = requested_columns(TASK_COLUMNS, key="unique_task",
+                                        extra=TASK_EXTRA_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        row, error = lookup_task_row(group_id, unique_task, ("id",))
+        if error:
+            return error
+        return encode_rows(fetch_blockers(row[0], columns), columns), 200
+
+    def post(self, group_id, unique_task):
+        """Make the task {"blocker": unique_task} block the task,
+        refusing dependencies that would make a task wait for itself"""
+        if not request.is_json:
+            return {"error": "Request content type must be JSON"}, 415
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get("blocker"), str):
+            return {"error": "blocker is required"}, 400
+        task, error = lookup_task(group_id, unique_task)
+        if error:
+            return error
+        blocker, error = lookup_task(group_id, data["blocker"])
+        if error:
+            return {"error": "blocker must be a task of the group"}, 400
+        if creates_dependency_cycle(task.id, blocker.id):
+            return {"error": "The dependency would make the task wait for itself"}, 400
+
+        db.session.add(TaskDependency(task_id=task.id, blocker_id=blocker.id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "Dependency already exists"}, 400
+        record_change("task", unique_task, "update",
+                      {"blockers": direct_blockers(task.id)}, group_id)
+        db.session.commit()
+        return {"message": "Dependency added successfully"}, 201
+
+
+class GroupTaskBlocker(Resource):
+    "Resource class for a single dependency of a task"
+
+    def delete(self, group_id, unique_task, blocker):
+        """Remove the dependency of the task on blocker"""
+        task, error = lookup_task(group_id, unique_task)
+        if error:
+            return error
+        blocking, error = lookup_task(group_id, blocker)
+        if error:
+            return TASK_NOT_FOUND
+        if not remove_blocker(task.id, blocking.id):
+            return {"error": "Dependency not found"}, 404
+        record_change("task", unique_task, "update",
+                      {"blockers": direct_blockers(task.id)}, group_id)
+        db.session.commit()
+        return {"message": "Dependency removed successfully"}, 204
@@ -0,0 +1,74 @@
+"""This module contains the resource for the live event stream of a group."""
+from flask import Response, current_app, request, stream_with_context
+from flask_restful import Resource
+from task_manager.changes import CHANGES_MAX_LIMIT, fetch_changes
+from task_manager.events import (EVENT_ENTITIES, EVENTS_DEFAULT_QUEUE_SIZE, broker,
+                                 event_item)
+from task_manager.serializers import dumps
+from task_manager.utils import lookup_group
+from task_manager import db
+
+EVENTS_DEFAULT_KEEPALIVE = 15
+
+# Sent when the stream cannot continue without a gap, the client catches up
+# with GET /api/changes and reconnects
+RESYNC_EVENT = "event: resync\ndata: {}\n\n"
+
+
+def format_event(item):
+    " Format an event in the text/event-stream format"
+    return (f"id: {item['cursor']}\nevent: {item['entity']}\n"
+            f"data: {dumps(item).decode()}\n\n")
+
+
+class GroupEvents(Resource):
+    "Resource class for the Server-Sent Events stream of a group"
+    # Checked by the batch resource, a stream cannot be a batch item
+    streaming = True
+
+    def get(self, group_id):
+        """Stream the task and membership changes of a group as they are committed.
+        A reconnecting client gets the changes after its Last-Event-ID first"""
+        _, error = lookup_group(group_id)
+        if error:
+            return error
+        try:
+            last_event_id = int(request.headers.get("Last-Event-ID", ""))
+        except ValueError:
+            last_event_id = None
+        config = current_app.config
+        keepalive = config.get("EVENTS_KEEPALIVE", EVENTS_DEFAULT_KEEPALIVE)
+
+        # Subscribe before reading the missed changes so nothing falls in between
+        subscriber = broker.subscribe(
+            group_id, config.get("EVENTS_QUEUE_SIZE", EVENTS_DEFAULT_QUEUE_SIZE))
+        missed = []
+        if last_event_id is not None:
+            missed = fetch_changes(last_event_id, group_id, CHANGES_MAX_LIMIT + 1)
+        db.session.remove()
+
+        def stream():
+            try:
+                sent = last_event_id or 0
+                yield f"retry: {keepalive * 1000}\n\n"
+                if len(missed) > CHANGES_MAX_LIMIT:
+                    yield RESYNC_EVENT
+                    return
+                for row in missed:
+                    sent = row.id
+                    if row.entity in EVENT_ENTITIES:
+                        yield format_event(event_item(row))
+                while not subscriber.dropped:
+                    item = subscriber.get(keepalive)
+                    if item is None:
+                        yield ": keepalive\n\n"
+                    elif item["cursor"] > sent:
+                        sent = item["cursor"]
+                        yield format_event(item)
+                # Too slow to keep up, the client resumes from its last event id
+                yield RESYNC_EVENT
+            finally:
+                broker.unsubscribe(group_id, subscriber)
+
+        return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
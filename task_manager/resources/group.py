@@ -1,25 +1,65 @@
 """This module contains the resources classes for the Group model."""
 
-import uuid
 from flask import request
 from flask_restful import Resource
-from task_manager.models import Group, User, UserGroup, Task
-from task_manager import db
+from sqlalchemy.exc import IntegrityError
+from task_manager.models import Group, GroupStats, UserGroup, Task
+from task_manager import db, negative_cache
+from task_manager.archive import remove_group_archive
+from task_manager.assignees import remove_group_assignees, remove_user_assignments
+from task_manager.changes import record_change
+from task_manager.dependencies import remove_group_links
+from task_manager.history import remove_group_revisions
+from task_manager.labels import remove_group_labels
+from task_manager.stats import fetch_group_stats
+from task_manager.timeline import invalidate_timeline
+from task_manager.utils import (GROUP_COLUMNS, GROUP_NOT_FOUND, MEMBER_COLUMNS, TASK_COLUMNS,
+                                 fetch_group_members, fetch_group_tasks, fetch_members,
+                                 fetch_row, fetch_rows, lookup_group, lookup_membership,
+                                 new_unique_id, requested_columns)
+from task_manager.serializers import encode_row, encode_rows
+
+# Related resources that can be embedded in a group with ?embed=
+GROUP_EMBEDS = ("members", "tasks", "stats")
+
+
+def _embedded(group_id, embeds):
+    " Load each embedded relation of a group with one query of its own"
+    related = {}
+    if "members" in embeds:
+        related["members"] = encode_rows(fetch_members(group_id), MEMBER_COLUMNS)
+    if "tasks" in embeds:
+        related["tasks"] = encode_rows(fetch_group_tasks(group_id, TASK_COLUMNS), TASK_COLUMNS)
+    if "stats" in embeds:
+        related["stats"] = fetch_group_stats([group_id])[group_id]
+    return related
+
 
 class GroupItem(Resource):
     " Resource class for get, put, delete methods for Group"
 
     # getting group
     def get(self, group_id):
-        """Get a group by its ID."""
-        group = db.session.get(Group, group_id)
-        if not group:
+        """Get a group by its ID, optionally only the ?fields= asked for.
+        ?embed=members,tasks,stats includes the related resources in the response"""
+        try:
+            columns = requested_columns(GROUP_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        embeds = {name.strip() for name in request.args.get("embed", "").split(",")
+                  if name.strip()}
+        unknown = embeds.difference(GROUP_EMBEDS)
+        if unknown:
+            return {"error": "Unknown embed(s): " + ", ".join(sorted(unknown))}, 400
+
+        if not negative_cache.might_exist("group", group_id):
+            return GROUP_NOT_FOUND
+        row = fetch_row(Group, columns, Group.id == group_id)
+        if not row:
             return {"error": "Group not found"}, 404
-        return {
-            "id": group.id,
-            "name": group.name,
-            "unique_group": group.unique_group
-        }, 200
+        group = encode_row(row, columns)
+        group.update(_embedded(group_id, embeds))
+        return group, 200
 
     # updating group information
     def put(self, group_id):
@@ -27,9 +67,9 @@ class GroupItem(Resource):
         if not request.is_json:
             return {"error": "Request content type must be JSON"}, 415
         data = request.get_json()
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
+        group, error = lookup_group(group_id)
+        if error:
+            return error
         if "name" in data:
             if not isinstance(data["name"], str):
                 return {"error": "Name must be a string"}, 400
@@ -39,6 +79,9 @@ class GroupItem(Resource):
                 return {"error": "unique_group already exists"}, 400
             group.unique_group = data["unique_group"]
 
+        record_change("group", group_id, "update",
+                      {name: data[name] for name in ("name", "unique_group") if name in data},
+                      group_id)
         db.session.commit()
         return {
             "message": "Group updated successfully"
@@ -47,30 +90,44 @@ class GroupItem(Resource):
     # deleting group
     def delete(self, group_id):
         """Deletes a group by its ID"""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        # Delete all tasks associated with the group
+        group, error = lookup_group(group_id)
+        if error:
+            return error
+
+        # Delete all tasks associated with the group, their labels,
+        # dependencies, assignees, history and statistics, and the archived tasks
+        remove_group_labels(group_id)
+        remove_group_links(group_id)
+        remove_group_assignees(group_id)
+        remove_group_revisions(group_id)
+        remove_group_archive(group_id)
         Task.query.filter_by(group_id=group_id).delete()
+        GroupStats.query.filter_by(group_id=group_id).delete()
 
         # Delete the group
         db.session.delete(group)
+        record_change("group", group_id, "delete", group_id=group_id)
         db.session.commit()
+        negative_cache.discard("group", group_id)
+        invalidate_timeline(group_id)
         return {"message": "Group deleted successfully"}, 204
 
 class GroupCollection(Resource):
     "Resource class for get method for GroupCollection"
     # getting all groups
     def get(self):
-        """Get all groups"""
-        groups = Group.query.all()
-        group_list = [{
-            "id": group.id,
-            "name": group.name,
-            "unique_group": group.unique_group
-        } for group in groups]
-        return group_list, 200
+        """Get all groups, optionally only the ?fields= asked for.
+        With ?with_stats=1 the task statistics of each group are included"""
+        try:
+            columns = requested_columns(GROUP_COLUMNS, key="id")
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        groups = encode_rows(fetch_rows(Group, columns), columns)
+        if request.args.get("with_stats") in ("1", "true"):
+            stats = fetch_group_stats([group["id"] for group in groups])
+            for group in groups:
+                group["stats"] = stats[group["id"]]
+        return groups, 200
 
     # creating group
     def post(self):
@@ -85,9 +142,7 @@ class GroupCollection(Resource):
             return {"error": "Incomplete request - missing name"}, 400
         except TypeError:
             return {"error": "Invalid request - name must be a string"}, 400
-        new_uuid = str(uuid.uuid4())
-        if Group.query.filter_by(unique_group=new_uuid).first():
-            new_uuid = str(uuid.uuid4())
+        new_uuid = new_unique_id("group")
 
         group = Group(name=name, unique_group=new_uuid)
         db.session.add(group)
@@ -97,7 +152,10 @@ class GroupCollection(Resource):
          # Assuming user_id=1 is the admin user
         user_group = UserGroup(user_id=1, group_id=group.id, role="admin")
         db.session.add(user_group)
+        record_change("group", group.id, "create",
+                      {"name": name, "unique_group": new_uuid}, group.id)
         db.session.commit()
+        negative_cache.add("group", group.id)
 
         response_data = {
             "message": "Group added successfully",
@@ -108,75 +166,73 @@ class GroupCollection(Resource):
         return response_data, 201
 
 
+class GroupStatsItem(Resource):
+    "Resource class for the task statistics of a group"
+
+    def get(self, group_id):
+        """Get the task counts per status, overdue and due this week of a group"""
+        _, error = lookup_group(group_id)
+        if error:
+            return error
+        stats = fetch_group_stats([group_id])[group_id]
+        stats["group_id"] = group_id
+        return stats, 200
+
+
 class UserToGroup(Resource):
     "Resource class for post method for UserToGroup"
 
     def get(self, group_id, unique_user):
         """Get all members of a group by group ID."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-        members = group.user_groups
-        return [{
-            "id": member.user.id,
-            "name": member.user.name,
-            "email": member.user.email,
-            "role": member.role
-        } for member in members
-        ], 200
+        columns = ("id", "name", "email", "role")
+        members = fetch_group_members(group_id, columns)
+        if members is None:
+            return GROUP_NOT_FOUND
+        return encode_rows(members, columns), 200
 
     def post(self, group_id, unique_user):
         """Assign a user to a group by unique_user."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        user = User.query.filter_by(unique_user=unique_user).first()
-        if not user:
-            return {"error": "User not found"}, 404
-
-        # Check if the user is already in the group
-        if UserGroup.query.filter_by(user_id=user.id, group_id=group_id).first():
+        user, user_group, error = lookup_membership(group_id, unique_user)
+        if error:
+            return error
+        if user_group:
             return {"error": "User is already in the group"}, 400
 
         # Add the user to the group
         role = request.json.get("role", "member")  # Default role is "member"
         user_group = UserGroup(user_id=user.id, group_id=group_id, role=role)
         db.session.add(user_group)
-        db.session.commit()
+        record_change("membership", unique_user, "create", {"role": role}, group_id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The user is already in the group
+            db.session.rollback()
+            return {"error": "User is already in the group"}, 400
 
         return {"message": "User added to group successfully"}, 201
 
     def delete(self, group_id, unique_user):
         """Remove a user from a group by unique_user."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        user = User.query.filter_by(unique_user=unique_user).first()
-        if not user:
-            return {"error": "User not found"}, 404
-
-        user_group = UserGroup.query.filter_by(user_id=user.id, group_id=group_id).first()
+        _, user_group, error = lookup_membership(group_id, unique_user)
+        if error:
+            return error
         if not user_group:
             return {"error": "User not in group"}, 400
 
+        # Former members keep no assignments in the group
+        remove_user_assignments(user_group.user_id, group_id)
         db.session.delete(user_group)
+        record_change("membership", unique_user, "delete", group_id=group_id)
         db.session.commit()
 
         return {"message": "User removed from group successfully"}, 204
 
     def put(self, group_id, unique_user):
         """Update a user's role in a group by unique_user."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        user = User.query.filter_by(unique_user=unique_user).first()
-        if not user:
-            return {"error": "User not found"}, 404
-
-        user_group = UserGroup.query.filter_by(user_id=user.id, group_id=group_id).first()
+        _, user_group, error = lookup_membership(group_id, unique_user)
+        if error:
+            return error
         if not user_group:
             return {"error": "User not in group"}, 400
 
@@ -186,6 +242,7 @@ class UserToGroup(Resource):
             return {"error": "Role is required"}, 400
 
         user_group.role = new_role
+        record_change("membership", unique_user, "update", {"role": new_role}, group_id)
         db.session.commit()
 
         return {"message": "User role updated successfully"}, 200
@@ -194,40 +251,14 @@ class GroupUsers(Resource):
     """Resource class for get, post methods for GroupUsers"""
     def get(self, group_id):
         """Get all members of a group by group ID."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        # Fetch all users in the group
-        user_groups = UserGroup.query.filter_by(group_id=group_id).all()
-        print(f"User groups for group_id {group_id}: {user_groups}")  # Debug log
-
-        if not user_groups:
-            print(f"No users found in group {group_id}")
-            return [], 200
-
-        users = []
-        for user_group in user_groups:
-            if user_group.user:  # Ensure user exists
-                users.append({
-                    "id": user_group.user.id,
-                    "unique_user": user_group.user.unique_user,
-                    "name": user_group.user.name,
-                    "email": user_group.user.email,
-                    "role": user_group.role
-                })
-            else:
-                print(f"Orphaned UserGroup entry found: {user_group}")  # Debug log
-
-        print(f"Users in group {group_id}: {users}")  # Debug log
-        return users, 200
+        # Fetch all users in the group, orphaned memberships drop out of the join
+        members = fetch_group_members(group_id)
+        if members is None:
+            return GROUP_NOT_FOUND
+        return encode_rows(members, MEMBER_COLUMNS), 200
 
     def post(self, group_id):
         """Assign a user to a group."""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
         # Get the unique_user and role from the request
         data = request.get_json()
         unique_user = data.get("unique_user")
@@ -236,19 +267,21 @@ class GroupUsers(Resource):
         if not unique_user or not role:
             return {"error": "unique_user and role are required"}, 400
 
-        # Check if the user exists
-        user = User.query.filter_by(unique_user=unique_user).first()
-        if not user:
-            return {"error": "User not found"}, 404
-
-        # Check if the user is already in the group
-        existing_user_group = UserGroup.query.filter_by(user_id=user.id, group_id=group_id).first()
-        if existing_user_group:
+        # Check that the group and the user exist and the user is not in the group yet
+        user, user_group, error = lookup_membership(group_id, unique_user)
+        if error:
+            return error
+        if user_group:
             return {"error": "User is already in this group"}, 400
 
         # Add the user to the group
-        new_user_group = UserGroup(user_id=user.id, group_id=group.id, role=role)
+        new_user_group = UserGroup(user_id=user.id, group_id=group_id, role=role)
         db.session.add(new_user_group)
-        db.session.commit()
+        record_change("membership", unique_user, "create", {"role": role}, group_id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "User is already in this group"}, 400
 
         return {"message": "User added to group successfully"}, 201
@@ -0,0 +1,41 @@
+"""This module contains the resources for the revision history of a task."""
+from flask_restful import Resource
+from task_manager.history import (REVISION_COLUMNS, REVISIONS_DEFAULT_LIMIT, REVISIONS_MAX_LIMIT,
+                                  fetch_revisions, task_at)
+from task_manager.serializers import encode_rows
+from task_manager.utils import int_arg, lookup_task_row
+
+
+class GroupTaskHistory(Resource):
+    "Resource class for the revisions of a task"
+
+    def get(self, group_id, unique_task):
+        """Get the revisions of a task with the fields each one changed, newest
+        first. Page with ?before= set to the oldest revision seen and ?limit="""
+        try:
+            before = int_arg("before", None)
+            limit = int_arg("limit", REVISIONS_DEFAULT_LIMIT, REVISIONS_MAX_LIMIT)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        row, error = lookup_task_row(group_id, unique_task, ("id",))
+        if error:
+            return error
+        rows = fetch_revisions(row[0], before, limit + 1)
+        return {
+            "revisions": encode_rows(rows[:limit], REVISION_COLUMNS),
+            "has_more": len(rows) > limit
+        }, 200
+
+
+class GroupTaskRevision(Resource):
+    "Resource class for a task as of one of its revisions"
+
+    def get(self, group_id, unique_task, revision):
+        """Get the fields of the task as they were after the revision"""
+        row, error = lookup_task_row(group_id, unique_task, ("id",))
+        if error:
+            return error
+        state = task_at(row[0], revision)
+        if state is None:
+            return {"error": "Revision not found"}, 404
+        return state, 200
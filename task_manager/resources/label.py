@@ -0,0 +1,16 @@
+"""This module contains the resource for the labels of a group."""
+from flask_restful import Resource
+from task_manager.labels import LABEL_COLUMNS, fetch_group_labels
+from task_manager.serializers import encode_rows
+from task_manager.utils import GROUP_NOT_FOUND
+
+
+class GroupLabelCollection(Resource):
+    "Resource class for the labels of a group"
+
+    def get(self, group_id):
+        """Get the labels of a group with the number of tasks of each, most used first"""
+        labels = fetch_group_labels(group_id)
+        if labels is None:
+            return GROUP_NOT_FOUND
+        return encode_rows(labels, LABEL_COLUMNS), 200
@@ -1,34 +1,99 @@
 """This module contains the resources for the Task model."""
-import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import requests  # Third-party import
 from flask import request
 from flask_restful import Resource
-from task_manager.models import Task, Group
-from task_manager import db
+from sqlalchemy import false
+from sqlalchemy.exc import IntegrityError
+from task_manager.models import Task, Group, User
+from task_manager import db, negative_cache
+from task_manager.archive import fetch_archived_task, fetch_archived_tasks
+from task_manager.assignees import remove_task_assignees, sync_assignments
+from task_manager.utils import (GROUP_NOT_FOUND, SUBTASK_COLUMNS, TASK_COLUMNS,
+                                 TASK_EXTRA_COLUMNS, TASK_ITEM_COLUMNS, TASK_NOT_FOUND,
+                                 fetch_group_tasks, int_arg, lookup_group, lookup_task,
+                                 lookup_task_row, new_unique_id, requested_columns)
+from task_manager.changes import record_change
+from task_manager.dependencies import creates_parent_cycle, fetch_subtasks, remove_task_links
+from task_manager.history import (record_created, record_revision, remove_task_revisions,
+                                  task_state)
+from task_manager.labels import (LABEL_MATCHES, labeled_task_ids, parse_label_names,
+                                 parse_label_query, remove_task_labels, set_task_labels)
+from task_manager.ordering import last_position, move_task, rebalance_group
+from task_manager.recurrence import (OCCURRENCE_COLUMNS, OCCURRENCE_DEFAULT_DAYS,
+                                     OCCURRENCE_MAX_DAYS, detach_occurrences, fetch_occurrences,
+                                     find_occurrence, materialise, parse_rule, skip_occurrence)
+from task_manager.stats import adjust_task_count
+from task_manager.timeline import (BUCKETS, MAX_BUCKETS, bucket_size, bucket_start,
+                                   group_timeline, invalidate_timeline)
+from task_manager.search import (SEARCH_COLUMNS, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT,
+                                  match_expression, search_group_tasks, search_user_tasks)
+from task_manager.serializers import encode_row, encode_rows
+
+# Related resources that can be included in a task with ?include=
+TASK_INCLUDES = ("subtasks",)
+
+
+def _parent_of(group_id, parent):
+    " Resolve the parent given in a request body, returns (task, error)"
+    if not isinstance(parent, str):
+        return None, ({"error": "parent must be the unique_task of a task or null"}, 400)
+    task, error = lookup_task(group_id, parent)
+    if error:
+        return None, ({"error": "parent must be a task of the group"}, 400)
+    return task, None
+
+
+def _nest_subtasks(unique_task, rows):
+    " Nest subtree rows under their parents, returns the direct subtasks of unique_task"
+    children = {}
+    for item in encode_rows(rows, SUBTASK_COLUMNS + ("depth",)):
+        children.setdefault(item["parent_task"], []).append(item)
+    for items in children.values():
+        for item in items:
+            item["subtasks"] = children.get(item["unique_task"], [])
+    return children.get(unique_task, [])
+
+
+def _virtual_occurrence(series, when, columns):
+    " The response of an occurrence of a series that is not stored as a task yet"
+    item = encode_row(tuple(getattr(series, name) for name in columns), columns)
+    overrides = {"id": None, "deadline": when, "recurrence": None,
+                 "series": series.unique_task}
+    item.update((name, value) for name, value in overrides.items() if name in item)
+    return item
 
 class GroupTaskCollection(Resource):
     """Resource class for get method for GroupTaskCollection"""
 
     def get(self, group_id):
-        """Get all tasks of a group"""
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
-
-        # Fetch tasks directly associated with the group
-        tasks = Task.query.filter_by(group_id=group_id).all()
-        return [{
-            "id": task.id,
-            "unique_task": task.unique_task,
-            "title": task.title,
-            "description": task.description,
-            "status": task.status,
-            "deadline": task.deadline.isoformat(),
-            "created_at": task.created_at.isoformat(),
-            "updated_at": task.updated_at.isoformat(),
-            "group_id": task.group_id
-        } for task in tasks], 200
+        """Get all tasks of a group, optionally only the ?fields= asked for.
+        ?labels=a,b returns the tasks with all the labels, or any with ?match=any.
+        ?include_archived=1 adds the archived tasks after the others"""
+        try:
+            columns = requested_columns(TASK_COLUMNS, key="unique_task",
+                                        extra=TASK_EXTRA_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        criteria = []
+        names = parse_label_query(request.args.get("labels", ""))
+        match = request.args.get("match", "all")
+        if names:
+            if match not in LABEL_MATCHES:
+                return {"error": "match must be all or any"}, 400
+            task_ids = labeled_task_ids(group_id, names, match)
+            criteria.append(false() if task_ids is None else Task.id.in_(task_ids))
+
+        # Fetch tasks directly associated with the group as plain rows
+        rows = fetch_group_tasks(group_id, columns, *criteria)
+        if rows is None:
+            return GROUP_NOT_FOUND
+        if request.args.get("include_archived") in ("1", "true"):
+            rows = ([tuple(row) + (False,) for row in rows]
+                    + [tuple(row) + (True,)
+                       for row in fetch_archived_tasks(group_id, columns, names, match)])
+            columns = columns + ("archived",)
+        return encode_rows(rows, columns), 200
 
     def post(self, group_id):
         """Creates a new task"""
@@ -41,8 +106,12 @@ class GroupTaskCollection(Resource):
             deadline = datetime.fromisoformat(request.json["deadline"])
             created_at = datetime.now()
             updated_at = datetime.now()
+            labels = parse_label_names(request.json.get("labels", []))
+            recurrence = parse_rule(request.json.get("recurrence"))
         except KeyError:
             return {"error": "Incomplete request - missing information"}, 400
+        except (ValueError, TypeError) as error:
+            return {"error": str(error)}, 400
 
         if not title:
             return {"error": "Title is required"}, 400
@@ -53,16 +122,16 @@ class GroupTaskCollection(Resource):
         if not deadline:
             return {"error": "Deadline is required"}, 400
 
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
+        group, error = lookup_group(group_id)
+        if error:
+            return error
+        parent = request.json.get("parent")
+        if parent is not None:
+            parent, error = _parent_of(group_id, parent)
+            if error:
+                return error
 
-        new_uuid = str(uuid.uuid4())
-        if Task.query.filter_by(unique_task=new_uuid).first():
-            new_uuid = str(uuid.uuid4())
-
-        if Task.query.filter_by(title=title, group_id=group_id).first():
-            return {"error": "Task already exists"}, 400
+        new_uuid = new_unique_id("task")
 
         task = Task(
             unique_task=new_uuid,
@@ -72,10 +141,30 @@ class GroupTaskCollection(Resource):
             deadline=deadline,
             created_at=created_at,
             updated_at=updated_at,
+            position=last_position(group_id),
+            parent_id=parent.id if parent else None,
+            recurrence=recurrence,
             group_id=group_id
         )
         db.session.add(task)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # The title is already used in the group
+            db.session.rollback()
+            return {"error": "Task already exists"}, 400
+        adjust_task_count(group_id, status, 1)
+        if labels:
+            set_task_labels(task, labels)
+        created = {"title": title, "description": description, "status": status,
+                   "deadline": deadline, "position": task.position, "labels": labels,
+                   "parent": parent.unique_task if parent else None,
+                   "recurrence": recurrence}
+        record_change("task", new_uuid, "create", created, group_id)
+        record_created(task.id, created)
         db.session.commit()
+        negative_cache.add("task", new_uuid)
+        invalidate_timeline(group_id)
 
         # Send email notifications (if applicable)
         if status == 1:
@@ -105,42 +194,96 @@ class GroupTaskCollection(Resource):
 class GroupTaskItem(Resource):
     """Resource class for get, put, delete methods for Task"""    
     def get(self, group_id, unique_task):
-        """Get a task by its unique_task and returns the whole task"""
-        group = db.session.get(Group, group_id)
-        if not group:
-            print(f"Group with ID {group_id} not found")
-            return {"error": "Group not found"}, 404
-
-        task = Task.query.filter_by(unique_task=unique_task, group_id=group_id).first()
-        if not task:
-            print(f"Task with unique_task {unique_task} not found in group {group_id}")
-            return {"error": "Task not found"}, 404
+        """Get a task by its unique_task and returns the whole task,
+        or only the ?fields= asked for.
+        ?include=subtasks nests the whole subtree of the task in the response.
+        Occurrences of a series are returned even if they are not stored, and
+        archived tasks with archived set"""
+        try:
+            columns = requested_columns(TASK_ITEM_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        includes = {name.strip() for name in request.args.get("include", "").split(",")
+                    if name.strip()}
+        unknown = includes.difference(TASK_INCLUDES)
+        if unknown:
+            return {"error": "Unknown include(s): " + ", ".join(sorted(unknown))}, 400
+        row, error = lookup_task_row(group_id, unique_task, ("id",) + columns)
+        if error == TASK_NOT_FOUND:
+            occurrence = find_occurrence(group_id, unique_task)
+            if occurrence:
+                task = _virtual_occurrence(*occurrence, columns)
+                if "subtasks" in includes:
+                    task["subtasks"] = []
+                return task, 200
+            archived = (negative_cache.might_exist("task", unique_task)
+                        and fetch_archived_task(group_id, unique_task, columns))
+            if archived:
+                task = encode_row(archived, columns)
+                task["archived"] = True
+                if "subtasks" in includes:
+                    task["subtasks"] = []
+                return task, 200
+        if error:
+            return error
 
         # Return the task details
-        return {
-            "id": task.id,
-            "title": task.title,
-            "description": task.description,
-            "status": task.status,
-            "deadline": task.deadline.isoformat(),
-            "created_at": task.created_at.isoformat(),
-            "updated_at": task.updated_at.isoformat(),
-            "group_id": task.group_id
-        }, 200
+        task = encode_row(row[1:], columns)
+        if "subtasks" in includes:
+            task["subtasks"] = _nest_subtasks(unique_task, fetch_subtasks(row[0], SUBTASK_COLUMNS))
+        return task, 200
 
     def put(self, group_id, unique_task):
-        """Updates a task information of an existing task"""
+        """Updates a task information of an existing task. An occurrence of a
+        series is stored as a task of its own first"""
         if not request.is_json:
             return {"error": "Request content type must be JSON"}, 415
         data = request.get_json()
-        group = db.session.get(Group, group_id)
-        if not group:
-            return {"error": "Group not found"}, 404
+        task, error = lookup_task(group_id, unique_task)
+        materialised = False
+        if error == TASK_NOT_FOUND:
+            occurrence = find_occurrence(group_id, unique_task)
+            if occurrence:
+                try:
+                    task = materialise(*occurrence)
+                except IntegrityError:
+                    db.session.rollback()
+                    return {"error": "The occurrence was stored concurrently, try again"}, 409
+                error = None
+                materialised = True
+        if error:
+            return error
+        old_status = task.status
+        before = task_state(task.id)
 
-        task = Task.query.filter_by(unique_task=unique_task, group_id=group_id).first()
-        if not task:
-            return {"error": "Task not found"}, 404
+        if "recurrence" in data:
+            if task.occurrence is not None:
+                return {"error": "An occurrence of a series cannot recur"}, 400
+            try:
+                data["recurrence"] = parse_rule(data["recurrence"])
+            except ValueError as error:
+                return {"error": str(error)}, 400
+            if data["recurrence"] is not None and task.recurrence:
+                # Deleted occurrences stay deleted
+                exdates = task.recurrence.get("exdates")
+                if exdates:
+                    data["recurrence"]["exdates"] = exdates
+            task.recurrence = data["recurrence"]
 
+        if "labels" in data:
+            try:
+                data["labels"] = parse_label_names(data["labels"])
+            except ValueError as error:
+                return {"error": str(error)}, 400
+        if "parent" in data:
+            parent = None
+            if data["parent"] is not None:
+                parent, error = _parent_of(group_id, data["parent"])
+                if error:
+                    return error
+                if creates_parent_cycle(task.id, parent.id):
+                    return {"error": "A task cannot be a subtask of itself or of its subtasks"}, 400
+            task.parent_id = parent.id if parent else None
         if "title" in data:
             if not isinstance(data["title"], str):
                 return {"error": "Title must be a string"}, 400
@@ -200,25 +343,203 @@ class GroupTaskItem(Resource):
                             print(f"Deadline reminder failed: {response.json()}")
                     except requests.exceptions.RequestException as exception:
                         print(f"Error contacting email service: {str(exception)}")
-            except ValueError:
+            except (ValueError, TypeError):
                 return {"error": "Invalid deadline format. Use ISO format (YYYY-MM-DDTHH:MM:SS)"}, 400
 
         task.updated_at = datetime.now()
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "Task already exists"}, 400
+        if task.status != old_status:
+            adjust_task_count(group_id, old_status, -1)
+            adjust_task_count(group_id, task.status, 1)
+        if "status" in data or "deadline" in data:
+            sync_assignments(task)
+        if "labels" in data:
+            set_task_labels(task, data["labels"])
+        changes = {name: getattr(task, name)
+                   for name in ("title", "description", "status", "deadline") if name in data}
+        if "labels" in data:
+            changes["labels"] = data["labels"]
+        if "parent" in data:
+            changes["parent"] = data["parent"]
+        if "recurrence" in data:
+            changes["recurrence"] = data["recurrence"]
+        record_change("task", unique_task, "update", changes, group_id)
+        record_revision(task.id, before, changes)
         db.session.commit()
+        if materialised:
+            negative_cache.add("task", unique_task)
+        invalidate_timeline(group_id)
         return {"message": "Task updated successfully"}, 200
 
     def delete(self, group_id, unique_task):
-        """Deletes a task by its unique_task"""
-        group = db.session.get(Group, group_id)
-        if not group:
-            print(f"Group with ID {group_id} not found")
-            return {"error": "Group not found"}, 404
-
-        task = Task.query.filter_by(unique_task=unique_task, group_id=group_id).first()
-        if not task:
-            print(f"Task with unique_task {unique_task} not found in group {group_id}")
-            return {"error": "Task not found"}, 404
+        """Deletes a task by its unique_task. Deleted occurrences of a series
+        are skipped by the series from then on"""
+        task, error = lookup_task(group_id, unique_task)
+        if error == TASK_NOT_FOUND:
+            occurrence = find_occurrence(group_id, unique_task)
+            if occurrence:
+                skip_occurrence(*occurrence)
+                db.session.commit()
+                return {"message": "Task deleted successfully"}, 204
+        if error:
+            return error
 
+        if task.occurrence is not None and task.recurrence_id is not None:
+            series = db.session.get(Task, task.recurrence_id)
+            if series is not None and series.recurrence:
+                skip_occurrence(series, task.occurrence)
+        if task.recurrence:
+            detach_occurrences(task.id)
+        remove_task_labels(task.id)
+        subtasks = remove_task_links(task.id)
+        remove_task_assignees(task.id)
+        remove_task_revisions(task.id)
         db.session.delete(task)
+        adjust_task_count(group_id, task.status, -1)
+        record_change("task", unique_task, "delete", group_id=group_id)
+        for subtask in subtasks:
+            record_change("task", subtask, "update", {"parent": None}, group_id)
         db.session.commit()
+        invalidate_timeline(group_id)
         return {"message": "Task deleted successfully"}, 204
+
+
+class GroupTaskMove(Resource):
+    """Resource class for moving a task within the manual order of its group"""
+
+    def post(self, group_id, unique_task):
+        """Move the task right after the task {"after": unique_task},
+        or first with {"after": null}. Only the moved task is written"""
+        if not request.is_json:
+            return {"error": "Request content type must be JSON"}, 415
+        data = request.get_json()
+        if not isinstance(data, dict) or "after" not in data:
+            return {"error": "after is required, null moves the task first"}, 400
+        task, error = lookup_task(group_id, unique_task)
+        if error:
+            return error
+        after = None
+        if data["after"] is not None:
+            if data["after"] == unique_task:
+                return {"error": "A task cannot be moved after itself"}, 400
+            after, error = lookup_task(group_id, data["after"])
+            if error:
+                return {"error": "after must be a task of the group"}, 400
+
+        needs_rebalance = move_task(task, after)
+        record_change("task", unique_task, "update", {"position": task.position}, group_id)
+        db.session.commit()
+        if needs_rebalance:
+            rebalance_group(group_id)
+            db.session.commit()
+        return {"message": "Task moved successfully", "position": task.position}, 200
+
+
+def _search_args():
+    " Read the search query and limit, returns (query, limit, error)"
+    query = match_expression(request.args.get("q", ""))
+    if query is None:
+        return None, None, ({"error": "Search query q is required"}, 400)
+    try:
+        limit = int_arg("limit", SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT)
+    except ValueError as error:
+        return None, None, ({"error": str(error)}, 400)
+    return query, limit, None
+
+
+class GroupTaskSearch(Resource):
+    """Resource class for full-text search over the tasks of a group"""
+
+    def get(self, group_id):
+        """Search task titles and descriptions of a group with ?q=, best matches first"""
+        query, limit, error = _search_args()
+        if error:
+            return error
+        _, error = lookup_group(group_id)
+        if error:
+            return error
+        rows = search_group_tasks(group_id, query, limit)
+        return encode_rows(rows, SEARCH_COLUMNS), 200
+
+
+class TaskSearch(Resource):
+    """Resource class for full-text search over all groups of a user"""
+
+    def get(self):
+        """Search the tasks of every group ?user= belongs to with ?q=, best matches first"""
+        query, limit, error = _search_args()
+        if error:
+            return error
+        unique_user = request.args.get("user")
+        if not unique_user:
+            return {"error": "user is required"}, 400
+        if not User.query.filter_by(unique_user=unique_user).first():
+            return {"error": "User not found"}, 404
+        rows = search_user_tasks(unique_user, query, limit)
+        return encode_rows(rows, SEARCH_COLUMNS), 200
+
+
+class GroupTaskTimeline(Resource):
+    """Resource class for the deadline histogram of a group"""
+
+    def get(self, group_id):
+        """Count the tasks per status in ?bucket=day|week buckets by deadline,
+        from ?from= (default today) up to ?to= (default 30 days later)"""
+        bucket = request.args.get("bucket", "day")
+        if bucket not in BUCKETS:
+            return {"error": "bucket must be day or week"}, 400
+        try:
+            start = datetime.fromisoformat(request.args.get("from") or datetime.now().isoformat())
+            end = (datetime.fromisoformat(request.args["to"]) if request.args.get("to")
+                   else start + timedelta(days=30))
+        except ValueError:
+            return {"error": "Invalid date format. Use ISO format (YYYY-MM-DD)"}, 400
+
+        # Widen the range to whole buckets
+        start = bucket_start(start, bucket)
+        if bucket_start(end, bucket) != end:
+            end = bucket_start(end, bucket) + bucket_size(bucket)
+        if end <= start:
+            return {"error": "to must be after from"}, 400
+        if (end - start) / bucket_size(bucket) > MAX_BUCKETS:
+            return {"error": f"At most {MAX_BUCKETS} buckets can be requested"}, 400
+
+        _, error = lookup_group(group_id)
+        if error:
+            return error
+        return {
+            "group_id": group_id,
+            "bucket": bucket,
+            "from": start.date().isoformat(),
+            "to": end.date().isoformat(),
+            "buckets": group_timeline(group_id, bucket, start, end)
+        }, 200
+
+
+class GroupTaskOccurrences(Resource):
+    """Resource class for the tasks of a group due in a window, series expanded"""
+
+    def get(self, group_id):
+        """Get the tasks due from ?from= (default today) up to ?to= (default
+        30 days later), with the occurrences of recurring tasks computed for
+        the window. Occurrences not stored yet have virtual set"""
+        try:
+            start = datetime.fromisoformat(request.args.get("from")
+                                           or datetime.now().date().isoformat())
+            end = (datetime.fromisoformat(request.args["to"]) if request.args.get("to")
+                   else start + timedelta(days=OCCURRENCE_DEFAULT_DAYS))
+        except ValueError:
+            return {"error": "Invalid date format. Use ISO format (YYYY-MM-DD)"}, 400
+        if end <= start:
+            return {"error": "to must be after from"}, 400
+        if end - start > timedelta(days=OCCURRENCE_MAX_DAYS):
+            return {"error": f"At most {OCCURRENCE_MAX_DAYS} days can be requested"}, 400
+
+        _, error = lookup_group(group_id)
+        if error:
+            return error
+        return encode_rows(fetch_occurrences(group_id, start, end), OCCURRENCE_COLUMNS), 200
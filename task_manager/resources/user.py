@@ -1,9 +1,22 @@
 """This module contains the User resource class and its methods"""
-import uuid
+from datetime import datetime
 from flask import request
 from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
 from task_manager.models import User
-from task_manager import db
+from task_manager import db, negative_cache
+from task_manager.assignees import fetch_workload, remove_user_assignments
+from task_manager.changes import record_change
+from task_manager.utils import (TASK_EXTRA_COLUMNS, USER_COLUMNS, USER_ITEM_COLUMNS,
+                                 USER_PREFIX_COLUMNS, USER_TASK_COLUMNS, fetch_row, fetch_rows,
+                                 fetch_user_tasks, fetch_users_by_prefix, int_arg,
+                                 new_unique_id, requested_columns)
+from task_manager.serializers import encode_row, encode_rows
+
+PREFIX_DEFAULT_LIMIT = 10
+PREFIX_MAX_LIMIT = 50
+USER_TASKS_DEFAULT_LIMIT = 50
+USER_TASKS_MAX_LIMIT = 500
 
 
 class UserItem(Resource):
@@ -11,15 +24,17 @@ class UserItem(Resource):
 
     # getting a user
     def get(self, unique_user):
-        """Get a user by its unique id"""
-        user = User.query.filter_by(unique_user=unique_user).first()
-        if not user:
+        """Get a user by its unique id, optionally only the ?fields= asked for"""
+        try:
+            columns = requested_columns(USER_ITEM_COLUMNS)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        if not negative_cache.might_exist("user", unique_user):
             return {"error": "User not found"}, 404
-        return {
-            "name": user.name,
-            "email": user.email,
-            "unique_user": user.unique_user
-        }, 200
+        row = fetch_row(User, columns, User.unique_user == unique_user)
+        if not row:
+            return {"error": "User not found"}, 404
+        return encode_row(row, columns), 200
 
 
     def put(self, unique_user):
@@ -29,6 +44,8 @@ class UserItem(Resource):
         if not request.is_json:
             return {"error": "Request content type must be JSON"}, 415
         data = request.get_json()
+        if not negative_cache.might_exist("user", unique_user):
+            return {"error": "User not found"}, 404
         user = User.query.filter_by(unique_user=unique_user).first()
         if not user:
             return {"error": "User not found"}, 404
@@ -47,18 +64,29 @@ class UserItem(Resource):
                 return {"error": "Password must be a string"}, 400
             user.password = data["password"]
 
-        db.session.commit()
+        # Passwords never go into the change log
+        record_change("user", unique_user, "update",
+                      {name: data[name] for name in ("name", "email") if name in data})
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "Email is already in use"}, 400
         return {
             "message": "User updated successfully"       
         }, 200
 
     def delete(self, unique_user):
         "Deletes a user"
+        if not negative_cache.might_exist("user", unique_user):
+            return {"error": "User not found"}, 404
         user = User.query.filter_by(unique_user=unique_user).first()
         if not user:
             return {"error": "User not found"}, 404
 
+        remove_user_assignments(user.id)
         db.session.delete(user)
+        record_change("user", unique_user, "delete")
         db.session.commit()
 
         return {}, 204
@@ -68,14 +96,28 @@ class UserCollection(Resource):
     "Resource class for get method for UserCollection"
 
     def get(self):
-        """Get all users"""
-        users = User.query.all()
-        user_list = [{"id": user.id,
-                      "unique_user": user.unique_user,
-                      "name": user.name,
-                      "email": user.email,
-                      "password": user.password} for user in users]
-        return user_list, 200
+        """Get all users, optionally only the ?fields= asked for.
+        With ?prefix= only the users whose name or email starts with it are returned"""
+        if "prefix" in request.args:
+            return self.autocomplete(request.args["prefix"].strip())
+        try:
+            columns = requested_columns(USER_COLUMNS, key="unique_user")
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        rows = fetch_rows(User, columns)
+        return encode_rows(rows, columns), 200
+
+    @staticmethod
+    def autocomplete(prefix):
+        """Return at most ?limit= users matching the prefix, without passwords"""
+        if not prefix:
+            return [], 200
+        try:
+            limit = int_arg("limit", PREFIX_DEFAULT_LIMIT, PREFIX_MAX_LIMIT)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        rows = fetch_users_by_prefix(prefix, limit)
+        return encode_rows(rows, USER_PREFIX_COLUMNS), 200
 
     def post(self):
         "Creates a new user, with name, email and password"
@@ -87,17 +129,65 @@ class UserCollection(Resource):
             password = request.json["password"]
         except KeyError:
             return {"error": "Incomplete request - missing fields"}, 400
-        new_uuid = str(uuid.uuid4())
-        if User.query.filter_by(unique_user=new_uuid).first():
-# if the uuid already exists, generate a new one
-            new_uuid = str(uuid.uuid4())
-        if User.query.filter_by(email=email).first():
-            return {"error": "Email is already in use"}, 400
+        new_uuid = new_unique_id("user")
         user = User(name=name, unique_user=new_uuid, email=email, password=password)
         db.session.add(user)
-        db.session.commit()
+        record_change("user", new_uuid, "create", {"name": name, "email": email})
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The email belongs to another user
+            db.session.rollback()
+            return {"error": "Email is already in use"}, 400
+        negative_cache.add("user", new_uuid)
 
         return {
             "message": "User added successfully",
             "unique_user": new_uuid
         }, 201
+
+
+class UserTasks(Resource):
+    "Resource class for the tasks of all groups of a user"
+
+    def get(self, unique_user):
+        """Get the tasks of every group the user belongs to, nearest deadline first.
+        Filter with ?due_before= and ?status= (comma separated), cap with ?limit=.
+        ?assigned=1 returns only the tasks assigned to the user"""
+        try:
+            columns = requested_columns(USER_TASK_COLUMNS, key="unique_task",
+                                        extra=TASK_EXTRA_COLUMNS)
+            limit = int_arg("limit", USER_TASKS_DEFAULT_LIMIT, USER_TASKS_MAX_LIMIT)
+        except ValueError as error:
+            return {"error": str(error)}, 400
+        due_before = request.args.get("due_before")
+        statuses = request.args.get("status")
+        try:
+            if due_before:
+                due_before = datetime.fromisoformat(due_before)
+            if statuses:
+                statuses = [int(status) for status in statuses.split(",")]
+        except ValueError:
+            return {"error": "due_before must be an ISO date and status integers"}, 400
+
+        if not negative_cache.might_exist("user", unique_user):
+            return {"error": "User not found"}, 404
+        assigned = request.args.get("assigned") in ("1", "true")
+        rows = fetch_user_tasks(unique_user, columns, due_before, statuses, limit, assigned)
+        if not rows and not User.query.filter_by(unique_user=unique_user).first():
+            return {"error": "User not found"}, 404
+        return encode_rows(rows, columns), 200
+
+
+class UserWorkload(Resource):
+    "Resource class for the workload summary of a user"
+
+    def get(self, unique_user):
+        """Get the number of open tasks assigned to the user, per status and
+        overdue, and the next upcoming deadline"""
+        if not negative_cache.might_exist("user", unique_user):
+            return {"error": "User not found"}, 404
+        row = fetch_row(User, ("id",), User.unique_user == unique_user)
+        if not row:
+            return {"error": "User not found"}, 404
+        return fetch_workload(row[0]), 200
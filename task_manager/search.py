@@ -0,0 +1,61 @@
+"""Full-text search over tasks, backed by the task_fts FTS5 index."""
+from sqlalchemy import DateTime, text
+from task_manager import db
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Columns of a search hit, "snippet" is a highlighted part of the description
+SEARCH_COLUMNS = ("id", "unique_task", "title", "status", "deadline", "group_id", "snippet")
+
+# Titles weigh more than descriptions in the bm25 ranking
+_SEARCH_SQL = """
+SELECT task.id, task.unique_task, task.title, task.status, task.deadline, task.group_id,
+       snippet(task_fts, 1, '[', ']', '...', 12) AS snippet
+FROM task_fts JOIN task ON task.id = task_fts.rowid
+WHERE task_fts MATCH :query AND {scope}
+ORDER BY bm25(task_fts, 5.0, 1.0)
+LIMIT :limit
+"""
+
+_GROUP_SCOPE = "task.group_id = :group_id"
+_USER_SCOPE = """task.group_id IN (
+    SELECT user_group.group_id FROM user_group
+    JOIN user ON user.id = user_group.user_id
+    WHERE user.unique_user = :unique_user)"""
+
+
+def match_expression(query):
+    """Turn free text into a safe FTS5 MATCH expression
+
+    Every word is quoted so FTS5 operators in user input are matched as
+    plain text, and the last word is a prefix so results update while
+    typing. Returns None if the query has no words.
+    """
+    words = [word.replace('"', "") for word in query.split()]
+    words = [f'"{word}"' for word in words if word]
+    if not words:
+        return None
+    words[-1] += "*"
+    return " ".join(words)
+
+
+def _search_statement(scope):
+    " Build the search statement for a scope, typing the deadline column"
+    return text(_SEARCH_SQL.format(scope=scope)).columns(deadline=DateTime)
+
+
+def search_group_tasks(group_id, query, limit=SEARCH_DEFAULT_LIMIT):
+    """Search the tasks of one group, best matches first"""
+    stmt = _search_statement(_GROUP_SCOPE)
+    return db.session.execute(
+        stmt, {"query": query, "group_id": group_id, "limit": limit}
+    ).all()
+
+
+def search_user_tasks(unique_user, query, limit=SEARCH_DEFAULT_LIMIT):
+    """Search the tasks of every group the user belongs to, best matches first"""
+    stmt = _search_statement(_USER_SCOPE)
+    return db.session.execute(
+        stmt, {"query": query, "unique_user": unique_user, "limit": limit}
+    ).all()
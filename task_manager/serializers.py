@@ -0,0 +1,169 @@
+"""Serialization of API responses.
+
+Resources hand plain row tuples to the encoders here instead of building
+dicts by hand. An encoder is built once per column list, and the final
+JSON document is produced with orjson when it is installed, falling back
+to the standard library json module otherwise.
+
+MessagePack (and CBOR) representations are available for machine to
+machine clients when msgpack (and cbor2) are installed. They encode
+datetimes natively and are also accepted as request bodies, whose datetimes
+reach the resources as naive UTC ISO strings, like in a JSON body.
+"""
+import json
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from flask import Request, make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+
+@lru_cache(maxsize=None)
+def build_encoder(columns):
+    """Build a function turning a row tuple into a dict with the given keys
+
+    The function is built once per column tuple and pairs the keys with the
+    row in C through dict(zip()), without a Python level loop per field.
+    """
+    def encode(row):
+        return dict(zip(columns, row))
+    return encode
+
+
+def encode_row(row, columns):
+    """Encode a single row into a response dict"""
+    return build_encoder(columns)(row)
+
+
+def encode_rows(rows, columns):
+    """Encode a list of rows into response dicts"""
+    encode = build_encoder(columns)
+    return [encode(row) for row in rows]
+
+
+def _default(value):
+    " Convert values the stdlib json module does not know about"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(data):
+        """Serialize data to JSON bytes, datetimes in ISO format"""
+        return orjson.dumps(data)
+else:
+    def dumps(data):
+        """Serialize data to JSON bytes, datetimes in ISO format"""
+        return json.dumps(data, default=_default, separators=(",", ":")).encode()
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTful representation for application/json"""
+    resp = make_response(dumps(data), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def _msgpack_default(value):
+    " Pack datetimes as MessagePack timestamps, naive ones are taken as UTC"
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not MessagePack serializable")
+
+
+def output_msgpack(data, code, headers=None):
+    """Flask-RESTful representation for application/msgpack"""
+    resp = make_response(msgpack.packb(data, default=_msgpack_default, datetime=True), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def output_cbor(data, code, headers=None):
+    """Flask-RESTful representation for application/cbor"""
+    resp = make_response(cbor2.dumps(data, timezone=timezone.utc), code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+def _isoformat_datetimes(value):
+    " Turn the datetimes of a decoded body into ISO strings, aware ones in naive UTC"
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _isoformat_datetimes(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_isoformat_datetimes(item) for item in value]
+    return value
+
+
+def _msgpack_loads(data):
+    " Unpack a MessagePack body, timestamps become ISO strings"
+    return _isoformat_datetimes(msgpack.unpackb(data, timestamp=3))
+
+
+def _cbor_loads(data):
+    " Decode a CBOR body, datetimes become ISO strings"
+    return _isoformat_datetimes(cbor2.loads(data))
+
+
+# Binary request body formats accepted next to JSON, by mimetype
+BODY_DECODERS = {}
+if msgpack is not None:
+    BODY_DECODERS[MSGPACK] = _msgpack_loads
+    BODY_DECODERS["application/x-msgpack"] = _msgpack_loads
+if cbor2 is not None:
+    BODY_DECODERS[CBOR] = _cbor_loads
+
+
+class ApiRequest(Request):
+    """Request class that decodes MessagePack and CBOR bodies like JSON
+
+    Resources keep using request.is_json and request.get_json(), so binary
+    bodies work everywhere a JSON body does.
+    """
+    _cached_body = None
+
+    @property
+    def is_json(self):
+        return super().is_json or self.mimetype in BODY_DECODERS
+
+    def get_json(self, force=False, silent=False, cache=True):
+        loads = BODY_DECODERS.get(self.mimetype)
+        if loads is None:
+            return super().get_json(force=force, silent=silent, cache=cache)
+        if self._cached_body is not None:
+            return self._cached_body
+        try:
+            body = loads(self.get_data(cache=cache))
+        except (ValueError, TypeError) as error:
+            if silent:
+                return None
+            return self.on_json_loading_failed(error)
+        if cache:
+            self._cached_body = body
+        return body
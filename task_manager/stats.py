@@ -0,0 +1,68 @@
+"""Per-group task statistics.
+
+The number of tasks per status is kept in the group_stats table, which the
+task resources update in the same transaction as the task itself, so
+reading it never touches the task table. Overdue and due soon counts depend
+on the current time and are counted from the (group_id, status, deadline)
+index, only for statuses that are not completed.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from task_manager import db
+from task_manager.constants import TASK_STATUS_COMPLETED
+from task_manager.models import GroupStats, Task
+
+DUE_SOON_DAYS = 7
+
+
+def adjust_task_count(group_id, status, delta):
+    """Add delta to the task count of a status in a group, in the current transaction"""
+    if group_id is None:
+        return
+    stmt = insert(GroupStats).values(group_id=group_id, status=status, task_count=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[GroupStats.group_id, GroupStats.status],
+        set_={"task_count": GroupStats.task_count + delta}
+    )
+    db.session.execute(stmt)
+
+
+def _empty_stats():
+    " Statistics of a group without tasks"
+    return {"total": 0, "by_status": {}, "overdue": 0, "due_this_week": 0}
+
+
+def fetch_group_stats(group_ids=None):
+    """Return a statistics document for each group id
+
+    Groups without tasks are included with zero counts when their id is
+    given. Without group_ids every group with tasks is returned.
+    """
+    now = datetime.now()
+    soon = now + timedelta(days=DUE_SOON_DAYS)
+    stats = {group_id: _empty_stats() for group_id in group_ids or ()}
+
+    counts = select(GroupStats.group_id, GroupStats.status, GroupStats.task_count).where(
+        GroupStats.task_count != 0)
+    if group_ids is not None:
+        counts = counts.where(GroupStats.group_id.in_(group_ids))
+    for group_id, status, task_count in db.session.execute(counts):
+        doc = stats.setdefault(group_id, _empty_stats())
+        doc["total"] += task_count
+        doc["by_status"][str(status)] = task_count
+
+    due = (
+        select(Task.group_id,
+               func.sum(Task.deadline < now),
+               func.sum(Task.deadline >= now))
+        .where(Task.status != TASK_STATUS_COMPLETED, Task.deadline < soon)
+        .group_by(Task.group_id)
+    )
+    if group_ids is not None:
+        due = due.where(Task.group_id.in_(group_ids))
+    for group_id, overdue, due_this_week in db.session.execute(due):
+        if group_id in stats:
+            stats[group_id]["overdue"] = overdue or 0
+            stats[group_id]["due_this_week"] = due_this_week or 0
+    return stats
@@ -0,0 +1,96 @@
+"""Deadline timeline of the tasks in a group.
+
+Task counts per status are grouped into day or week buckets by their
+deadline with a single GROUP BY over the (group_id, deadline) index.
+Buckets that lie completely in the past rarely change, so their counts
+are cached. Every task change in a group gives the group a new random
+generation token, which is part of the cache key, so stale entries are
+never read. A token that was evicted is replaced by a new one as well, so
+it never falls back to a generation used before.
+"""
+from datetime import datetime, timedelta
+import uuid
+from flask import current_app
+from sqlalchemy import func, select
+from task_manager import cache, db
+from task_manager.models import Task
+
+BUCKETS = ("day", "week")
+MAX_BUCKETS = 400
+
+
+def bucket_start(value, bucket):
+    """Return the start of the day or (Monday based) week containing value"""
+    start = datetime(value.year, value.month, value.day)
+    if bucket == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def bucket_size(bucket):
+    " Length of a bucket"
+    return timedelta(days=7 if bucket == "week" else 1)
+
+
+def invalidate_timeline(group_id):
+    """Forget the cached timeline buckets of a group after its tasks changed"""
+    cache.set(f"timeline-generation:{group_id}", uuid.uuid4().hex, timeout=0)
+
+
+def _generation(group_id):
+    " The generation token of a group, a new one if there is none"
+    key = f"timeline-generation:{group_id}"
+    generation = cache.get(key)
+    if generation is None:
+        # add keeps the token of a request that stored one first
+        cache.add(key, uuid.uuid4().hex, timeout=0)
+        generation = cache.get(key)
+    return generation
+
+
+def _query_counts(group_id, bucket, start, end):
+    " Count the tasks per bucket and status with deadlines in [start, end)"
+    if bucket == "week":
+        # SQLite: move to the coming Sunday, then back to that week's Monday
+        key = func.date(Task.deadline, "weekday 0", "-6 days")
+    else:
+        key = func.date(Task.deadline)
+    stmt = (
+        select(key, Task.status, func.count())
+        .where(Task.group_id == group_id, Task.deadline >= start, Task.deadline < end)
+        .group_by(key, Task.status)
+        .order_by(key)
+    )
+    return [tuple(row) for row in db.session.execute(stmt)]
+
+
+def _cached_counts(group_id, bucket, start, end):
+    " Counts of a range of past buckets, cached per group generation"
+    generation = _generation(group_id)
+    key = f"timeline:{group_id}:{generation}:{bucket}:{start.date()}:{end.date()}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = _query_counts(group_id, bucket, start, end)
+        cache.set(key, counts, timeout=current_app.config.get("TIMELINE_CACHE_TIMEOUT", 3600))
+    return counts
+
+
+def group_timeline(group_id, bucket, start, end):
+    """Return the non-empty buckets between start and end (exclusive)
+
+    start and end must already be bucket boundaries. Each bucket is a dict
+    with its start date, the counts per status and the total.
+    """
+    current = bucket_start(datetime.now(), bucket)
+    counts = []
+    if start < current:
+        counts += _cached_counts(group_id, bucket, start, min(end, current))
+    if end > current:
+        counts += _query_counts(group_id, bucket, max(start, current), end)
+
+    buckets = {}
+    for day, status, count in counts:
+        doc = buckets.setdefault(day, {"start": day, "counts": {}, "total": 0})
+        doc["counts"][str(status)] = count
+        doc["total"] += count
+    return list(buckets.values())
@@ -0,0 +1,347 @@
+"""Shared helpers used by the task manager resources."""
+import os
+import sys
+import time
+import uuid
+from flask import current_app, request
+from sqlalchemy import and_, select
+from task_manager import db, negative_cache
+from task_manager.models import Group, Task, TaskAssignee, User, UserGroup
+
+# UUID version of the unique ids, per kind, overridable with UUID_VERSIONS
+DEFAULT_UUID_VERSIONS = {"user": 7, "group": 7, "task": 7}
+
+# Columns returned by the collection endpoints, in response order
+USER_COLUMNS = ("id", "unique_user", "name", "email", "password")
+GROUP_COLUMNS = ("id", "name", "unique_group")
+TASK_COLUMNS = ("id", "unique_task", "title", "description", "status",
+                "deadline", "created_at", "updated_at", "group_id", "position", "recurrence")
+# Task columns read with a correlated subquery per row, the task lists only
+# return them when they are named in ?fields=
+TASK_EXTRA_COLUMNS = ("labels", "parent_task", "series")
+
+# Columns of an autocomplete hit, passwords are never included
+USER_PREFIX_COLUMNS = ("unique_user", "name", "email")
+
+# Columns of a group member, "role" comes from the membership row
+MEMBER_COLUMNS = ("id", "unique_user", "name", "email", "role")
+
+# Columns of a task in the personal task list of a user
+USER_TASK_COLUMNS = TASK_COLUMNS + ("group_name",)
+
+# Columns of a task nested in a subtree, parent_task places it under its parent
+SUBTASK_COLUMNS = TASK_COLUMNS + ("parent_task",)
+
+# Columns returned by the item endpoints
+USER_ITEM_COLUMNS = ("name", "email", "unique_user")
+TASK_ITEM_COLUMNS = ("id", "title", "description", "status",
+                     "deadline", "created_at", "updated_at", "group_id", "position",
+                     "labels", "parent_task", "recurrence", "series")
+
+# 404 responses of the group scoped lookups
+GROUP_NOT_FOUND = {"error": "Group not found"}, 404
+TASK_NOT_FOUND = {"error": "Task not found"}, 404
+USER_NOT_FOUND = {"error": "User not found"}, 404
+
+
+def uuid7():
+    """Time-ordered UUID version 7: 48 bits of Unix milliseconds, then random bits
+
+    New ids sort after older ones, so inserts land at the end of the unique
+    indexes instead of at random places.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76  # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122 variant
+    return uuid.UUID(int=value)
+
+
+def new_unique_id(kind):
+    """Generate the unique id of a new user, group or task as a string
+
+    The version is taken from the UUID_VERSIONS setting (4 or 7) of the kind.
+    Collisions are left to the unique index of the column.
+    """
+    versions = current_app.config.get("UUID_VERSIONS", DEFAULT_UUID_VERSIONS)
+    if versions.get(kind, DEFAULT_UUID_VERSIONS[kind]) == 4:
+        return str(uuid.uuid4())
+    return str(uuid7())
+
+
+def requested_columns(columns, key=None, extra=()):
+    """Narrow the response columns to the ones named in ?fields=
+
+    The key column is always kept so clients can still address the rows.
+    The extra columns are only returned when they are named.
+    Raises ValueError if a requested field is not part of the resource.
+    """
+    fields = request.args.get("fields")
+    if not fields:
+        return columns
+    wanted = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = wanted.difference(columns, extra)
+    if unknown:
+        raise ValueError("Unknown field(s): " + ", ".join(sorted(unknown)))
+    if not wanted:
+        return columns
+    if key:
+        wanted.add(key)
+    return tuple(name for name in columns + extra if name in wanted)
+
+
+def int_arg(name, default, maximum=None):
+    """Read a non-negative integer query parameter, capped at maximum
+
+    Raises ValueError if the parameter is not a valid integer.
+    """
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+    if number < 0:
+        raise ValueError(f"{name} must not be negative")
+    if maximum is not None:
+        number = min(number, maximum)
+    return number
+
+
+def select_columns(model, columns, *criteria):
+    """Build a Core SELECT for the given column names of a model.
+
+    Only the named columns are read, so no ORM objects are hydrated and
+    unused columns (like task descriptions) are never loaded.
+    """
+    stmt = select(*(getattr(model, name) for name in columns))
+    if criteria:
+        stmt = stmt.where(*criteria)
+    return stmt
+
+
+def fetch_rows(model, columns, *criteria):
+    """Run a projection query and return the plain row tuples"""
+    return db.session.execute(select_columns(model, columns, *criteria)).all()
+
+
+def fetch_row(model, columns, *criteria):
+    """Run a projection query and return the first row tuple or None"""
+    return db.session.execute(select_columns(model, columns, *criteria)).first()
+
+
+def fetch_members(group_id, columns=MEMBER_COLUMNS):
+    """Fetch the members of a group with their role in a single joined query"""
+    stmt = (
+        select(*(getattr(UserGroup if name == "role" else User, name) for name in columns))
+        .join(UserGroup, UserGroup.user_id == User.id)
+        .where(UserGroup.group_id == group_id)
+    )
+    return db.session.execute(stmt).all()
+
+
+def _ascii_lower(value):
+    " Lower-case like SQLite's lower(), which only folds ASCII letters"
+    return "".join(char.lower() if char.isascii() else char for char in value)
+
+
+def _prefix_end(prefix):
+    " The smallest string after every string starting with prefix, None if there is none"
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    following = ord(prefix[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        # Surrogates cannot be stored, the next character is U+E000
+        following = 0xE000
+    return prefix[:-1] + chr(following)
+
+
+def fetch_users_by_prefix(prefix, limit):
+    """Find users whose name or email starts with prefix, ignoring case
+
+    Each lookup is a range scan on the lower(name) / lower(email) expression
+    indexes reading at most limit rows, so the cost does not depend on the
+    size of the user table.
+    """
+    low = _ascii_lower(prefix)
+    high = _prefix_end(low)
+    columns = [getattr(User, name) for name in USER_PREFIX_COLUMNS]
+    found = {}
+    for column in (User.name, User.email):
+        key = db.func.lower(column)
+        stmt = select(*columns).where(key >= low).order_by(key).limit(limit)
+        if high is not None:
+            stmt = stmt.where(key < high)
+        for row in db.session.execute(stmt):
+            found.setdefault(row.unique_user, row)
+    return sorted(found.values(), key=lambda row: (_ascii_lower(row.name), row.email))[:limit]
+
+
+def fetch_user_tasks(unique_user, columns, due_before=None, statuses=None, limit=None,
+                     assigned=False):
+    """Fetch the tasks of every group a user belongs to in one joined query,
+    or with assigned only the tasks assigned to the user
+
+    Tasks with the nearest deadline come first, tasks without a deadline
+    last, so limit gives the top-k most urgent tasks.
+    """
+    selected = [Group.name if name == "group_name" else getattr(Task, name) for name in columns]
+    stmt = select(*selected).select_from(User)
+    if assigned:
+        stmt = (
+            stmt.join(TaskAssignee, TaskAssignee.user_id == User.id)
+            .join(Task, Task.id == TaskAssignee.task_id)
+            .join(Group, Group.id == Task.group_id)
+        )
+    else:
+        stmt = (
+            stmt.join(UserGroup, UserGroup.user_id == User.id)
+            .join(Group, Group.id == UserGroup.group_id)
+            .join(Task, Task.group_id == Group.id)
+        )
+    stmt = (
+        stmt.where(User.unique_user == unique_user)
+        .order_by(Task.deadline.is_(None), Task.deadline, Task.id)
+    )
+    if due_before is not None:
+        stmt = stmt.where(Task.deadline < due_before)
+    if statuses:
+        stmt = stmt.where(Task.status.in_(statuses))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.session.execute(stmt).all()
+
+
+def _in_group(group_id, *selected):
+    " SELECT the group id and the selected columns, joining from the group"
+    return select(Group.id, *selected).select_from(Group).where(Group.id == group_id)
+
+
+def _task_of_group(unique_task):
+    " Join condition for a task of the group"
+    return (Task.group_id == Group.id) & (Task.unique_task == unique_task)
+
+
+def _unknown_task(group_id, unique_task):
+    " The 404 response if the group or the task certainly does not exist"
+    if not negative_cache.might_exist("group", group_id):
+        return GROUP_NOT_FOUND
+    # A missing task is answered from memory only in a group known to exist
+    if (negative_cache.known("group", group_id)
+            and not negative_cache.might_exist("task", unique_task)):
+        return TASK_NOT_FOUND
+    return None
+
+
+def lookup_task(group_id, unique_task):
+    """Load a task of a group, resolving the group and the task in one query
+
+    Returns (task, None), or (None, response) with the 404 response telling
+    whether the group or the task was not found.
+    """
+    error = _unknown_task(group_id, unique_task)
+    if error:
+        return None, error
+    row = db.session.execute(
+        _in_group(group_id, Task).outerjoin(Task, _task_of_group(unique_task))
+    ).first()
+    if row is None:
+        return None, GROUP_NOT_FOUND
+    if row[1] is None:
+        return None, TASK_NOT_FOUND
+    return row[1], None
+
+
+def lookup_task_row(group_id, unique_task, columns):
+    """Like lookup_task, but returns a row of the given task columns"""
+    error = _unknown_task(group_id, unique_task)
+    if error:
+        return None, error
+    row = db.session.execute(
+        _in_group(group_id, Task.id, *(getattr(Task, name) for name in columns))
+        .outerjoin(Task, _task_of_group(unique_task))
+    ).first()
+    if row is None:
+        return None, GROUP_NOT_FOUND
+    if row[1] is None:
+        return None, TASK_NOT_FOUND
+    return row[2:], None
+
+
+def lookup_group(group_id):
+    """Load a group for the resources that work on the group row itself or
+    whose data is not read with one query
+
+    Returns (group, None), or (None, GROUP_NOT_FOUND).
+    """
+    if not negative_cache.might_exist("group", group_id):
+        return None, GROUP_NOT_FOUND
+    group = db.session.get(Group, group_id)
+    if group is None:
+        return None, GROUP_NOT_FOUND
+    return group, None
+
+
+def fetch_group_rows(group_id, entity, onclause, *selected, order_by=()):
+    """Fetch the selected columns of the entity rows joined to a group by
+    onclause in one query, None if there is no such group"""
+    if not negative_cache.might_exist("group", group_id):
+        return None
+    rows = db.session.execute(
+        _in_group(group_id, entity.id, *selected)
+        .outerjoin(entity, onclause)
+        .order_by(*order_by)
+    ).all()
+    if not rows:
+        return None
+    return [row[2:] for row in rows if row[1] is not None]
+
+
+def fetch_group_tasks(group_id, columns, *criteria):
+    """Fetch the task rows of a group matching the criteria in position order
+    in one query, None if there is no such group"""
+    return fetch_group_rows(
+        group_id, Task, and_(Task.group_id == Group.id, *criteria),
+        *(getattr(Task, name) for name in columns),
+        order_by=(Task.position.is_(None), Task.position, Task.id)
+    )
+
+
+def fetch_group_members(group_id, columns=MEMBER_COLUMNS):
+    """Fetch the members of a group in one query, None if there is no such group"""
+    if not negative_cache.might_exist("group", group_id):
+        return None
+    members = UserGroup.__table__.join(User.__table__, User.id == UserGroup.user_id)
+    rows = db.session.execute(
+        _in_group(group_id, UserGroup.id,
+                  *(getattr(UserGroup if name == "role" else User, name) for name in columns))
+        .outerjoin(members, UserGroup.group_id == Group.id)
+        .order_by(UserGroup.id)
+    ).all()
+    if not rows:
+        return None
+    return [row[2:] for row in rows if row[1] is not None]
+
+
+def lookup_membership(group_id, unique_user):
+    """Resolve a group, a user and the membership of the user in it in one query
+
+    Returns (user, membership, None) where membership is None if the user is
+    not in the group, or (None, None, response) with the 404 response.
+    """
+    if not negative_cache.might_exist("group", group_id):
+        return None, None, GROUP_NOT_FOUND
+    if (negative_cache.known("group", group_id)
+            and not negative_cache.might_exist("user", unique_user)):
+        return None, None, USER_NOT_FOUND
+    row = db.session.execute(
+        _in_group(group_id, User, UserGroup)
+        .outerjoin(User, User.unique_user == unique_user)
+        .outerjoin(UserGroup, (UserGroup.user_id == User.id) & (UserGroup.group_id == Group.id))
+    ).first()
+    if row is None:
+        return None, None, GROUP_NOT_FOUND
+    if row[1] is None:
+        return None, None, USER_NOT_FOUND
+    return row[1], row[2], None
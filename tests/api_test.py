@@ -16,13 +16,30 @@ The structure of tests:
 
 import uuid
 import time
+import threading
 import os
+import subprocess
+import sys
 import tempfile
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
 import pytest
 from flask.testing import FlaskClient
+from sqlalchemy import event
 from werkzeug.datastructures import Headers
-from task_manager import create_app, db
-from task_manager.models import User, Group, ApiKey, UserGroup
+from task_manager import cache, create_app, db
+from task_manager.archive import archive_tasks
+from task_manager.changes import compact_changes
+from task_manager.check_deadlines import DEFAULT_RECIPIENT, due_reminders
+from task_manager.compression import Compress
+from task_manager.events import Broker, broker
+from task_manager.negative_cache import BloomFilter, KnownIds
+from task_manager.ordering import POSITION_MAX_LENGTH, evenly_spaced_keys, key_between
+from task_manager.recurrence import occurrences
+from task_manager.models import User, Group, ApiKey, UserGroup, Task, TaskArchive, TaskRevision
+from task_manager.serializers import build_encoder, dumps, encode_rows
+from task_manager.utils import uuid7
 
 TEST_KEY = "tepontarinat"
 
@@ -50,7 +67,8 @@ def client():
     db_fd, db_fname = tempfile.mkstemp()
     config = {
         "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
-        "TESTING": True
+        "TESTING": True,
+        "CACHE_TYPE": "SimpleCache"
     }
 
     app = create_app(config)
@@ -96,6 +114,25 @@ def _populate_db():
     for user in User.query.all():
         print(user.serialize())
 
+
+def _create_group_tasks(client, name, *tasks):
+    """
+    Create a group and a task in it for each title or dict of task fields,
+    fields left out get default values. Returns the group id and the
+    unique_task of the tasks by title
+    """
+    group_id = client.post("/api/groups/", json={"name": name}).get_json()["group_id"]
+    created = {}
+    for task in tasks:
+        if isinstance(task, str):
+            task = {"title": task}
+        task = dict({"description": "Task", "status": 0,
+                     "deadline": "2025-03-03T10:00:00"}, **task)
+        resp = client.post(f"/api/groups/{group_id}/tasks/", json=task)
+        assert resp.status_code == 201
+        created[task["title"]] = resp.get_json()["unique_task"]
+    return group_id, created
+
 class TestUserCollection:
     """
     Test the UserCollection resource
@@ -715,6 +752,51 @@ class TestGroupTaskCollection:
         tasks = resp.get_json()
         assert len(tasks) == 3, "Expected 3 tasks"
 
+    def test_task_list_fields(self, client):
+        "Test that the task list returns every column with ISO formatted dates"
+        group_resp = client.post(self.RESOURCE_URL, json={"name": "Task Group"})
+        group_id = group_resp.get_json()["group_id"]
+        task_resp = client.post(
+            f"{self.RESOURCE_URL}{group_id}/tasks/",
+            json={
+                "title": "Listed Task",
+                "description": "Listed description",
+                "status": 0,
+                "deadline": "2025-12-31T23:59:59"
+            }
+        )
+        assert task_resp.status_code == 201
+
+        resp = client.get(f"{self.RESOURCE_URL}{group_id}/tasks/")
+        assert resp.status_code == 200
+        task = resp.get_json()[0]
+        assert set(task) == {"id", "unique_task", "title", "description", "status",
+                             "deadline", "created_at", "updated_at", "group_id", "position",
+                             "recurrence"}
+        assert task["unique_task"] == task_resp.get_json()["unique_task"]
+        assert task["deadline"] == "2025-12-31T23:59:59"
+        assert task["group_id"] == group_id
+
+        resp = client.get(f"{self.RESOURCE_URL}{group_id}/tasks/"
+                          "?fields=title,labels,parent_task,series")
+        assert resp.get_json() == [{"unique_task": task["unique_task"], "title": "Listed Task",
+                                    "labels": [], "parent_task": None, "series": None}]
+
+    def test_task_list_without_subqueries(self, client):
+        "test that the default task list reads no correlated subquery per row"
+        statements = []
+        with client.application.app_context():
+            engine = db.engine
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            client.get(f"{self.RESOURCE_URL}1/tasks/")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        listed = [statement for statement in statements if "FROM \"group\"" in statement]
+        assert listed and all(statement.count("SELECT") == 1 for statement in listed)
+
     def test_create_task_with_missing_fields(self, client):
         "Test creating a task with missing fields"
         # Create a group
@@ -776,3 +858,1525 @@ class TestGroupTaskItem:
         assert retrieved_task["description"] == "Task description"
 
 
+
+class TestSparseFieldsets:
+    "Test narrowing responses with the ?fields= query parameter"
+
+    TASK = {"title": "Kanban Task", "description": "A long description",
+            "deadline": "2025-12-31T23:59:59"}
+
+    def test_task_collection_fields(self, client):
+        "test that the task collection returns only the requested fields and the key"
+        group_id, tasks = _create_group_tasks(client, "Fields Group", self.TASK)
+        unique_task = tasks["Kanban Task"]
+        resp = client.get(f"/api/groups/{group_id}/tasks/?fields=title,status,deadline")
+        assert resp.status_code == 200
+        assert resp.get_json() == [{
+            "unique_task": unique_task,
+            "title": "Kanban Task",
+            "status": 0,
+            "deadline": "2025-12-31T23:59:59"
+        }]
+
+    def test_task_item_fields(self, client):
+        "test narrowing a single task"
+        group_id, tasks = _create_group_tasks(client, "Fields Group", self.TASK)
+        unique_task = tasks["Kanban Task"]
+        resp = client.get(f"/api/groups/{group_id}/tasks/{unique_task}/?fields=title")
+        assert resp.status_code == 200
+        assert resp.get_json() == {"title": "Kanban Task"}
+
+    def test_user_and_group_fields(self, client):
+        "test narrowing the user and group collections"
+        resp = client.get("/api/users/?fields=name")
+        assert resp.status_code == 200
+        assert all(set(user) == {"unique_user", "name"} for user in resp.get_json())
+
+        resp = client.get("/api/groups/?fields=name")
+        assert resp.status_code == 200
+        assert all(set(group) == {"id", "name"} for group in resp.get_json())
+
+        resp = client.get("/api/groups/1/?fields=unique_group")
+        assert resp.status_code == 200
+        assert set(resp.get_json()) == {"unique_group"}
+
+    def test_unknown_field(self, client):
+        "test that unknown fields are rejected"
+        resp = client.get("/api/users/?fields=name,salary")
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "Unknown field(s): salary"}
+
+class TestSerializers:
+    "Test the row encoders and the JSON backend"
+
+    def test_row_encoder(self):
+        "test that encoders are built once per column list"
+        columns = ("id", "title", "deadline")
+        deadline = datetime(2025, 12, 31, 23, 59, 59)
+        assert build_encoder(columns) is build_encoder(columns)
+        assert encode_rows([(1, "Task", deadline)], columns) == [
+            {"id": 1, "title": "Task", "deadline": deadline}
+        ]
+
+    def test_dumps_datetimes(self):
+        "test that datetimes are written in ISO format"
+        data = [{"deadline": datetime(2025, 12, 31, 23, 59, 59), "status": 0}]
+        assert json.loads(dumps(data)) == [{"deadline": "2025-12-31T23:59:59", "status": 0}]
+
+    def test_json_response(self, client):
+        "test that resources are served through the JSON representation"
+        resp = client.get("/api/groups/")
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/json"
+        assert len(resp.get_json()) == 3
+
+class TestBinaryFormats:
+    "Test MessagePack and CBOR content negotiation and request bodies"
+
+    def test_msgpack_response(self, client):
+        "test that tasks are returned as MessagePack with native datetimes"
+        msgpack = pytest.importorskip("msgpack")
+        group_id = client.post("/api/groups/", json={"name": "Msgpack Group"}).get_json()["group_id"]
+        client.post(
+            f"/api/groups/{group_id}/tasks/",
+            json={"title": "Packed", "description": "Packed task", "status": 0,
+                  "deadline": "2025-12-31T23:59:59"}
+        )
+        resp = client.get(f"/api/groups/{group_id}/tasks/",
+                          headers={"Accept": "application/msgpack"})
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/msgpack"
+        tasks = msgpack.unpackb(resp.data, timestamp=3)
+        assert tasks[0]["title"] == "Packed"
+        assert tasks[0]["deadline"].replace(tzinfo=None) == datetime(2025, 12, 31, 23, 59, 59)
+
+    def test_msgpack_request_body(self, client):
+        "test creating a user with a MessagePack body"
+        msgpack = pytest.importorskip("msgpack")
+        body = msgpack.packb({"name": "Packed User", "email": "packed@example.com",
+                              "password": "secret"})
+        resp = client.post("/api/users/", data=body, content_type="application/msgpack",
+                           headers={"Accept": "application/msgpack"})
+        assert resp.status_code == 201
+        assert msgpack.unpackb(resp.data)["message"] == "User added successfully"
+
+    def test_msgpack_native_deadline(self, client):
+        "test creating and updating a task with a MessagePack timestamp deadline"
+        msgpack = pytest.importorskip("msgpack")
+        url = "/api/groups/1/tasks/"
+        body = msgpack.packb({"title": "Packed deadline", "description": "Task", "status": 0,
+                              "deadline": datetime(2025, 3, 3, 10, tzinfo=timezone.utc)},
+                             datetime=True)
+        resp = client.post(url, data=body, content_type="application/msgpack")
+        assert resp.status_code == 201
+        unique_task = resp.get_json()["unique_task"]
+        assert client.get(f"{url}{unique_task}/").get_json()["deadline"] == "2025-03-03T10:00:00"
+
+        body = msgpack.packb({"deadline": datetime(2025, 4, 4, 12, tzinfo=timezone.utc)},
+                             datetime=True)
+        resp = client.put(f"{url}{unique_task}/", data=body, content_type="application/msgpack")
+        assert resp.status_code == 200
+        assert client.get(f"{url}{unique_task}/").get_json()["deadline"] == "2025-04-04T12:00:00"
+        assert client.put(f"{url}{unique_task}/", json={"deadline": 20250404}).status_code == 400
+
+    def test_cbor_response(self, client):
+        "test that CBOR is negotiated when cbor2 is installed"
+        cbor2 = pytest.importorskip("cbor2")
+        resp = client.get("/api/groups/1/", headers={"Accept": "application/cbor"})
+        assert resp.status_code == 200
+        assert cbor2.loads(resp.data)["name"] == "Test Group 1"
+
+    def test_json_stays_default(self, client):
+        "test that JSON is still returned without an Accept header"
+        resp = client.get("/api/groups/1/")
+        assert resp.mimetype == "application/json"
+
+class TestCompression:
+    "Test gzip compression of large responses and the compressed body cache"
+
+    def _create_users(self, client, count):
+        for i in range(count):
+            client.post("/api/users/", json={"name": f"Compressed User {i}",
+                                             "email": f"compressed{i}@example.com",
+                                             "password": "password"})
+
+    def test_large_response_is_compressed(self, client):
+        "test that a large user list is sent gzip encoded"
+        self._create_users(client, 20)
+        plain = client.get("/api/users/")
+        resp = client.get("/api/users/", headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in resp.headers["Vary"]
+        assert json.loads(gzip.decompress(resp.data)) == plain.get_json()
+
+    def test_small_response_is_not_compressed(self, client):
+        "test that responses under the size threshold are sent as is"
+        resp = client.get("/api/groups/1/", headers={"Accept-Encoding": "gzip"})
+        assert resp.status_code == 200
+        assert "Content-Encoding" not in resp.headers
+        assert resp.get_json()["name"] == "Test Group 1"
+
+    def test_compression_leaves_cache_alone(self, client, monkeypatch):
+        "test that compressed bodies are not written to the application cache"
+        self._create_users(client, 20)
+        writes = []
+        monkeypatch.setattr(cache, "set", lambda *args, **kwargs: writes.append(args))
+        first = client.get("/api/users/", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/api/users/", headers={"Accept-Encoding": "gzip"})
+        assert first.headers["Content-Encoding"] == "gzip"
+        assert first.data == second.data
+        assert not writes
+
+    def test_email_service_compression(self):
+        "test that the email service compresses responses without importing task_manager"
+        email_service = pytest.importorskip("email_service")
+        email_app = email_service.create_app(
+            {"TESTING": True, "CACHE_TYPE": "SimpleCache",
+             "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        assert email_app.config["COMPRESS_MIN_SIZE"] == 500
+        assert email_service.compress.after_request in email_app.after_request_funcs[None]
+        result = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, email_service; assert 'task_manager' not in sys.modules"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=False)
+        assert result.returncode == 0
+
+class TestTaskSearch:
+    "Test full-text search over task titles and descriptions"
+
+    TASKS = ({"title": "Fix login bug", "description": "Users cannot log in with email"},
+             {"title": "Write report", "description": "Quarterly report about the login service"},
+             {"title": "Plan party", "description": "Cake and balloons"})
+
+    def test_search_group_tasks(self, client):
+        "test that matches in titles rank above matches in descriptions"
+        group_id, _ = _create_group_tasks(client, "Search Group", *self.TASKS)
+        resp = client.get(f"/api/groups/{group_id}/tasks/search?q=login")
+        assert resp.status_code == 200
+        titles = [task["title"] for task in resp.get_json()]
+        assert titles == ["Fix login bug", "Write report"]
+
+    def test_search_prefix_and_updates(self, client):
+        "test prefix matching and that the index follows task updates and deletes"
+        group_id, _ = _create_group_tasks(client, "Search Group", *self.TASKS)
+        hits = client.get(f"/api/groups/{group_id}/tasks/search?q=ball").get_json()
+        assert [task["title"] for task in hits] == ["Plan party"]
+
+        unique_task = hits[0]["unique_task"]
+        client.put(f"/api/groups/{group_id}/tasks/{unique_task}/",
+                   json={"description": "Pizza"})
+        assert client.get(f"/api/groups/{group_id}/tasks/search?q=balloons").get_json() == []
+        assert len(client.get(f"/api/groups/{group_id}/tasks/search?q=pizza").get_json()) == 1
+
+        client.delete(f"/api/groups/{group_id}/tasks/{unique_task}/")
+        assert client.get(f"/api/groups/{group_id}/tasks/search?q=pizza").get_json() == []
+
+    def test_search_user_tasks(self, client):
+        "test searching across the groups of a user"
+        group_id, _ = _create_group_tasks(client, "Search Group", *self.TASKS)
+        unique_user = client.post("/api/users/", json={"name": "Searcher",
+                                                       "email": "searcher@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        assert client.get(f"/api/tasks/search?q=report&user={unique_user}").get_json() == []
+
+        client.post(f"/api/groups/{group_id}/users/{unique_user}/", json={"role": "member"})
+        resp = client.get(f"/api/tasks/search?q=report&user={unique_user}")
+        assert resp.status_code == 200
+        assert [task["title"] for task in resp.get_json()] == ["Write report"]
+
+    def test_search_errors(self, client):
+        "test missing query, unknown group and unknown user"
+        assert client.get("/api/groups/1/tasks/search?q=").status_code == 400
+        assert client.get("/api/groups/999/tasks/search?q=x").status_code == 404
+        assert client.get("/api/tasks/search?q=x&user=nobody").status_code == 404
+        # FTS5 syntax in the query is searched as plain text
+        assert client.get('/api/groups/1/tasks/search?q=NEAR(" AND').status_code == 200
+
+class TestUserAutocomplete:
+    "Test prefix autocomplete of users by name and email"
+    RESOURCE_URL = "/api/users/"
+
+    def test_prefix_matches_name_and_email(self, client):
+        "test that the prefix matches names and emails case-insensitively"
+        for name, email in (("Alice Smith", "alice@example.com"),
+                            ("Bob Builder", "ali.b@example.com"),
+                            ("Carol", "carol@example.com")):
+            client.post(self.RESOURCE_URL, json={"name": name, "email": email,
+                                                 "password": "password"})
+        resp = client.get(f"{self.RESOURCE_URL}?prefix=ALI")
+        assert resp.status_code == 200
+        users = resp.get_json()
+        assert [user["name"] for user in users] == ["Alice Smith", "Bob Builder"]
+        assert all(set(user) == {"unique_user", "name", "email"} for user in users)
+
+    def test_prefix_limit(self, client):
+        "test that the number of results is capped"
+        resp = client.get(f"{self.RESOURCE_URL}?prefix=test&limit=2")
+        assert resp.status_code == 200
+        assert len(resp.get_json()) == 2
+
+    def test_empty_prefix(self, client):
+        "test that an empty prefix returns nothing instead of the whole table"
+        resp = client.get(f"{self.RESOURCE_URL}?prefix=")
+        assert resp.status_code == 200
+        assert resp.get_json() == []
+
+    def test_prefix_at_end_of_unicode(self, client):
+        "test prefixes ending in the last code point or right before the surrogates"
+        client.post(self.RESOURCE_URL, json={"name": "t\U0010ffff\U0010ffffx",
+                                             "email": "last@example.com",
+                                             "password": "password"})
+        resp = client.get(self.RESOURCE_URL, query_string={"prefix": "t\U0010ffff"})
+        assert resp.status_code == 200
+        assert [user["email"] for user in resp.get_json()] == ["last@example.com"]
+        resp = client.get(self.RESOURCE_URL, query_string={"prefix": "\U0010ffff"})
+        assert resp.status_code == 200 and resp.get_json() == []
+        resp = client.get(self.RESOURCE_URL, query_string={"prefix": "\ud7ff"})
+        assert resp.status_code == 200 and resp.get_json() == []
+
+class TestGroupStats:
+    "Test the incrementally maintained task statistics of groups"
+
+    def test_stats_follow_task_changes(self, client):
+        "test that counts follow task creation, status changes and deletion"
+        past = (datetime.now() - timedelta(days=2)).isoformat()
+        soon = (datetime.now() + timedelta(days=2)).isoformat()
+        later = (datetime.now() + timedelta(days=30)).isoformat()
+        group_id, tasks = _create_group_tasks(client, "Stats Group",
+                                              {"title": "Late", "deadline": past},
+                                              {"title": "Soon", "deadline": soon},
+                                              {"title": "Later", "deadline": later})
+        late_task = tasks["Late"]
+
+        resp = client.get(f"/api/groups/{group_id}/stats/")
+        assert resp.status_code == 200
+        assert resp.get_json() == {"group_id": group_id, "total": 3, "by_status": {"0": 3},
+                                   "overdue": 1, "due_this_week": 1}
+
+        client.put(f"/api/groups/{group_id}/tasks/{late_task}/", json={"status": 2})
+        stats = client.get(f"/api/groups/{group_id}/stats/").get_json()
+        assert stats["by_status"] == {"0": 2, "2": 1}
+
+        client.delete(f"/api/groups/{group_id}/tasks/{late_task}/")
+        stats = client.get(f"/api/groups/{group_id}/stats/").get_json()
+        assert stats["total"] == 2
+        assert stats["by_status"] == {"0": 2}
+        assert stats["overdue"] == 0
+
+    def test_groups_with_stats(self, client):
+        "test including the statistics in the group collection"
+        group_id, _ = _create_group_tasks(client, "Stats Group",
+                                          {"title": "Counted", "deadline": "2099-01-01T00:00:00"})
+        groups = client.get("/api/groups/?with_stats=1").get_json()
+        stats = {group["id"]: group["stats"] for group in groups}
+        assert stats[group_id]["total"] == 1
+        assert stats[1]["total"] == 0
+        assert "stats" not in client.get("/api/groups/").get_json()[0]
+
+    def test_stats_of_nonexistent_group(self, client):
+        "test getting statistics of a nonexistent group"
+        resp = client.get("/api/groups/999/stats/")
+        assert resp.status_code == 404
+        assert resp.get_json() == {"error": "Group not found"}
+
+class TestTaskTimeline:
+    "Test the deadline histogram of a group"
+
+    def test_day_buckets(self, client):
+        "test counting tasks per day and status"
+        group_id, _ = _create_group_tasks(
+            client, "Timeline Group",
+            {"title": "Task 0", "deadline": "2025-03-03T10:00:00"},
+            {"title": "Task 1", "deadline": "2025-03-03T18:00:00", "status": 2},
+            {"title": "Task 2", "deadline": "2025-03-05T09:00:00"},
+            {"title": "Task 3", "deadline": "2025-04-01T09:00:00"})
+        resp = client.get(f"/api/groups/{group_id}/tasks/timeline?from=2025-03-01&to=2025-03-10")
+        assert resp.status_code == 200
+        assert resp.get_json() == {
+            "group_id": group_id, "bucket": "day", "from": "2025-03-01", "to": "2025-03-10",
+            "buckets": [
+                {"start": "2025-03-03", "counts": {"0": 1, "2": 1}, "total": 2},
+                {"start": "2025-03-05", "counts": {"0": 1}, "total": 1}
+            ]
+        }
+
+    def test_week_buckets(self, client):
+        "test that weeks start on Monday"
+        group_id, _ = _create_group_tasks(
+            client, "Timeline Group",
+            {"title": "Task 0", "deadline": "2025-03-03T10:00:00"},
+            {"title": "Task 1", "deadline": "2025-03-09T23:00:00"},
+            {"title": "Task 2", "deadline": "2025-03-10T01:00:00"})
+        resp = client.get(f"/api/groups/{group_id}/tasks/timeline"
+                          "?from=2025-03-05&to=2025-03-12&bucket=week")
+        data = resp.get_json()
+        assert data["from"] == "2025-03-03"
+        assert data["to"] == "2025-03-17"
+        assert [(b["start"], b["total"]) for b in data["buckets"]] == [("2025-03-03", 2),
+                                                                        ("2025-03-10", 1)]
+
+    def test_cached_past_buckets_are_invalidated(self, client):
+        "test that a task change is visible in previously cached past buckets"
+        group_id, _ = _create_group_tasks(client, "Timeline Group", "Task 0")
+        url = f"/api/groups/{group_id}/tasks/timeline?from=2025-03-01&to=2025-03-10"
+        assert client.get(url).get_json()["buckets"][0]["total"] == 1
+        client.post(f"/api/groups/{group_id}/tasks/",
+                    json={"title": "Late addition", "description": "Timeline task",
+                          "status": 0, "deadline": "2025-03-03T12:00:00"})
+        assert client.get(url).get_json()["buckets"][0]["total"] == 2
+
+    def test_evicted_generation_is_not_reused(self, client):
+        "test that losing the generation of a group never brings back stale buckets"
+        group_id, _ = _create_group_tasks(client, "Timeline Group", "Task 0")
+        url = f"/api/groups/{group_id}/tasks/timeline?from=2025-03-01&to=2025-03-10"
+        key = f"timeline-generation:{group_id}"
+        with client.application.app_context():
+            cache.delete(key)
+        assert client.get(url).get_json()["buckets"][0]["total"] == 1
+        client.post(f"/api/groups/{group_id}/tasks/",
+                    json={"title": "Late addition", "description": "Timeline task",
+                          "status": 0, "deadline": "2025-03-03T12:00:00"})
+        with client.application.app_context():
+            cache.delete(key)
+        assert client.get(url).get_json()["buckets"][0]["total"] == 2
+
+    def test_invalid_parameters(self, client):
+        "test invalid bucket, dates and nonexistent group"
+        assert client.get("/api/groups/1/tasks/timeline?bucket=year").status_code == 400
+        assert client.get("/api/groups/1/tasks/timeline?from=yesterday").status_code == 400
+        assert client.get("/api/groups/1/tasks/timeline"
+                          "?from=2025-03-10&to=2025-03-01").status_code == 400
+        assert client.get("/api/groups/999/tasks/timeline").status_code == 404
+
+
+class TestUserTasks:
+    "Test the personal task list across all groups of a user"
+
+    def _setup(self, client):
+        unique_user = client.post("/api/users/", json={"name": "Busy",
+                                                       "email": "busy@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        tasks = {"Home": [{"title": "Laundry", "deadline": "2025-03-05T10:00:00"},
+                          {"title": "Dishes", "status": 2, "deadline": "2025-03-01T10:00:00"}],
+                 "Work": [{"title": "Report", "deadline": "2025-03-03T10:00:00"},
+                          {"title": "Review", "deadline": "2025-04-01T10:00:00"}],
+                 "Other": [{"title": "Not mine", "deadline": "2025-01-01T10:00:00"}]}
+        for name, group_tasks in tasks.items():
+            group_id, _ = _create_group_tasks(client, name, *group_tasks)
+            if name != "Other":
+                client.post(f"/api/groups/{group_id}/users/{unique_user}/",
+                            json={"role": "member"})
+        return unique_user
+
+    def test_nearest_deadline_first(self, client):
+        "test that tasks of all groups of the user come sorted by deadline"
+        unique_user = self._setup(client)
+        resp = client.get(f"/api/users/{unique_user}/tasks/")
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert [task["title"] for task in data] == ["Dishes", "Report", "Laundry", "Review"]
+        assert data[1]["group_name"] == "Work"
+
+    def test_filters_and_limit(self, client):
+        "test due_before, status and limit"
+        unique_user = self._setup(client)
+        url = f"/api/users/{unique_user}/tasks/"
+        resp = client.get(url + "?status=0&due_before=2025-03-31&limit=1&fields=title")
+        assert resp.get_json() == [{"unique_task": resp.get_json()[0]["unique_task"],
+                                    "title": "Report"}]
+        assert len(client.get(url + "?status=0,2").get_json()) == 4
+
+    def test_errors(self, client):
+        "test unknown user and invalid parameters"
+        assert client.get("/api/users/nobody/tasks/").status_code == 404
+        unique_user = self._setup(client)
+        url = f"/api/users/{unique_user}/tasks/"
+        assert client.get(url + "?limit=x").status_code == 400
+        assert client.get(url + "?status=done").status_code == 400
+        assert client.get(url + "?due_before=soon").status_code == 400
+        assert client.get(url + "?status=1").get_json() == []
+
+
+class TestGroupEmbed:
+    "Test embedding members, tasks and stats in the group detail"
+
+    def test_embed_all(self, client):
+        "test that the whole group page comes in one response with few queries"
+        group_id = client.post("/api/groups/", json={"name": "Page"}).get_json()["group_id"]
+        unique_user = client.post("/api/users/", json={"name": "Member",
+                                                       "email": "member@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        client.post(f"/api/groups/{group_id}/users/{unique_user}/", json={"role": "member"})
+        for i in range(5):
+            client.post(f"/api/groups/{group_id}/tasks/",
+                        json={"title": f"Task {i}", "description": "Page task",
+                              "status": 0, "deadline": "2025-12-31T23:59:59"})
+
+        statements = []
+        with client.application.app_context():
+            engine = db.engine
+        def count(*_args):
+            statements.append(1)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            resp = client.get(f"/api/groups/{group_id}/?embed=members,tasks,stats")
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert data["name"] == "Page"
+        assert unique_user in [member["unique_user"] for member in data["members"]]
+        assert len(data["tasks"]) == 5
+        assert data["stats"]["total"] == 5
+        assert len(statements) <= 5
+
+    def test_embed_errors(self, client):
+        "test without embed, unknown embed and unknown group"
+        assert "tasks" not in client.get("/api/groups/1/").get_json()
+        assert client.get("/api/groups/1/?embed=owner").status_code == 400
+        assert client.get("/api/groups/999/?embed=tasks").status_code == 404
+
+
+class TestBatch:
+    "Test running many requests in one round trip"
+    RESOURCE_URL = "/api/batch"
+
+    def test_batch(self, client):
+        "test that sub-requests run in order and return their own responses"
+        resp = client.post(self.RESOURCE_URL, json=[
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Batch Group"}},
+            {"method": "GET", "path": "/api/groups/1/?fields=name"},
+            {"method": "GET", "path": "/api/groups/999/"},
+        ])
+        assert resp.status_code == 200
+        data = resp.get_json()
+        assert [item["status"] for item in data] == [201, 200, 404]
+        assert data[0]["body"]["message"] == "Group added successfully"
+        assert data[1]["body"] == {"name": "Test Group 1"}
+
+    def test_atomic_batch_rolls_back(self, client):
+        "test that a failing sub-request undoes the whole atomic batch"
+        group_count = len(client.get("/api/groups/").get_json())
+        resp = client.post(self.RESOURCE_URL + "?atomic=1", json=[
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Rolled back"}},
+            {"method": "POST", "path": "/api/groups/1/tasks/", "body": {"title": "No fields"}},
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Never run"}},
+        ])
+        assert resp.status_code == 400
+        assert [item["status"] for item in resp.get_json()["responses"]] == [201, 400]
+        assert len(client.get("/api/groups/").get_json()) == group_count
+
+        resp = client.post(self.RESOURCE_URL + "?atomic=1", json=[
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Kept 1"}},
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Kept 2"}},
+        ])
+        assert resp.status_code == 200
+        assert len(client.get("/api/groups/").get_json()) == group_count + 2
+
+    def test_failed_item_is_not_committed_by_the_next(self, client):
+        "test that the changes of a failed sub-request are dropped before the next one runs"
+        unique_task = client.post("/api/groups/1/tasks/", json={
+            "title": "Batched", "description": "Task", "status": 0,
+            "deadline": "2025-03-03T10:00:00"}).get_json()["unique_task"]
+        resp = client.post(self.RESOURCE_URL, json=[
+            {"method": "PUT", "path": f"/api/groups/1/tasks/{unique_task}/",
+             "body": {"title": "HALF-APPLIED", "status": "bad"}},
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Committed"}},
+        ])
+        assert [item["status"] for item in resp.get_json()] == [400, 201]
+        task = client.get(f"/api/groups/1/tasks/{unique_task}/").get_json()
+        assert task["title"] == "Batched"
+
+    def test_invalid_batches(self, client):
+        "test invalid bodies and nested batches"
+        assert client.post(self.RESOURCE_URL, data="x").status_code == 415
+        assert client.post(self.RESOURCE_URL, json=[]).status_code == 400
+        assert client.post(self.RESOURCE_URL, json=[{"method": "PATCH",
+                                                     "path": "/api/groups/"}]).status_code == 400
+        assert client.post(self.RESOURCE_URL, json=[{"path": "groups"}]).status_code == 400
+        assert client.post(self.RESOURCE_URL, json=[{"method": "POST",
+                                                     "path": "/api/batch"}]).status_code == 400
+
+    def test_streams_are_refused(self, client):
+        "test that the event stream cannot be a batch item"
+        group_count = len(client.get("/api/groups/").get_json())
+        resp = client.post(self.RESOURCE_URL + "?atomic=1", json=[
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "Before"}},
+            {"method": "GET", "path": "/api/groups/1/events"},
+            {"method": "POST", "path": "/api/groups/", "body": {"name": "After"}},
+        ])
+        assert resp.status_code == 400
+        assert "stream" in resp.get_json()["error"]
+        assert broker.subscriber_count(1) == 0
+        assert len(client.get("/api/groups/").get_json()) == group_count
+
+
+class TestChangeFeed:
+    "Test the change feed clients sync from"
+    RESOURCE_URL = "/api/changes"
+
+    def test_changes_since_cursor(self, client):
+        "test that only the changes after the cursor are returned, in order"
+        cursor = client.get(self.RESOURCE_URL).get_json()["cursor"]
+        group_id = client.post("/api/groups/", json={"name": "Sync"}).get_json()["group_id"]
+        unique_task = client.post(f"/api/groups/{group_id}/tasks/",
+                                  json={"title": "Sync task", "description": "Task",
+                                        "status": 0, "deadline": "2025-03-03T10:00:00"}
+                                  ).get_json()["unique_task"]
+        client.put(f"/api/groups/{group_id}/tasks/{unique_task}/", json={"status": 2})
+
+        data = client.get(f"{self.RESOURCE_URL}?since={cursor}").get_json()
+        assert [(c["entity"], c["action"]) for c in data["changes"]] == [
+            ("group", "create"), ("task", "create"), ("task", "update")]
+        assert data["changes"][1]["changes"]["deadline"] == "2025-03-03T10:00:00"
+        assert data["changes"][2]["changes"] == {"status": 2}
+        assert data["cursor"] == data["changes"][-1]["cursor"]
+        assert not data["has_more"]
+
+        client.delete(f"/api/groups/{group_id}/tasks/{unique_task}/")
+        data = client.get(f"{self.RESOURCE_URL}?since={data['cursor']}").get_json()
+        assert [(c["id"], c["action"]) for c in data["changes"]] == [(unique_task, "delete")]
+
+    def test_group_filter_and_limit(self, client):
+        "test narrowing to a group and paging with limit"
+        client.post("/api/users/", json={"name": "Elsewhere", "email": "else@example.com",
+                                         "password": "password"})
+        client.put("/api/groups/1/", json={"name": "Renamed"})
+        client.put("/api/groups/2/", json={"name": "Other"})
+        data = client.get(f"{self.RESOURCE_URL}?group=1").get_json()
+        assert [(c["entity"], c["changes"]) for c in data["changes"]] == [
+            ("group", {"name": "Renamed"})]
+
+        data = client.get(f"{self.RESOURCE_URL}?limit=2").get_json()
+        assert len(data["changes"]) == 2 and data["has_more"]
+        assert client.get(f"{self.RESOURCE_URL}?since=x").status_code == 400
+
+    def test_compaction(self, client):
+        "test that old entries are merged into the latest entry of each entity"
+        unique_user = client.post("/api/users/", json={"name": "Compact",
+                                                       "email": "compact@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        client.put(f"/api/users/{unique_user}/", json={"name": "Compacted"})
+        client.put(f"/api/users/{unique_user}/", json={"email": "new@example.com"})
+        before = client.get(self.RESOURCE_URL).get_json()["changes"]
+
+        with client.application.app_context():
+            assert compact_changes(datetime.now() + timedelta(seconds=1)) == 2
+
+        after = client.get(self.RESOURCE_URL).get_json()["changes"]
+        assert len(after) == 1
+        assert after[0]["cursor"] == before[-1]["cursor"]
+        assert after[0]["action"] == "create"
+        assert after[0]["changes"] == {"name": "Compacted", "email": "new@example.com"}
+
+
+class TestGroupEvents:
+    "Test the live event stream of a group"
+
+    def test_stream_pushes_committed_changes(self, client):
+        "test that task and membership changes of the group reach the stream"
+        client.application.config["EVENTS_KEEPALIVE"] = 0.1
+        resp = client.get("/api/groups/1/events", buffered=False)
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/event-stream"
+        chunks = iter(resp.response)
+        assert next(chunks).startswith(b"retry:")
+
+        client.post("/api/groups/1/tasks/",
+                    json={"title": "Live task", "description": "Task",
+                          "status": 0, "deadline": "2025-03-03T10:00:00"})
+        client.post("/api/groups/2/tasks/",
+                    json={"title": "Other group", "description": "Task",
+                          "status": 0, "deadline": "2025-03-03T10:00:00"})
+        chunk = next(chunks).decode()
+        assert "event: task\n" in chunk
+        data = json.loads(chunk.split("data: ", 1)[1])
+        assert data["action"] == "create"
+        assert data["changes"]["title"] == "Live task"
+        assert next(chunks) == b": keepalive\n\n"
+        resp.close()
+
+    def test_resume_with_last_event_id(self, client):
+        "test that a reconnecting client receives the changes it missed"
+        client.application.config["EVENTS_KEEPALIVE"] = 0.1
+        cursor = client.get("/api/changes").get_json()["cursor"]
+        client.put("/api/groups/1/", json={"name": "Not an event"})
+        unique_user = client.post("/api/users/", json={"name": "Joiner",
+                                                       "email": "joiner@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        client.post(f"/api/groups/1/users/{unique_user}/", json={"role": "member"})
+
+        resp = client.get("/api/groups/1/events", buffered=False,
+                          headers={"Last-Event-ID": str(cursor)})
+        chunks = iter(resp.response)
+        next(chunks)
+        chunk = next(chunks).decode()
+        assert "event: membership\n" in chunk and unique_user in chunk
+        assert next(chunks) == b": keepalive\n\n"
+        resp.close()
+
+    def test_atomic_batch_publishes_after_commit(self, client):
+        "test that a rolled back batch publishes nothing and a committed one publishes"
+        subscriber = broker.subscribe(1)
+        task = {"method": "POST", "path": "/api/groups/1/tasks/",
+                "body": {"title": "Batched", "description": "Task",
+                         "status": 0, "deadline": "2025-03-03T10:00:00"}}
+        try:
+            client.post("/api/batch?atomic=1",
+                        json=[task, {"method": "GET", "path": "/api/groups/999/"}])
+            assert subscriber.get(0) is None
+            client.post("/api/batch?atomic=1", json=[task])
+            assert subscriber.get(0)["changes"]["title"] == "Batched"
+        finally:
+            broker.unsubscribe(1, subscriber)
+
+    def test_slow_subscriber_is_dropped(self):
+        "test that a full subscriber queue drops the subscriber only"
+        fanout = Broker()
+        slow = fanout.subscribe(1, maxsize=1)
+        fast = fanout.subscribe(1, maxsize=10)
+        fanout.publish(1, {"cursor": 1})
+        fanout.publish(1, {"cursor": 2})
+        assert slow.dropped and not fast.dropped
+        assert fanout.subscriber_count(1) == 1
+        assert [fast.get(0), fast.get(0), fast.get(0)] == [{"cursor": 1}, {"cursor": 2}, None]
+
+    def test_unknown_group(self, client):
+        "test that there is no stream for a nonexistent group"
+        assert client.get("/api/groups/999/events").status_code == 404
+
+
+class TestUniqueIds:
+    "Test the generation of unique ids"
+
+    def test_uuid7_is_time_ordered(self):
+        "test the version, variant and ordering of UUIDv7"
+        first = uuid7()
+        time.sleep(0.002)
+        second = uuid7()
+        assert first.version == 7 and first.variant == uuid.RFC_4122
+        assert str(first) < str(second)
+
+    def test_uuid_version_per_model(self, client):
+        "test that the UUID version can be switched per model"
+        client.application.config["UUID_VERSIONS"] = {"user": 4, "group": 7, "task": 7}
+        unique_user = client.post("/api/users/", json={"name": "Random",
+                                                       "email": "random@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        unique_group = client.post("/api/groups/", json={"name": "Ordered"}
+                                   ).get_json()["unique_group"]
+        assert uuid.UUID(unique_user).version == 4
+        assert uuid.UUID(unique_group).version == 7
+
+
+class TestUniqueConstraints:
+    "Test that duplicates are rejected by the unique constraints"
+
+    def test_duplicate_task_title(self, client):
+        "test duplicate titles in a group, on create and on update"
+        task = {"title": "Only once", "description": "Task", "status": 0,
+                "deadline": "2025-03-03T10:00:00"}
+        assert client.post("/api/groups/1/tasks/", json=task).status_code == 201
+        resp = client.post("/api/groups/1/tasks/", json=task)
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "Task already exists"}
+        assert client.post("/api/groups/2/tasks/", json=task).status_code == 201
+
+        task["title"] = "Second"
+        unique_task = client.post("/api/groups/1/tasks/", json=task).get_json()["unique_task"]
+        resp = client.put(f"/api/groups/1/tasks/{unique_task}/", json={"title": "Only once"})
+        assert resp.status_code == 400
+        # The failed create left the statistics untouched
+        assert client.get("/api/groups/1/stats/").get_json()["total"] == 2
+
+    def test_duplicate_membership(self, client):
+        "test adding a user to a group twice through both endpoints"
+        unique_user = client.post("/api/users/", json={"name": "Twice",
+                                                       "email": "twice@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        url = f"/api/groups/1/users/{unique_user}/"
+        assert client.post(url, json={"role": "member"}).status_code == 201
+        resp = client.post(url, json={"role": "member"})
+        assert resp.get_json() == {"error": "User is already in the group"}
+        resp = client.post("/api/groups/1/users/",
+                           json={"unique_user": unique_user, "role": "member"})
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "User is already in this group"}
+
+    def test_duplicate_email_on_update(self, client):
+        "test changing the email to the one of another user"
+        unique_user = client.get("/api/users/").get_json()[0]["unique_user"]
+        resp = client.put(f"/api/users/{unique_user}/", json={"email": "testemail2@gmail.com"})
+        assert resp.status_code == 400
+        assert resp.get_json() == {"error": "Email is already in use"}
+
+
+class TestGroupScopedLookups:
+    "Test that group scoped endpoints resolve the group and the item in one query"
+
+    @staticmethod
+    def _count_queries(client, method, url, **kwargs):
+        statements = []
+        with client.application.app_context():
+            engine = db.engine
+        def count(_conn, _cursor, statement, *_args):
+            if statement.lstrip().upper().startswith("SELECT"):
+                statements.append(statement)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            resp = getattr(client, method)(url, **kwargs)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        return resp, len(statements)
+
+    def test_task_item_single_query(self, client):
+        "test the task item and collection with one SELECT each"
+        unique_task = client.post("/api/groups/1/tasks/",
+                                  json={"title": "Scoped", "description": "Task",
+                                        "status": 0, "deadline": "2025-03-03T10:00:00"}
+                                  ).get_json()["unique_task"]
+        # The first lookup loads the known ids of the negative cache
+        client.get("/api/groups/1/tasks/unknown/")
+        resp, queries = self._count_queries(client, "get",
+                                            f"/api/groups/1/tasks/{unique_task}/")
+        assert resp.get_json()["title"] == "Scoped" and queries == 1
+        resp, queries = self._count_queries(client, "get", "/api/groups/1/tasks/")
+        assert len(resp.get_json()) == 1 and queries == 1
+        resp, queries = self._count_queries(client, "get", "/api/groups/2/tasks/")
+        assert resp.get_json() == [] and queries == 1
+
+    def test_not_found_distinction(self, client):
+        "test that a missing group and a missing task give different 404s"
+        assert client.get("/api/groups/999/tasks/x/").get_json() == {"error": "Group not found"}
+        assert client.get("/api/groups/1/tasks/x/").get_json() == {"error": "Task not found"}
+        assert client.put("/api/groups/1/tasks/x/", json={}).status_code == 404
+        assert client.delete("/api/groups/999/tasks/x/").status_code == 404
+        assert client.get("/api/groups/999/users/").get_json() == {"error": "Group not found"}
+        assert client.put("/api/groups/1/users/nobody/",
+                          json={"role": "admin"}).get_json() == {"error": "User not found"}
+
+    def test_group_scoped_collections(self, client):
+        "test that labels are read with one SELECT and deleted groups with none"
+        group_id = client.post("/api/groups/", json={"name": "Gone"}).get_json()["group_id"]
+        client.delete(f"/api/groups/{group_id}/")
+        resp, queries = self._count_queries(client, "get", "/api/groups/1/labels/")
+        assert resp.get_json() == [] and queries == 1
+        for path in ("labels/", "stats/", "tasks/search?q=x", "tasks/timeline",
+                     "tasks/occurrences"):
+            resp, queries = self._count_queries(client, "get", f"/api/groups/{group_id}/{path}")
+            assert resp.get_json() == {"error": "Group not found"} and queries == 0, path
+        resp, queries = self._count_queries(client, "put", f"/api/groups/{group_id}/",
+                                            json={"name": "X"})
+        assert resp.status_code == 404 and queries == 0
+        assert client.get("/api/groups/999/labels/").get_json() == {"error": "Group not found"}
+
+    def test_membership_single_query(self, client):
+        "test that the group, user and membership are resolved with one SELECT"
+        unique_user = client.get("/api/users/").get_json()[1]["unique_user"]
+        client.get("/api/groups/2/users/")
+        client.get(f"/api/users/{unique_user}/")
+        resp, queries = self._count_queries(client, "post", f"/api/groups/2/users/{unique_user}/",
+                                            json={"role": "member"})
+        assert resp.status_code == 201 and queries == 1
+        resp, queries = self._count_queries(client, "put", f"/api/groups/2/users/{unique_user}/",
+                                            json={"role": "admin"})
+        assert resp.status_code == 200 and queries == 1
+        assert client.get("/api/groups/2/users/").get_json()[-1]["role"] == "admin"
+
+
+class TestNegativeCache:
+    "Test answering lookups of unknown ids without the database"
+
+    def test_bloom_filter(self):
+        "test that added keys are always found and few others are"
+        bloom = BloomFilter(1000)
+        keys = [str(uuid.uuid4()) for _ in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(2000))
+        assert false_positives < 100
+
+    def test_unknown_ids_skip_database(self, client):
+        "test that unknown ids are answered from memory and created ones are found"
+        # A UUIDv7 of 1970, older than any rebuild
+        unknown = "00000000-0000-7000-8000-000000000000"
+        client.get(f"/api/users/{unknown}/")
+        client.get(f"/api/groups/1/tasks/{unknown}/")
+        resp, queries = TestGroupScopedLookups._count_queries(client, "get",
+                                                              f"/api/users/{unknown}/")
+        assert resp.status_code == 404 and queries == 0
+        resp, queries = TestGroupScopedLookups._count_queries(
+            client, "get", f"/api/groups/1/tasks/{unknown}/")
+        assert resp.get_json() == {"error": "Task not found"} and queries == 0
+
+        unique_user = client.post("/api/users/", json={"name": "New",
+                                                       "email": "new@example.com",
+                                                       "password": "password"}
+                                  ).get_json()["unique_user"]
+        assert client.get(f"/api/users/{unique_user}/").status_code == 200
+        group_id = client.post("/api/groups/", json={"name": "New"}).get_json()["group_id"]
+        assert client.get(f"/api/groups/{group_id}/tasks/").status_code == 200
+        client.delete(f"/api/groups/{group_id}/")
+        resp, queries = TestGroupScopedLookups._count_queries(
+            client, "get", f"/api/groups/{group_id}/tasks/")
+        assert resp.status_code == 404 and queries == 0
+
+    def test_ids_without_creation_time_are_looked_up(self, client):
+        "test that misses for ids that are not UUIDv7 always reach the database"
+        client.get("/api/users/unknown/")
+        resp, queries = TestGroupScopedLookups._count_queries(client, "get",
+                                                              "/api/users/unknown/")
+        assert resp.status_code == 404 and queries > 0
+        with client.application.app_context():
+            db.session.add(Task(unique_task=f"{uuid.uuid4()}@2025-03-03", title="Elsewhere",
+                                description="Task", status=0, created_at=datetime.now(),
+                                updated_at=datetime.now(), group_id=1))
+            db.session.commit()
+            unique_task = db.session.execute(
+                db.select(Task.unique_task).where(Task.title == "Elsewhere")).scalar()
+        assert client.get(f"/api/groups/1/tasks/{unique_task}/").status_code == 200
+
+    def test_cache_expires(self, client):
+        "test that ids created outside the API are known after a background rebuild"
+        client.application.config["NEGATIVE_CACHE_TTL"] = 0.05
+        assert client.get("/api/users/direct/").status_code == 404
+        with client.application.app_context():
+            db.session.add(User(unique_user="direct", name="Direct",
+                                email="direct@example.com", password="password"))
+            db.session.commit()
+        time.sleep(0.1)
+        for _ in range(50):
+            if client.get("/api/users/direct/").status_code == 200:
+                break
+            time.sleep(0.02)
+        assert client.get("/api/users/direct/").status_code == 200
+
+    def test_ids_newer_than_rebuild_are_looked_up(self, client):
+        "test that ids created by another process since the last rebuild are found"
+        assert client.get("/api/users/unknown/").status_code == 404
+        with client.application.app_context():
+            db.session.add(User(unique_user=str(uuid7()), name="Elsewhere",
+                                email="elsewhere@example.com", password="password"))
+            db.session.add(Group(name="Elsewhere", unique_group=str(uuid7())))
+            db.session.commit()
+            unique_user = db.session.execute(
+                db.select(User.unique_user).where(User.name == "Elsewhere")).scalar()
+            group_id = db.session.execute(
+                db.select(Group.id).where(Group.name == "Elsewhere")).scalar()
+        assert client.get(f"/api/users/{unique_user}/").status_code == 200
+        assert client.get(f"/api/groups/{group_id}/tasks/").status_code == 200
+
+    def test_concurrent_rebuilds(self, client):
+        "test that one rebuild runs at a time and ids created while loading are kept"
+        loading, release = threading.Event(), threading.Event()
+        running, overlaps = [], []
+
+        def load():
+            running.append(1)
+            overlaps.append(len(running))
+            loading.set()
+            release.wait(5)
+            running.pop()
+            return ["loaded"]
+
+        known = KnownIds(client.application, load)
+        threads = [threading.Thread(target=known.might_exist, args=("x", 60)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        assert loading.wait(5)
+        known.add("created")
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert overlaps == [1]
+        assert known.might_exist("loaded", 60) and known.might_exist("created", 60)
+
+        # Expired ids are rebuilt in the background, never two at a time
+        threads = [threading.Thread(target=known.might_exist, args=("x", 0)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        while known._rebuilding.locked():  # pylint: disable=protected-access
+            time.sleep(0.01)
+        assert max(overlaps) == 1
+        assert known.might_exist("loaded", 60)
+
+
+class TestTaskOrdering:
+    "Test the manual order of the tasks of a group"
+
+    @staticmethod
+    def _titles(client, group_id):
+        return [task["title"] for task in client.get(f"/api/groups/{group_id}/tasks/").get_json()]
+
+    def test_move(self, client):
+        "test moving a task after another task and to the top"
+        group_id, cards = _create_group_tasks(client, "Board", "Card 0", "Card 1", "Card 2")
+        tasks = list(cards.values())
+        assert self._titles(client, group_id) == ["Card 0", "Card 1", "Card 2"]
+
+        resp = client.post(f"/api/groups/{group_id}/tasks/{tasks[2]}/move",
+                           json={"after": tasks[0]})
+        assert resp.status_code == 200
+        assert self._titles(client, group_id) == ["Card 0", "Card 2", "Card 1"]
+
+        client.post(f"/api/groups/{group_id}/tasks/{tasks[1]}/move", json={"after": None})
+        assert self._titles(client, group_id) == ["Card 1", "Card 0", "Card 2"]
+
+    def test_move_writes_one_row(self, client):
+        "test that a move updates only the moved task"
+        group_id, cards = _create_group_tasks(client, "Board",
+                                              "Card 0", "Card 1", "Card 2", "Card 3")
+        tasks = list(cards.values())
+        before = {task["unique_task"]: task["position"]
+                  for task in client.get(f"/api/groups/{group_id}/tasks/").get_json()}
+        client.post(f"/api/groups/{group_id}/tasks/{tasks[0]}/move", json={"after": tasks[2]})
+        after = {task["unique_task"]: task["position"]
+                 for task in client.get(f"/api/groups/{group_id}/tasks/").get_json()}
+        assert [key for key in tasks if before[key] != after[key]] == [tasks[0]]
+
+    def test_rebalance_long_keys(self, client):
+        "test that repeated moves into one gap end in a rebalance with short keys"
+        group_id, cards = _create_group_tasks(client, "Board", "Card 0", "Card 1", "Card 2")
+        tasks = list(cards.values())
+        lengths = []
+        for i in range(120):
+            moved = tasks[1] if i % 2 else tasks[2]
+            resp = client.post(f"/api/groups/{group_id}/tasks/{moved}/move",
+                               json={"after": tasks[0]})
+            lengths.append(len(resp.get_json()["position"]))
+        # Keys grew in the gap and were reset by a rebalance
+        assert max(lengths) <= POSITION_MAX_LENGTH
+        assert any(short < long for long, short in zip(lengths, lengths[1:]))
+        positions = [task["position"]
+                     for task in client.get(f"/api/groups/{group_id}/tasks/").get_json()]
+        assert positions == sorted(positions)
+        assert max(len(position) for position in positions) <= POSITION_MAX_LENGTH
+
+    def test_invalid_moves(self, client):
+        "test moves without after, after itself and after an unknown task"
+        group_id, cards = _create_group_tasks(client, "Board", "Card 0", "Card 1")
+        tasks = list(cards.values())
+        url = f"/api/groups/{group_id}/tasks/{tasks[0]}/move"
+        assert client.post(url, json={}).status_code == 400
+        assert client.post(url, json={"after": tasks[0]}).status_code == 400
+        assert client.post(url, json={"after": "unknown"}).status_code == 400
+        assert client.post(f"/api/groups/{group_id}/tasks/unknown/move",
+                           json={"after": None}).status_code == 404
+
+    def test_keys(self):
+        "test that keys between neighbours sort between them"
+        keys = evenly_spaced_keys(100)
+        assert keys == sorted(keys) and len(set(keys)) == 100
+        assert keys[0] < key_between(keys[0], keys[1]) < keys[1]
+        assert key_between(None, "1") < "1"
+        assert key_between("z", None) > "z"
+
+
+class TestTaskLabels:
+    "Test task labels and filtering by them"
+
+    TASKS = ({"title": "Crash", "labels": ["bug", "urgent", "customer-x"]},
+             {"title": "Typo", "labels": ["bug"]},
+             {"title": "Demo", "labels": ["urgent", "customer-x"]},
+             {"title": "Lunch", "labels": []})
+
+    def _titles(self, client, url):
+        return sorted(task["title"] for task in client.get(url).get_json())
+
+    def test_filter_all_and_any(self, client):
+        "test intersecting and joining label filters"
+        group_id, _ = _create_group_tasks(client, "Labels", *self.TASKS)
+        url = f"/api/groups/{group_id}/tasks/"
+        assert self._titles(client, url + "?labels=urgent,customer-x") == ["Crash", "Demo"]
+        assert self._titles(client, url + "?labels=bug,urgent") == ["Crash"]
+        assert self._titles(client, url + "?labels=bug,customer-x&match=any") == [
+            "Crash", "Demo", "Typo"]
+        assert self._titles(client, url + "?labels=bug,unknown") == []
+        assert self._titles(client, url + "?labels=bug,unknown&match=any") == ["Crash", "Typo"]
+        assert self._titles(client, url + "?labels=urgent,%20urgent") == ["Crash", "Demo"]
+        assert self._titles(client, url + "?labels=,") == ["Crash", "Demo", "Lunch", "Typo"]
+        assert client.get(url + "?labels=bug&match=some").status_code == 400
+        assert client.get("/api/groups/999/tasks/?labels=bug").status_code == 404
+
+    def test_labels_in_responses_and_counts(self, client):
+        "test label names on tasks and the precomputed counts"
+        group_id, tasks = _create_group_tasks(client, "Labels", *self.TASKS)
+        task = client.get(f"/api/groups/{group_id}/tasks/{tasks['Crash']}/").get_json()
+        assert sorted(task["labels"]) == ["bug", "customer-x", "urgent"]
+        counts = {label["name"]: label["task_count"]
+                  for label in client.get(f"/api/groups/{group_id}/labels/").get_json()}
+        assert counts == {"bug": 2, "urgent": 2, "customer-x": 2}
+
+        client.put(f"/api/groups/{group_id}/tasks/{tasks['Crash']}/",
+                   json={"labels": ["bug", "regression"]})
+        client.delete(f"/api/groups/{group_id}/tasks/{tasks['Typo']}/")
+        counts = {label["name"]: label["task_count"]
+                  for label in client.get(f"/api/groups/{group_id}/labels/").get_json()}
+        assert counts == {"bug": 1, "urgent": 1, "customer-x": 1, "regression": 1}
+        task = client.get(f"/api/groups/{group_id}/tasks/{tasks['Crash']}/").get_json()
+        assert sorted(task["labels"]) == ["bug", "regression"]
+
+    def test_invalid_labels(self, client):
+        "test labels that are not a list of names"
+        task = {"title": "Bad", "description": "Task", "status": 0,
+                "deadline": "2025-03-03T10:00:00", "labels": "bug"}
+        assert client.post("/api/groups/1/tasks/", json=task).status_code == 400
+        task["labels"] = [""]
+        assert client.post("/api/groups/1/tasks/", json=task).status_code == 400
+
+
+class TestTaskDependencies:
+    "Test subtasks and blocking dependencies"
+
+    def _set_parent(self, client, group_id, tasks, child, parent):
+        return client.put(f"/api/groups/{group_id}/tasks/{tasks[child]}/",
+                          json={"parent": tasks[parent] if parent else None})
+
+    def test_subtree(self, client):
+        "test fetching a subtree nested and flat"
+        group_id, tasks = _create_group_tasks(client, "Tree",
+                                              "Release", "Build", "Test", "Unit", "Docs")
+        for child, parent in (("Build", "Release"), ("Test", "Release"), ("Unit", "Test")):
+            assert self._set_parent(client, group_id, tasks, child, parent).status_code == 200
+        url = f"/api/groups/{group_id}/tasks/{tasks['Release']}/"
+
+        rows = client.get(url + "subtasks/").get_json()
+        assert [(row["title"], row["depth"]) for row in rows] == [
+            ("Build", 1), ("Test", 1), ("Unit", 2)]
+        assert "parent_task" not in rows[2]
+        assert client.get(url + "subtasks/?fields=title").get_json()[0] == {
+            "unique_task": tasks["Build"], "title": "Build", "depth": 1}
+        rows = client.get(url + "subtasks/?fields=title,parent_task").get_json()
+        assert rows[2]["parent_task"] == tasks["Test"]
+
+        task = client.get(url + "?include=subtasks").get_json()
+        assert [sub["title"] for sub in task["subtasks"]] == ["Build", "Test"]
+        assert [sub["title"] for sub in task["subtasks"][1]["subtasks"]] == ["Unit"]
+        assert task["subtasks"][0]["subtasks"] == []
+        assert "subtasks" not in client.get(url).get_json()
+        assert client.get(url + "?include=owner").status_code == 400
+
+        # Deleting a task makes its subtasks top level tasks
+        client.delete(f"/api/groups/{group_id}/tasks/{tasks['Test']}/")
+        unit = client.get(f"/api/groups/{group_id}/tasks/{tasks['Unit']}/").get_json()
+        assert unit["parent_task"] is None
+
+    def test_parent_cycles(self, client):
+        "test refusing parents that would make a task its own subtask"
+        group_id, tasks = _create_group_tasks(client, "Tree", "A", "B", "C")
+        self._set_parent(client, group_id, tasks, "B", "A")
+        self._set_parent(client, group_id, tasks, "C", "B")
+        assert self._set_parent(client, group_id, tasks, "A", "C").status_code == 400
+        assert self._set_parent(client, group_id, tasks, "A", "A").status_code == 400
+        assert self._set_parent(client, group_id, tasks, "C", None).status_code == 200
+        assert self._set_parent(client, group_id, tasks, "A", "C").status_code == 200
+
+        response = client.post(f"/api/groups/{group_id}/tasks/",
+                               json={"title": "D", "description": "Task", "status": 0,
+                                     "deadline": "2025-03-03T10:00:00", "parent": "unknown"})
+        assert response.status_code == 400
+
+    def test_blockers(self, client):
+        "test transitive blockers and dependency cycles"
+        group_id, tasks = _create_group_tasks(client, "Tree",
+                                              "Ship", "Build", "Fetch", "Lint", "Other")
+        url = f"/api/groups/{group_id}/tasks/"
+
+        def block(task, blocker):
+            return client.post(f"{url}{tasks[task]}/blockers/", json={"blocker": tasks[blocker]})
+
+        assert block("Ship", "Build").status_code == 201
+        assert block("Ship", "Lint").status_code == 201
+        assert block("Build", "Fetch").status_code == 201
+        assert block("Lint", "Fetch").status_code == 201
+        assert block("Ship", "Build").status_code == 400
+        assert block("Fetch", "Ship").status_code == 400
+        assert block("Fetch", "Fetch").status_code == 400
+
+        blockers = client.get(f"{url}{tasks['Ship']}/blockers/").get_json()
+        assert sorted(task["title"] for task in blockers) == ["Build", "Fetch", "Lint"]
+        assert client.get(f"{url}{tasks['Fetch']}/blockers/").get_json() == []
+
+        assert client.delete(f"{url}{tasks['Ship']}/blockers/{tasks['Build']}/").status_code == 204
+        assert client.delete(f"{url}{tasks['Ship']}/blockers/{tasks['Build']}/").status_code == 404
+        blockers = client.get(f"{url}{tasks['Ship']}/blockers/?fields=title").get_json()
+        assert sorted(task["title"] for task in blockers) == ["Fetch", "Lint"]
+
+        # Deleting a blocker removes its dependencies
+        client.delete(f"{url}{tasks['Fetch']}/")
+        blockers = client.get(f"{url}{tasks['Ship']}/blockers/").get_json()
+        assert [task["title"] for task in blockers] == ["Lint"]
+
+
+class TestTaskAssignees:
+    "Test task assignees and the workload of a user"
+
+    def _setup(self, client):
+        group_id, tasks = _create_group_tasks(
+            client, "Crew",
+            {"title": "Dishes", "description": "Chore", "deadline": "2099-01-02T10:00:00"},
+            {"title": "Laundry", "description": "Chore", "deadline": "2099-01-01T10:00:00"},
+            {"title": "Taxes", "description": "Chore", "deadline": "2020-01-01T10:00:00"})
+        users = {}
+        for name in ("Alice", "Bob"):
+            users[name] = client.post("/api/users/", json={
+                "name": name, "email": f"{name.lower()}@example.com", "password": "pw"
+            }).get_json()["unique_user"]
+        client.post(f"/api/groups/{group_id}/users/{users['Alice']}/", json={"role": "member"})
+        return group_id, users, tasks
+
+    def test_assign_and_unassign(self, client):
+        "test assigning tasks to members only"
+        group_id, users, tasks = self._setup(client)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Dishes']}/assignees/"
+        assert client.post(url, json={"user": users["Alice"]}).status_code == 201
+        assert client.post(url, json={"user": users["Alice"]}).status_code == 400
+        assert client.post(url, json={"user": users["Bob"]}).status_code == 400
+        assert client.post(url, json={}).status_code == 400
+        assert client.get(url).get_json() == [
+            {"unique_user": users["Alice"], "name": "Alice", "email": "alice@example.com"}]
+
+        assert client.delete(url + users["Alice"] + "/").status_code == 204
+        assert client.delete(url + users["Alice"] + "/").status_code == 404
+        assert client.get(url).get_json() == []
+
+    def test_workload(self, client):
+        "test the workload summary and the assigned task list"
+        group_id, users, tasks = self._setup(client)
+        for title in tasks:
+            client.post(f"/api/groups/{group_id}/tasks/{tasks[title]}/assignees/",
+                        json={"user": users["Alice"]})
+        workload = client.get(f"/api/users/{users['Alice']}/workload/").get_json()
+        assert workload == {"open": 3, "by_status": {"0": 3}, "overdue": 1,
+                            "next_deadline": "2099-01-01T10:00:00"}
+
+        # Status and deadline changes reach the assignments
+        client.put(f"/api/groups/{group_id}/tasks/{tasks['Laundry']}/", json={"status": 2})
+        client.put(f"/api/groups/{group_id}/tasks/{tasks['Taxes']}/",
+                   json={"deadline": "2099-06-01T10:00:00"})
+        workload = client.get(f"/api/users/{users['Alice']}/workload/").get_json()
+        assert workload == {"open": 3, "by_status": {"0": 2, "2": 1}, "overdue": 0,
+                            "next_deadline": "2099-01-01T10:00:00"}
+
+        rows = client.get(f"/api/users/{users['Alice']}/tasks/?assigned=1&fields=title").get_json()
+        assert [row["title"] for row in rows] == ["Laundry", "Dishes", "Taxes"]
+        assert client.get(f"/api/users/{users['Bob']}/workload/").get_json()["open"] == 0
+        assert client.get("/api/users/unknown/workload/").status_code == 404
+
+        # Leaving the group drops the assignments
+        client.delete(f"/api/groups/{group_id}/users/{users['Alice']}/")
+        assert client.get(f"/api/users/{users['Alice']}/workload/").get_json()["open"] == 0
+
+    def test_deadline_reminders(self, client):
+        "test reminders going to the assignees of tasks due soon"
+        group_id, users, _ = self._setup(client)
+        soon = (datetime.now() + timedelta(days=1)).replace(microsecond=0)
+        for title in ("Soon", "Unassigned"):
+            unique_task = client.post(f"/api/groups/{group_id}/tasks/", json={
+                "title": title, "description": "Chore", "status": 0,
+                "deadline": soon.isoformat()
+            }).get_json()["unique_task"]
+            if title == "Soon":
+                client.post(f"/api/groups/{group_id}/tasks/{unique_task}/assignees/",
+                            json={"user": users["Alice"]})
+        with client.application.app_context():
+            reminders = sorted(due_reminders(datetime.now()))
+        assert reminders == sorted([("alice@example.com", "Soon", soon),
+                                    (DEFAULT_RECIPIENT, "Unassigned", soon)])
+
+
+class TestRecurringTasks:
+    "Test recurring tasks and their lazily computed occurrences"
+
+    SERIES = {"title": "Bins", "description": "Take the bins out",
+              "deadline": "2025-01-06T09:00:00", "labels": ["home"]}
+
+    def _occurrences(self, client, group_id, start="2025-01-01", end="2025-02-01"):
+        return client.get(f"/api/groups/{group_id}/tasks/occurrences?from={start}&to={end}"
+                          ).get_json()
+
+    def test_rules(self):
+        "test expanding rules for a window"
+        start = datetime(2025, 1, 31, 9)
+        monthly = list(occurrences(start, {"freq": "monthly", "interval": 1},
+                                   datetime(2025, 1, 1), datetime(2025, 5, 1)))
+        assert [when.date().isoformat() for when in monthly] == [
+            "2025-01-31", "2025-02-28", "2025-03-31", "2025-04-30"]
+        daily = {"freq": "daily", "interval": 3, "count": 5}
+        assert len(list(occurrences(start, daily, start, datetime(2026, 1, 1)))) == 5
+        weekly = {"freq": "weekly", "interval": 2, "until": "2125-01-01T00:00:00"}
+        far = list(occurrences(start, weekly, datetime(2124, 12, 1), datetime(2125, 6, 1)))
+        assert len(far) == 2 and all((when - start).days % 14 == 0 for when in far)
+        skipped = dict(weekly, exdates=["2025-02-14"])
+        assert [when.day for when in occurrences(start, skipped, start, datetime(2025, 3, 1))] == [
+            31, 28]
+
+    def test_virtual_occurrences(self, client):
+        "test reading occurrences that are not stored"
+        group_id, tasks = _create_group_tasks(
+            client, "Chores", dict(self.SERIES, recurrence={"freq": "weekly", "count": 10}))
+        series = tasks["Bins"]
+        rows = self._occurrences(client, group_id)
+        assert [row["unique_task"] for row in rows] == [
+            f"{series}@2025-01-{day:02}" for day in (6, 13, 20, 27)]
+        assert all(row["virtual"] and row["series"] == series for row in rows)
+
+        task = client.get(f"/api/groups/{group_id}/tasks/{series}@2025-01-13/").get_json()
+        assert task["deadline"] == "2025-01-13T09:00:00"
+        assert task["series"] == series and task["recurrence"] is None
+        assert client.get(f"/api/groups/{group_id}/tasks/{series}@2025-01-14/").status_code == 404
+        assert client.get(f"/api/groups/{group_id}/tasks/{series}@2025-03-17/").status_code == 404
+        assert client.get(f"/api/groups/{group_id}/tasks/occurrences?from=2025-01-01&to=2026-06-01"
+                          ).status_code == 400
+
+        # Only the series is stored
+        titles = [task["title"] for task in client.get(f"/api/groups/{group_id}/tasks/").get_json()]
+        assert titles == ["Bins"]
+
+    def test_materialise_and_skip(self, client):
+        "test editing and deleting single occurrences"
+        group_id, tasks = _create_group_tasks(
+            client, "Chores", dict(self.SERIES, recurrence={"freq": "weekly"}))
+        series = tasks["Bins"]
+        url = f"/api/groups/{group_id}/tasks/"
+        assert client.put(f"{url}{series}@2025-01-13/", json={"status": 2}).status_code == 200
+        task = client.get(f"{url}{series}@2025-01-13/").get_json()
+        assert task["status"] == 2 and task["series"] == series and task["labels"] == ["home"]
+        assert client.put(f"{url}{series}@2025-01-13/",
+                          json={"recurrence": {"freq": "daily"}}).status_code == 400
+
+        rows = self._occurrences(client, group_id)
+        assert [(row["unique_task"][-10:], row["status"], row["virtual"]) for row in rows] == [
+            ("2025-01-06", 0, True), ("2025-01-13", 2, False),
+            ("2025-01-20", 0, True), ("2025-01-27", 0, True)]
+
+        assert client.delete(f"{url}{series}@2025-01-20/").status_code == 204
+        assert client.delete(f"{url}{series}@2025-01-13/").status_code == 204
+        rows = self._occurrences(client, group_id)
+        assert [row["unique_task"][-10:] for row in rows] == ["2025-01-06", "2025-01-27"]
+
+        # Changing the rule keeps the deleted occurrences deleted
+        client.put(f"{url}{series}/", json={"recurrence": {"freq": "weekly", "count": 3}})
+        rows = self._occurrences(client, group_id)
+        assert [row["unique_task"][-10:] for row in rows] == ["2025-01-06"]
+
+    def test_delete_series(self, client):
+        "test stored occurrences outliving their series"
+        group_id, tasks = _create_group_tasks(
+            client, "Chores", dict(self.SERIES, recurrence={"freq": "daily", "interval": 2}))
+        series = tasks["Bins"]
+        url = f"/api/groups/{group_id}/tasks/"
+        client.put(f"{url}{series}@2025-01-08/", json={"description": "Glass too"})
+        client.put(f"{url}{series}@2025-01-10/", json={"description": "Paper too"})
+        assert client.delete(f"{url}{series}/").status_code == 204
+        rows = self._occurrences(client, group_id)
+        assert [(row["description"], row["series"]) for row in rows] == [
+            ("Glass too", None), ("Paper too", None)]
+
+    def test_invalid_rules(self, client):
+        "test rejecting invalid recurrence rules"
+        for rule in ({"freq": "hourly"}, {"freq": "daily", "interval": 0},
+                     {"freq": "daily", "count": "3"}, {"freq": "daily", "until": "soon"},
+                     {"freq": "daily", "byday": "MO"}, "weekly"):
+            response = client.post("/api/groups/1/tasks/", json={
+                "title": "Bad", "description": "Rule", "status": 0,
+                "deadline": "2025-01-06T09:00:00", "recurrence": rule})
+            assert response.status_code == 400
+
+
+class TestTaskHistory:
+    "Test the revision history of tasks"
+
+    TASK = {"title": "Report", "description": "Draft", "labels": ["work"]}
+
+    def test_deltas(self, client):
+        "test storing only the changed fields"
+        group_id, tasks = _create_group_tasks(client, "Audit", self.TASK)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Report']}/"
+        client.put(url, json={"title": "Annual report"})
+        client.put(url, json={"title": "Annual report", "description": "Final"})
+        client.put(url, json={"status": 0, "labels": ["work"]})
+        client.put(url, json={"labels": ["urgent", "work"], "deadline": "2025-03-04T10:00:00"})
+
+        history = client.get(url + "history").get_json()
+        assert history["has_more"] is False
+        assert [(rev["revision"], rev["changes"]) for rev in history["revisions"]] == [
+            (4, {"labels": ["urgent", "work"], "deadline": "2025-03-04T10:00:00"}),
+            (3, {"description": "Final"}),
+            (2, {"title": "Annual report"}),
+            (1, {"title": "Report", "description": "Draft", "status": 0,
+                 "deadline": "2025-03-03T10:00:00", "labels": ["work"], "parent": None,
+                 "recurrence": None})]
+
+        page = client.get(url + "history?limit=2").get_json()
+        assert [rev["revision"] for rev in page["revisions"]] == [4, 3] and page["has_more"]
+        page = client.get(url + "history?limit=2&before=3").get_json()
+        assert [rev["revision"] for rev in page["revisions"]] == [2, 1]
+        assert not page["has_more"]
+
+        state = client.get(url + "history/3").get_json()
+        assert state["revision"] == 3
+        assert state["task"]["title"] == "Annual report"
+        assert state["task"]["description"] == "Final"
+        assert state["task"]["labels"] == ["work"]
+        assert client.get(url + "history/5").status_code == 404
+        assert client.get(url + "history?before=x").status_code == 400
+
+    def test_snapshots(self, client):
+        "test rebuilding old revisions from periodic snapshots"
+        group_id, tasks = _create_group_tasks(client, "Audit", self.TASK)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Report']}/"
+        for number in range(2, 26):
+            client.put(url, json={"description": f"Version {number}"})
+        with client.application.app_context():
+            snapshots = [revision for revision, in db.session.execute(
+                db.select(TaskRevision.revision).where(TaskRevision.snapshot.is_not(None)))]
+        assert snapshots == [21]
+        for revision in (1, 20, 21, 25):
+            state = client.get(url + f"history/{revision}").get_json()
+            expected = "Draft" if revision == 1 else f"Version {revision}"
+            assert state["task"]["description"] == expected
+            assert state["task"]["title"] == "Report"
+
+    def test_task_without_history(self, client):
+        "test tasks created before the history get their state as revision 1"
+        group_id, tasks = _create_group_tasks(client, "Audit", self.TASK)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Report']}/"
+        with client.application.app_context():
+            db.session.execute(db.delete(TaskRevision))
+            db.session.commit()
+        client.put(url, json={"status": 2})
+        history = client.get(url + "history").get_json()["revisions"]
+        assert [rev["revision"] for rev in history] == [2, 1]
+        assert history[0]["changes"] == {"status": 2}
+        assert history[1]["changes"]["status"] == 0
+
+    def test_changes_outside_updates(self, client):
+        "test revisions for a deleted parent and a skipped occurrence"
+        group_id, tasks = _create_group_tasks(client, "Audit", self.TASK)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Report']}/"
+        group_url = url.rsplit("/tasks/", 1)[0] + "/tasks/"
+        parent = client.post(group_url, json={
+            "title": "Parent", "description": "Parent", "status": 0,
+            "deadline": "2025-03-03T10:00:00"}).get_json()["unique_task"]
+        client.put(url, json={"parent": parent})
+        client.delete(f"{group_url}{parent}/")
+        history = client.get(url + "history").get_json()["revisions"]
+        assert [rev["changes"] for rev in history[:2]] == [{"parent": None}, {"parent": parent}]
+        state = client.get(url + f"history/{history[0]['revision']}").get_json()["task"]
+        assert state["parent"] is None
+
+        series = client.post(group_url, json={
+            "title": "Standup", "description": "Daily", "status": 0,
+            "deadline": "2025-01-06T09:00:00", "recurrence": {"freq": "daily"}
+        }).get_json()["unique_task"]
+        client.delete(f"{group_url}{series}@2025-01-07/")
+        history = client.get(f"{group_url}{series}/history").get_json()["revisions"]
+        assert history[0]["revision"] == 2
+        assert history[0]["changes"]["recurrence"]["exdates"] == ["2025-01-07"]
+
+    def test_history_catches_up(self, client):
+        "test that a change made outside the history is recorded with the next update"
+        group_id, tasks = _create_group_tasks(client, "Audit", self.TASK)
+        url = f"/api/groups/{group_id}/tasks/{tasks['Report']}/"
+        with client.application.app_context():
+            db.session.execute(db.update(Task).where(Task.title == "Report")
+                               .values(description="Edited directly"))
+            db.session.commit()
+        client.put(url, json={"status": 2})
+        history = client.get(url + "history").get_json()["revisions"]
+        assert history[0]["changes"] == {"description": "Edited directly", "status": 2}
+
+
+class TestTaskArchive:
+    "Test archiving completed tasks and reading them back"
+
+    def _setup(self, client):
+        group_id, tasks = _create_group_tasks(client, "Archive", *(
+            {"title": title, "description": "Quarterly numbers", "status": status,
+             "labels": labels}
+            for title, status, labels in (("Old report", 1, ["work"]), ("Old chore", 1, ["home"]),
+                                          ("New report", 1, ["work"]), ("Open report", 0, ["work"]))
+        ))
+        client.put(f"/api/groups/{group_id}/tasks/{tasks['Open report']}/",
+                   json={"parent": tasks["Old report"]})
+        client.post(f"/api/groups/{group_id}/tasks/{tasks['Open report']}/blockers/",
+                    json={"blocker": tasks["Old chore"]})
+        with client.application.app_context():
+            db.session.execute(
+                db.update(Task).where(Task.title.in_(["Old report", "Old chore"]))
+                .values(updated_at=datetime.now() - timedelta(days=100))
+            )
+            db.session.commit()
+            assert archive_tasks(datetime.now() - timedelta(days=90), chunk_size=1) == 2
+        return group_id, tasks
+
+    def test_archive_and_read(self, client):
+        "test moving old completed tasks out and reading them back"
+        group_id, tasks = self._setup(client)
+        url = f"/api/groups/{group_id}/tasks/"
+        titles = [task["title"] for task in client.get(url).get_json()]
+        assert titles == ["New report", "Open report"]
+
+        rows = client.get(url + "?include_archived=1&fields=title,labels").get_json()
+        assert [(row["title"], row["labels"], row["archived"]) for row in rows] == [
+            ("New report", ["work"], False), ("Open report", ["work"], False),
+            ("Old report", ["work"], True), ("Old chore", ["home"], True)]
+        rows = client.get(url + "?include_archived=1&labels=work&fields=title").get_json()
+        assert [row["title"] for row in rows] == ["New report", "Open report", "Old report"]
+        rows = client.get(url + "?include_archived=1&labels=home,work&match=any").get_json()
+        assert len(rows) == 4
+
+        task = client.get(f"{url}{tasks['Old report']}/").get_json()
+        assert task["title"] == "Old report" and task["archived"] is True
+        assert client.put(f"{url}{tasks['Old report']}/", json={"title": "X"}).status_code == 404
+
+    def test_side_tables_stay_consistent(self, client):
+        "test counts, links and the search index after archiving"
+        group_id, tasks = self._setup(client)
+        url = f"/api/groups/{group_id}/tasks/"
+        stats = client.get(f"/api/groups/{group_id}/stats/").get_json()
+        assert stats["total"] == 2
+        counts = {label["name"]: label["task_count"]
+                  for label in client.get(f"/api/groups/{group_id}/labels/").get_json()}
+        assert counts == {"work": 2, "home": 0}
+        open_task = client.get(f"{url}{tasks['Open report']}/").get_json()
+        assert open_task["parent_task"] is None
+        assert client.get(f"{url}{tasks['Open report']}/blockers/").get_json() == []
+        hits = client.get(f"{url}search?q=quarterly").get_json()
+        assert sorted(hit["title"] for hit in hits) == ["New report", "Open report"]
+
+        runner = client.application.test_cli_runner()
+        result = runner.invoke(args=["archive-tasks", "--older-than", "90"])
+        assert "Archived 0 tasks" in result.output
+
+        client.delete(f"/api/groups/{group_id}/")
+        with client.application.app_context():
+            assert db.session.execute(db.select(db.func.count(TaskArchive.id))).scalar() == 0
+
+    def test_ids_are_not_reused(self, client):
+        "test archiving the newest task, creating another one and archiving again"
+        group_id = client.post("/api/groups/", json={"name": "Archive"}).get_json()["group_id"]
+        url = f"/api/groups/{group_id}/tasks/"
+        for title in ("First done", "Second done"):
+            client.post(url, json={"title": title, "description": "Done", "status": 1,
+                                   "deadline": "2025-03-03T10:00:00"})
+            with client.application.app_context():
+                assert archive_tasks(datetime.now() + timedelta(days=1)) == 1
+        with client.application.app_context():
+            ids = db.session.execute(db.select(TaskArchive.id)).scalars().all()
+        assert len(set(ids)) == 2
+        rows = client.get(url + "?include_archived=1&fields=title").get_json()
+        assert [row["title"] for row in rows] == ["First done", "Second done"]
@@ -378,7 +378,8 @@ def test_task_serialize_deserialize(db_handle):
     assert task.serialize() == serialized_task
 
     # Deserialize the task
-    deserialized_task = Task.deserialize(serialized_task)
+    deserialized_task = Task()
+    deserialized_task.deserialize(serialized_task)
     assert deserialized_task.title == task.title
     assert deserialized_task.description == task.description
     assert deserialized_task.group_id == task.group_id